@@ -0,0 +1,500 @@
+"""
+价格与状态告警
+每次快照刷新后与上一份完整快照比较，只对发生变化的市场查找相关规则：
+价格规则按代币ID索引，状态规则按 condition_id 索引，新市场规则按分类索引，
+评估开销为 O(变化市场数 × 命中规则数)。触发的告警写入内存告警流，并通过
+后台队列推送到配置的Webhook
+"""
+
+import os
+import json
+import time
+import queue
+import logging
+import itertools
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from resilience import backoff_delays
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+RULE_TYPES = ("price_cross", "price_move", "status_change", "new_market")
+CROSS_DIRECTIONS = ("above", "below", "any")
+STATUS_FIELDS = ("active", "closed", "accepting_orders")
+
+_rule_counter = itertools.count(1)
+
+
+def _positive_number(data: Dict, key: str) -> float:
+    value = data.get(key)
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+        raise ValueError(f"{key} 必须是正数")
+    return float(value)
+
+
+def _required_string(data: Dict, key: str) -> str:
+    value = data.get(key)
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"{key} 不能为空")
+    return value
+
+
+def normalize_rule(data: Dict) -> Dict:
+    """
+    校验并规范化告警规则
+
+    规则类型:
+        price_cross: 代币价格穿越 level（token_id, level, direction=above/below/any）
+        price_move: 代币价格在 window 秒内变动超过 percent%（token_id, percent, window）
+        status_change: 市场状态字段变化（condition_id, field=active/closed/accepting_orders，省略表示任意字段）
+        new_market: 出现新市场（category，省略表示任意分类）
+
+    Raises:
+        ValueError: 规则无效
+    """
+    if not isinstance(data, dict):
+        raise ValueError("规则必须是JSON对象")
+
+    rule_type = data.get("type")
+    if rule_type not in RULE_TYPES:
+        raise ValueError(f"type 必须是 {', '.join(RULE_TYPES)} 之一")
+
+    rule = {
+        "id": str(data.get("id") or f"rule-{int(time.time())}-{next(_rule_counter)}"),
+        "type": rule_type,
+        "note": data.get("note"),
+        "created_at": data.get("created_at") or datetime.utcnow().isoformat()
+    }
+
+    if rule_type == "price_cross":
+        direction = data.get("direction", "any")
+        if direction not in CROSS_DIRECTIONS:
+            raise ValueError(f"direction 必须是 {', '.join(CROSS_DIRECTIONS)} 之一")
+        rule.update(token_id=_required_string(data, "token_id"), level=_positive_number(data, "level"),
+                    direction=direction)
+    elif rule_type == "price_move":
+        rule.update(token_id=_required_string(data, "token_id"), percent=_positive_number(data, "percent"),
+                    window=_positive_number(data, "window"))
+    elif rule_type == "status_change":
+        field = data.get("field")
+        if field is not None and field not in STATUS_FIELDS:
+            raise ValueError(f"field 必须是 {', '.join(STATUS_FIELDS)} 之一")
+        rule.update(condition_id=_required_string(data, "condition_id"), field=field)
+    else:
+        category = data.get("category")
+        if category is not None and (not isinstance(category, str) or not category):
+            raise ValueError("category 必须是非空字符串")
+        rule.update(category=category.lower() if category else None)
+
+    return rule
+
+
+def _market_state(market: Dict) -> Tuple[tuple, tuple]:
+    """告警关心的原始市场字段：((代币ID, 价格), ...) 和状态字段"""
+    prices = []
+    for token in market.get("tokens") or ():
+        try:
+            price = float(token.get("price"))
+        except (TypeError, ValueError):
+            price = None
+        prices.append((token.get("token_id"), price))
+    return tuple(prices), tuple(market.get(field) for field in STATUS_FIELDS)
+
+
+class WebhookDispatcher:
+    """
+    Webhook推送队列
+
+    告警评估只负责入队，由后台线程逐条POST到配置的地址（失败时指数退避重试）；
+    队列已满时丢弃新告警，不阻塞快照刷新。
+    """
+
+    def __init__(self, url: str, max_queue: int = 1000, timeout: float = 5, max_retries: int = 3):
+        """
+        Args:
+            url: Webhook地址
+            max_queue: 队列容量
+            timeout: 单次推送超时（秒）
+            max_retries: 失败后的重试次数
+        """
+        self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.last_error = None
+        self._queue: "queue.Queue[Dict]" = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, alert: Dict):
+        """告警入队（首次调用时启动后台线程）"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="alert-webhook", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(alert)
+        except queue.Full:
+            self.dropped += 1
+            metrics.ALERT_WEBHOOK_DELIVERIES.inc("dropped")
+
+    def _run(self):
+        while True:
+            alert = self._queue.get()
+            try:
+                self._deliver(alert)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, alert: Dict):
+        import requests
+
+        delays = backoff_delays(self.max_retries)
+        while True:
+            try:
+                response = requests.post(self.url, json=alert, timeout=self.timeout)
+                response.raise_for_status()
+                self.sent += 1
+                metrics.ALERT_WEBHOOK_DELIVERIES.inc("sent")
+                return
+            except Exception as e:
+                self.last_error = str(e)
+                delay = next(delays, None)
+                if delay is None:
+                    self.failed += 1
+                    metrics.ALERT_WEBHOOK_DELIVERIES.inc("failed")
+                    logger.warning(f"告警Webhook推送失败: {e}")
+                    return
+                time.sleep(delay)
+
+    def join(self):
+        """等待队列中的告警全部处理完"""
+        self._queue.join()
+
+    def stats(self) -> Dict:
+        return {
+            "url": self.url,
+            "queued": self._queue.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "last_error": self.last_error
+        }
+
+
+class AlertEngine:
+    """
+    告警引擎
+
+    以最近一份完整快照为基线记录每个市场的价格和状态，新快照到达时只对与基线不同的市场评估规则。
+    第一份完整快照只建立基线，不触发告警；按数量截断的不完整快照不参与比较。
+    """
+
+    def __init__(self, rules_path: str = None, webhook_url: str = None, feed_size: int = 500,
+                 category_of: Callable[[Dict], str] = None):
+        """
+        Args:
+            rules_path: 规则JSON文件路径（None表示规则只保存在内存中）
+            webhook_url: 告警推送地址（None表示不推送）
+            feed_size: 内存告警流保留的条数
+            category_of: 从原始市场数据推断分类的函数（new_market规则使用）
+        """
+        self.rules_path = rules_path
+        self.category_of = category_of or (lambda market: market.get("category") or "other")
+        self.dispatcher = WebhookDispatcher(webhook_url) if webhook_url else None
+        self.rules: Dict[str, Dict] = {}
+        self.feed: Deque[Dict] = deque(maxlen=feed_size)
+        self.evaluations = 0
+        self.changed_markets = 0
+        self.last_evaluated_at = None
+        self._by_token: Dict[str, List[Dict]] = {}
+        self._by_condition: Dict[str, List[Dict]] = {}
+        self._by_category: Dict[Optional[str], List[Dict]] = {}
+        self._baseline: Optional[Dict[str, Tuple[tuple, tuple]]] = None
+        self._history: Dict[str, Deque[Tuple[float, float]]] = {}
+        self._triggered_moves = set()
+        self._alert_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+        if rules_path and os.path.exists(rules_path):
+            self._load_rules()
+
+    def _load_rules(self):
+        try:
+            with open(self.rules_path, "r", encoding="utf-8") as f:
+                for data in json.load(f):
+                    rule = normalize_rule(data)
+                    self.rules[rule["id"]] = rule
+        except (OSError, ValueError) as e:
+            logger.warning(f"告警规则文件读取失败: {e}")
+        self._rebuild_indexes()
+
+    def _save_rules(self):
+        """写入规则文件（临时文件 + 原子替换）"""
+        if not self.rules_path:
+            return
+        directory = os.path.dirname(self.rules_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.rules_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(list(self.rules.values()), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.rules_path)
+
+    def _rebuild_indexes(self):
+        by_token, by_condition, by_category = {}, {}, {}
+        for rule in self.rules.values():
+            if rule["type"] in ("price_cross", "price_move"):
+                by_token.setdefault(rule["token_id"], []).append(rule)
+            elif rule["type"] == "status_change":
+                by_condition.setdefault(rule["condition_id"], []).append(rule)
+            else:
+                by_category.setdefault(rule["category"], []).append(rule)
+        self._by_token, self._by_condition, self._by_category = by_token, by_condition, by_category
+        history = {}
+        for token_id, rules in by_token.items():
+            if any(rule["type"] == "price_move" for rule in rules):
+                history[token_id] = self._history.get(token_id) or self._seed_history(token_id)
+        self._history = history
+
+    def _seed_history(self, token_id: str) -> Deque[Tuple[float, float]]:
+        """新增变动规则时以基线中的当前价格作为起点"""
+        history = deque()
+        for prices, _ in (self._baseline or {}).values():
+            for candidate, price in prices:
+                if candidate == token_id and price is not None:
+                    history.append((time.time(), price))
+                    return history
+        return history
+
+    def add_rule(self, data: Dict) -> Dict:
+        """
+        添加（或按ID替换）规则并写入规则文件
+
+        Raises:
+            ValueError: 规则无效
+        """
+        rule = normalize_rule(data)
+        with self._lock:
+            self.rules[rule["id"]] = rule
+            self._triggered_moves.discard(rule["id"])
+            self._rebuild_indexes()
+            self._save_rules()
+        return rule
+
+    def remove_rule(self, rule_id: str) -> bool:
+        """删除规则，返回规则是否存在"""
+        with self._lock:
+            if self.rules.pop(rule_id, None) is None:
+                return False
+            self._triggered_moves.discard(rule_id)
+            self._rebuild_indexes()
+            self._save_rules()
+        return True
+
+    def list_rules(self) -> List[Dict]:
+        return list(self.rules.values())
+
+    def on_snapshot(self, endpoint: str, snapshot):
+        """快照刷新回调（注册到获取器的 snapshot_listeners）"""
+        if endpoint != "markets" or not snapshot.complete:
+            return
+        # 分层刷新只替换部分市场时只评估这些市场；时间取内容更新时刻，而不是完整列表的拉取时间
+        if snapshot.changes is not None and self._baseline is not None:
+            self.evaluate(list(snapshot.changes.values()), now=snapshot.updated_at, partial=True)
+        else:
+            self.evaluate(snapshot.markets, now=snapshot.updated_at)
+
+    def evaluate(self, markets: List[Dict], now: float = None, partial: bool = False) -> List[Dict]:
+        """
+        与基线比较并评估规则
+
+        Args:
+            markets: 市场列表
+            now: 价格记录时间（None表示当前时间）
+            partial: markets 只是部分市场（不把未出现的市场移出基线）
+
+        Returns:
+            本次触发的告警列表
+        """
+        now = now if now is not None else time.time()
+        alerts = []
+        with self._lock:
+            first = self._baseline is None
+            baseline = {} if first else self._baseline
+            seen = set()
+            changed = 0
+
+            for market in markets:
+                condition_id = market.get("condition_id")
+                seen.add(condition_id)
+                state = _market_state(market)
+                previous = baseline.get(condition_id)
+                if previous == state:
+                    continue
+                baseline[condition_id] = state
+                changed += 1
+
+                if first:
+                    self._record_prices(state[0], now)
+                elif previous is None:
+                    self._record_prices(state[0], now)
+                    alerts.extend(self._check_new_market(market))
+                else:
+                    alerts.extend(self._check_prices(market, previous[0], state[0], now))
+                    alerts.extend(self._check_status(market, previous[1], state[1]))
+
+            # 已下线市场移出基线（重新上线时按新市场处理）
+            if not partial and len(baseline) > len(seen):
+                for condition_id in [cid for cid in baseline if cid not in seen]:
+                    del baseline[condition_id]
+
+            self._baseline = baseline
+            self.evaluations += 1
+            self.changed_markets = 0 if first else changed
+            self.last_evaluated_at = now
+
+            for alert in alerts:
+                alert["id"] = next(self._alert_ids)
+                self.feed.append(alert)
+
+        for alert in alerts:
+            metrics.ALERTS_TRIGGERED.inc(alert["type"])
+            if self.dispatcher is not None:
+                self.dispatcher.submit(alert)
+        return alerts
+
+    def _record_prices(self, prices: tuple, now: float):
+        for token_id, price in prices:
+            history = self._history.get(token_id)
+            if history is not None and price is not None:
+                history.append((now, price))
+
+    def _alert(self, rule: Dict, market: Dict, message: str, token_id: str = None,
+               previous=None, current=None) -> Dict:
+        return {
+            "rule_id": rule["id"],
+            "type": rule["type"],
+            "condition_id": market.get("condition_id"),
+            "token_id": token_id,
+            "question": market.get("question"),
+            "message": message,
+            "previous": previous,
+            "current": current,
+            "note": rule.get("note"),
+            "triggered_at": datetime.utcnow().isoformat()
+        }
+
+    def _check_prices(self, market: Dict, old_prices: tuple, new_prices: tuple, now: float) -> List[Dict]:
+        alerts = []
+        old_by_token = dict(old_prices)
+        for token_id, price in new_prices:
+            rules = self._by_token.get(token_id)
+            if not rules or price is None:
+                continue
+            old = old_by_token.get(token_id)
+            history = self._history.get(token_id)
+            if history is not None and old != price:
+                history.append((now, price))
+
+            for rule in rules:
+                if rule["type"] == "price_cross":
+                    if old is None or old == price:
+                        continue
+                    level = rule["level"]
+                    crossed_up = old < level <= price
+                    crossed_down = old > level >= price
+                    if (crossed_up and rule["direction"] != "below") or (crossed_down and rule["direction"] != "above"):
+                        alerts.append(self._alert(
+                            rule, market, f"价格{'上穿' if crossed_up else '下穿'} {level:.4f}: {old:.4f} -> {price:.4f}",
+                            token_id=token_id, previous=old, current=price
+                        ))
+                else:
+                    alert = self._check_move(rule, market, token_id, history, price, now)
+                    if alert is not None:
+                        alerts.append(alert)
+        return alerts
+
+    def _check_move(self, rule: Dict, market: Dict, token_id: str, history: Deque[Tuple[float, float]],
+                    price: float, now: float) -> Optional[Dict]:
+        """窗口起点时的价格为参照，变动超过阈值时触发（回落到阈值以内后才会再次触发）"""
+        window_start = now - rule["window"]
+        # 只保留窗口起点之前的最后一个价格作为参照，更早的记录丢弃
+        max_window = max(r["window"] for r in self._by_token[token_id] if r["type"] == "price_move")
+        while len(history) > 1 and history[1][0] <= now - max_window:
+            history.popleft()
+
+        reference = None
+        for at, value in history:
+            if at > window_start and reference is not None:
+                break
+            reference = value
+        if not reference:
+            return None
+
+        change = (price - reference) / reference * 100
+        if abs(change) < rule["percent"]:
+            self._triggered_moves.discard(rule["id"])
+            return None
+        if rule["id"] in self._triggered_moves:
+            return None
+        self._triggered_moves.add(rule["id"])
+        return self._alert(
+            rule, market, f"{rule['window']:.0f} 秒内价格变动 {change:+.2f}%: {reference:.4f} -> {price:.4f}",
+            token_id=token_id, previous=reference, current=price
+        )
+
+    def _check_status(self, market: Dict, old_status: tuple, new_status: tuple) -> List[Dict]:
+        rules = self._by_condition.get(market.get("condition_id"))
+        if not rules or old_status == new_status:
+            return []
+        alerts = []
+        for rule in rules:
+            for field, old, new in zip(STATUS_FIELDS, old_status, new_status):
+                if old != new and rule["field"] in (None, field):
+                    alerts.append(self._alert(
+                        rule, market, f"{field}: {old} -> {new}",
+                        previous={field: old}, current={field: new}
+                    ))
+        return alerts
+
+    def _check_new_market(self, market: Dict) -> List[Dict]:
+        if not self._by_category:
+            return []
+        category = (self.category_of(market) or "other").lower()
+        rules = self._by_category.get(category, []) + self._by_category.get(None, [])
+        return [
+            self._alert(rule, market, f"新市场（{category}）: {market.get('question')}", current=category)
+            for rule in rules
+        ]
+
+    def alerts_since(self, since: int = 0, limit: int = 100) -> List[Dict]:
+        """告警流中ID大于 since 的告警（按时间顺序，最多 limit 条）"""
+        with self._lock:
+            alerts = [alert for alert in self.feed if alert["id"] > since]
+        return alerts[:limit]
+
+    def stats(self) -> Dict:
+        return {
+            "rules": len(self.rules),
+            "rules_path": self.rules_path,
+            "indexed_tokens": len(self._by_token),
+            "indexed_markets": len(self._by_condition),
+            "evaluations": self.evaluations,
+            "changed_markets": self.changed_markets,
+            "baseline_markets": len(self._baseline or ()),
+            "feed_size": len(self.feed),
+            "last_evaluated_at": (
+                datetime.utcfromtimestamp(self.last_evaluated_at).isoformat()
+                if self.last_evaluated_at else None
+            ),
+            "webhook": self.dispatcher.stats() if self.dispatcher else None
+        }
@@ -3,37 +3,227 @@ API路由定义
 提供RESTful API端点用于市场数据访问
 """
 
+import os
+import json
+import time
+import hmac
+import socket
+import hashlib
+import ipaddress
+import threading
 from datetime import datetime
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, g
 from flask import Flask
 from polymarket_markets import PolymarketMarketFetcher
+from facets import FACET_DIMENSIONS, STATUS_VALUES, END_DATE_VALUES
+from expiry import parse_duration
+from resilience import CircuitBreaker, UpstreamUnavailableError
+from snapshot import SnapshotRefresher
+from replication import SnapshotPublisher, SnapshotReplica
+from alerts import AlertEngine
+from scanner import MarketScanner, SCAN_KINDS
+from trades import TradeIngester
+from tiering import TieredRefresher
 from config import config as app_config
+import metrics
+import profiling
+import wire_formats
 
 # 创建API蓝图
 api_bp = Blueprint('api', __name__)
 
-# 全局市场获取器实例
+# 全局市场获取器、快照刷新器、快照复制（主节点发布器/副本同步器）、分层刷新调度器、成交记录拉取器、告警引擎和异常扫描器实例
 market_fetcher = None
+snapshot_refresher = None
+snapshot_publisher = None
+snapshot_replica = None
+alert_engine = None
+trade_ingester = None
+tiered_refresher = None
+market_scanner = MarketScanner()
+
+# 进程启动时间（用于存活探针）
+started_at = time.time()
+
+# 各客户端地址正在进行的复制长轮询数
+replication_polls = {}
+replication_polls_lock = threading.Lock()
 
 
 def get_market_fetcher():
-    """获取市场数据获取器实例"""
-    global market_fetcher
+    """获取市场数据获取器实例（首次调用时启动后台快照刷新，副本节点改为启动快照同步）"""
+    global market_fetcher, alert_engine, trade_ingester, tiered_refresher, snapshot_publisher, snapshot_replica
     if market_fetcher is None:
+        role = app_config.get("replication_role", "standalone")
+        if role == "replica" and not app_config.get("replication_primary_url"):
+            raise ValueError("副本节点需要设置 REPLICATION_PRIMARY_URL")
+
         market_fetcher = PolymarketMarketFetcher(
             api_url=app_config.get("clob_api_url"),
             timeout=app_config.get("request_timeout", 30),
-            max_retries=app_config.get("max_retries", 3)
+            max_retries=app_config.get("max_retries", 3),
+            hedge_delay=app_config.get("hedge_delay", 0),
+            archive_path=app_config.get("archive_path"),
+            breaker=CircuitBreaker(
+                failure_threshold=app_config.get("circuit_failure_threshold", 5),
+                reset_timeout=app_config.get("circuit_reset_timeout", 30)
+            )
+        )
+        alert_engine = AlertEngine(
+            rules_path=app_config.get("alert_rules_path"),
+            webhook_url=app_config.get("alert_webhook_url"),
+            feed_size=app_config.get("alert_feed_size", 500),
+            category_of=market_fetcher._extract_category
         )
+        market_fetcher.snapshot_listeners.append(market_scanner.on_snapshot)
+        tiered_refresher = TieredRefresher(market_fetcher)
+        if role == "replica":
+            # 副本节点只应用主节点发布的快照：不拉取市场列表和成交记录、不分层刷新，告警只在主节点评估和推送
+            market_fetcher.replica = True
+            snapshot_replica = SnapshotReplica(
+                market_fetcher,
+                app_config.get("replication_primary_url"),
+                wait=app_config.get("replication_wait", 25),
+                replica_id=app_config.get("replication_replica_id") or f"{socket.gethostname()}-{os.getpid()}",
+                token=app_config.get("replication_token")
+            )
+            snapshot_replica.start()
+        else:
+            market_fetcher.snapshot_listeners.append(alert_engine.on_snapshot)
+            if role == "primary":
+                snapshot_publisher = SnapshotPublisher(history=app_config.get("replication_history", 20))
+                market_fetcher.snapshot_listeners.append(snapshot_publisher.on_snapshot)
+            if app_config.get("tiered_refresh", False):
+                # 先注册，首次完整刷新完成后即可开始分层
+                market_fetcher.snapshot_listeners.append(tiered_refresher.on_snapshot)
+                tiered_refresher.start()
+            if app_config.get("snapshot_refresh_interval", 30) > 0:
+                get_snapshot_refresher().start()
+            # 成交记录不复制，只由非副本节点拉取，上游成交请求不随副本数量增加
+            trade_ingester = TradeIngester(
+                market_fetcher,
+                interval=app_config.get("trade_ingest_interval", 60),
+                max_markets=app_config.get("trade_ingest_max_markets", 200)
+            )
+            if trade_ingester.interval > 0:
+                trade_ingester.start()
     return market_fetcher
 
 
+def get_snapshot_refresher():
+    """获取后台快照刷新器实例"""
+    global snapshot_refresher
+    if snapshot_refresher is None:
+        snapshot_refresher = SnapshotRefresher(
+            get_market_fetcher(),
+            interval=app_config.get("snapshot_refresh_interval", 30),
+            path=app_config.get("snapshot_path")
+        )
+    return snapshot_refresher
+
+
+def get_alert_engine():
+    """获取告警引擎实例（随市场获取器一起创建）"""
+    get_market_fetcher()
+    return alert_engine
+
+
+def collect_runtime_metrics():
+    """导出指标前从内存状态更新快照、上游和熔断器仪表"""
+    if market_fetcher is None:
+        return
+    for endpoint, snapshot in list(market_fetcher.snapshots.items()):
+        metrics.SNAPSHOT_MARKETS.set(len(snapshot), endpoint)
+        metrics.SNAPSHOT_AGE_SECONDS.set(snapshot.age, endpoint)
+    for event, count in list(market_fetcher.upstream_stats.items()):
+        metrics.UPSTREAM_EVENTS.sync(count, event)
+    breaker = market_fetcher.breaker.stats()
+    for transition, count in breaker['transitions'].items():
+        metrics.CIRCUIT_TRANSITIONS.sync(count, transition)
+    if tiered_refresher is not None and tiered_refresher.running:
+        for tier, values in tiered_refresher.tier_stats().items():
+            metrics.TIER_MARKETS.set(values['markets'], tier)
+            metrics.TIER_STALENESS_SECONDS.set(values['max_staleness'] or 0, tier)
+    if market_fetcher.archive is not None:
+        metrics.ARCHIVED_MARKETS.set(len(market_fetcher.archive))
+    if snapshot_replica is not None:
+        metrics.REPLICATION_LAG_SECONDS.set(snapshot_replica.lag_seconds or 0)
+        metrics.REPLICATION_VERSIONS_BEHIND.set(snapshot_replica.stats()['versions_behind'])
+    metrics.CIRCUIT_STATE.set({'closed': 0, 'half_open': 0.5, 'open': 1}[breaker['state']])
+
+
+metrics.REGISTRY.register_collector(collect_runtime_metrics)
+
+
+def request_route():
+    """当前请求匹配的路由模板"""
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+@api_bp.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.profiling_trace = profiling.profiler.begin(request_route(), request.method)
+
+
+@api_bp.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, request_route(), request.method, response.status_code
+        )
+    trace = g.pop('profiling_trace', None)
+    if trace is not None:
+        profiling.profiler.finish(trace, response.status_code)
+    return response
+
+
+@api_bp.after_request
+def apply_etag(response):
+    """
+    为成功的GET响应设置弱ETag，与 If-None-Match 匹配时返回304（不发送响应体）
+
+    ETag 由响应体计算，计算前去掉标准响应结构中每次请求都不同的 timestamp，
+    内容未变化的轮询请求即可得到304。
+    """
+    if request.method != 'GET' or response.status_code != 200 or response.direct_passthrough:
+        return response
+    if request.endpoint == 'api.get_replication_changes':
+        # 长轮询响应总是新内容，完整快照时响应体很大，不计算ETag
+        return response
+    body = response.get_data()
+    timestamp = g.pop('response_timestamp', None)
+    if timestamp:
+        body = body.replace(timestamp.encode(), b'')
+    etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+    response.set_etag(etag, weak=True)
+    response.vary.add('Accept')
+    if request.if_none_match.contains_weak(etag):
+        response.status_code = 304
+        response.set_data(b'')
+    return response
+
+
+def snapshot_max_age():
+    """请求路径可直接复用的快照最大年龄"""
+    return app_config.get("snapshot_max_age", 60)
+
+
+def live_prices_requested():
+    """是否为本次请求补充实时价格（?live_prices=true/false，默认取配置）"""
+    default = app_config.get("price_enrichment", True)
+    return request.args.get('live_prices', default, type=lambda v: v.lower() == 'true')
+
+
 def create_response(success=True, data=None, message="操作成功", error=None):
     """创建标准API响应格式"""
     response = {
         'success': success,
         'timestamp': datetime.utcnow().isoformat()
     }
+    # 计算ETag时忽略时间戳
+    g.response_timestamp = response['timestamp']
 
     if success:
         response['data'] = data
@@ -44,30 +234,137 @@ def create_response(success=True, data=None, message="操作成功", error=None)
     return response
 
 
+def negotiate_response_format():
+    """
+    按 format 查询参数或 Accept 头协商市场列表的响应格式
+
+    Returns:
+        (格式, 错误响应)：格式无效或所需的可选依赖未安装时格式为None
+    """
+    try:
+        fmt = wire_formats.negotiate(request.accept_mimetypes, request.args.get('format'))
+    except ValueError as e:
+        return None, (jsonify(create_response(
+            success=False,
+            error={
+                'code': 'INVALID_FORMAT',
+                'message': str(e)
+            }
+        )), 400)
+
+    module = wire_formats.missing_dependency(fmt)
+    if module:
+        return None, (jsonify(create_response(
+            success=False,
+            error={
+                'code': 'FORMAT_UNAVAILABLE',
+                'message': f'服务端未安装{module}，{fmt}格式不可用（pip install {module}）'
+            }
+        )), 406)
+    return fmt, None
+
+
+def binary_response(fmt, frame, data, message):
+    """按协商的二进制格式返回一页市场（data 为市场列表以外的响应数据）"""
+    with profiling.stage('encode'):
+        body = wire_formats.encode(fmt, frame, create_response(success=True, data=data, message=message))
+    return Response(body, mimetype=wire_formats.MIMETYPES[fmt])
+
+
+def page_quotes(fetcher, markets):
+    """当前页活跃市场首个代币的实时报价（二进制格式按列合并）"""
+    token_ids = [
+        market['tokens'][0].get('token_id')
+        for market in markets
+        if market.get('active') and not market.get('closed') and market.get('tokens')
+    ]
+    with profiling.stage('enrich'):
+        return fetcher.price_enricher.fetch_quotes(token_ids) if token_ids else {}
+
+
+def upstream_unavailable_response(error):
+    """上游不可用且无缓存数据时的标准响应"""
+    return jsonify(create_response(
+        success=False,
+        error={
+            'code': 'UPSTREAM_UNAVAILABLE',
+            'message': f'上游市场数据暂不可用: {str(error)}'
+        }
+    )), 503
+
+
 @api_bp.route('/health', methods=['GET'])
 def health_check():
-    """健康检查端点"""
+    """存活探针（不访问上游、不读取快照，只表明进程能处理请求）"""
+    return jsonify(create_response(
+        success=True,
+        data={
+            'status': 'alive',
+            'uptime_seconds': round(time.time() - started_at, 3),
+            'timestamp': datetime.utcnow().isoformat()
+        },
+        message="系统运行正常"
+    )), 200
+
+
+@api_bp.route('/ready', methods=['GET'])
+def readiness_check():
+    """
+    就绪探针（读取内存中的快照、刷新器和熔断器状态；deep=true时附加限频的上游检查）
+
+    副本节点不运行快照刷新器，改为报告快照同步器的状态和复制延迟
+    """
     try:
         fetcher = get_market_fetcher()
-        # 简单测试API连接
-        test_markets = fetcher.get_markets(limit=1)
+        snapshot = fetcher.snapshot
+        max_staleness = app_config.get('readiness_max_staleness', 300)
+
+        readiness = {
+            'snapshot': {
+                'available': snapshot is not None,
+                'age_seconds': round(snapshot.age, 3) if snapshot else None,
+                'markets': len(snapshot) if snapshot else 0,
+                'version': snapshot.version if snapshot else None,
+                'max_staleness': max_staleness
+            },
+            'circuit_breaker': fetcher.breaker.stats(),
+            'timestamp': datetime.utcnow().isoformat()
+        }
+        if snapshot_replica is not None:
+            readiness['replication'] = snapshot_replica.stats()
+        else:
+            readiness['refresher'] = get_snapshot_refresher().stats()
+        ready = snapshot is not None and snapshot.age <= max_staleness
+
+        deep = request.args.get('deep', 'false').lower() == 'true'
+        if deep:
+            connected = fetcher.ping_upstream(max_age=app_config.get('deep_check_interval', 30))
+            readiness['clob_api_connected'] = connected
+            ready = ready and connected
+
+        readiness['ready'] = ready
+        if not ready:
+            return jsonify(create_response(
+                success=False,
+                error={
+                    'code': 'NOT_READY',
+                    'message': '服务尚未就绪：暂无足够新的市场快照或上游不可达',
+                    'details': readiness
+                }
+            )), 503
 
         return jsonify(create_response(
             success=True,
-            data={
-                'status': 'healthy',
-                'clob_api_connected': bool(test_markets),
-                'timestamp': datetime.utcnow().isoformat()
-            },
-            message="系统运行正常"
+            data=readiness,
+            message="服务已就绪"
         )), 200
 
     except Exception as e:
         return jsonify(create_response(
             success=False,
             error={
-                'code': 'HEALTH_CHECK_FAILED',
-                'message': f'健康检查失败: {str(e)}'
+                'code': 'READINESS_CHECK_FAILED',
+                'message': f'就绪检查失败: {str(e)}'
             }
         )), 500
 
@@ -86,7 +383,15 @@ def system_status():
             'clob_api_url': app_config.get('clob_api_url'),
             'request_timeout': app_config.get('request_timeout', 30),
             'max_retries': app_config.get('max_retries', 3),
-            'default_limit': app_config.get('default_limit', 50)
+            'default_limit': app_config.get('default_limit', 50),
+            'circuit_breaker': fetcher.breaker.stats(),
+            'upstream_stats': dict(fetcher.upstream_stats),
+            'price_enrichment': fetcher.price_enricher.stats(),
+            'trade_ingestion': trade_ingester.stats() if trade_ingester is not None else None,
+            'tiered_refresh': tiered_refresher.stats() if tiered_refresher.running else None,
+            'archive': fetcher.archive.stats() if fetcher.archive is not None else None,
+            'alerts': get_alert_engine().stats(),
+            'replication': replication_stats()
         }
 
         return jsonify(create_response(
@@ -174,6 +479,11 @@ def update_config():
                 app_config.set(field, value)
                 updated_fields.append(field)
 
+        # 同步到已创建的市场获取器
+        fetcher = get_market_fetcher()
+        fetcher.timeout = app_config.get('request_timeout', 30)
+        fetcher.max_retries = app_config.get('max_retries', 3)
+
         return jsonify(create_response(
             success=True,
             data={
@@ -201,7 +511,11 @@ def update_config():
 
 @api_bp.route('/markets', methods=['GET'])
 def get_markets():
-    """获取市场列表（支持分页和筛选）"""
+    """获取市场列表（支持分页和筛选，Accept 头或 format 参数可选择 MessagePack/Arrow 格式）"""
+    fmt, error_response = negotiate_response_format()
+    if error_response:
+        return error_response
+
     try:
         fetcher = get_market_fetcher()
 
@@ -234,10 +548,11 @@ def get_markets():
                 }
             )), 400
 
-        # 获取原始市场数据
-        raw_markets = fetcher.get_markets(limit=None if limit == -1 else limit)
+        # 获取原始市场数据（分类筛选、总数和后续页都基于完整快照，只按分页截取当前页）
+        with profiling.stage('fetch'):
+            raw_markets = fetcher.get_markets(max_age=snapshot_max_age())
 
-        if not raw_markets:
+        if not raw_markets and (active_only or fetcher.archive is None or not len(fetcher.archive)):
             return jsonify(create_response(
                 success=True,
                 data={
@@ -253,48 +568,67 @@ def get_markets():
                 message="未获取到市场数据"
             )), 200
 
-        # 提取市场信息
-        markets_info = []
-        for market in raw_markets:
-            market_info = fetcher.extract_market_info(market)
-            markets_info.append(market_info)
-
-        # 应用筛选条件
-        if category:
-            markets_info = [m for m in markets_info if m.get('category', '').lower() == category.lower()]
+        # 应用筛选条件：按分类和状态的字典编码筛选原始市场，只提取当前页
+        with profiling.stage('filter'):
+            rows = fetcher.market_columns(raw_markets).select(category=category, active_only=active_only)
 
-        if active_only:
-            markets_info = [m for m in markets_info if m.get('active', False)]
+            # 已归档的已结算市场排在内存中的市场之后，只按索引筛选分类，当前页用到时才从归档读取
+            archived_ids = [] if active_only or fetcher.archive is None else fetcher.archive.ids(category)
 
         # 应用分页
-        total = len(markets_info)
-        page_size = limit if limit and limit > 0 else total
-        total_pages = (total + page_size - 1) // page_size if page_size > 0 else 1
-        start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
+        with profiling.stage('paginate'):
+            total = len(rows) + len(archived_ids)
+            page_size = limit if limit and limit > 0 else total
+            total_pages = (total + page_size - 1) // page_size if page_size > 0 else 1
+            start_idx = (page - 1) * page_size
+            end_idx = start_idx + page_size
+
+            page_rows = rows[start_idx:end_idx]
+            archived_page = archived_ids[max(0, start_idx - len(rows)):max(0, end_idx - len(rows))]
+            archived_markets = fetcher.archive.get_many(archived_page) if archived_page else []
+            has_more = end_idx < total
+
+        live_prices = live_prices_requested()
+        data = {
+            'pagination': {
+                'page': page,
+                'limit': page_size,
+                'total': total,
+                'total_pages': total_pages,
+                'has_more': has_more
+            },
+            'filters_applied': {
+                'category': category,
+                'active_only': active_only,
+                'live_prices': live_prices
+            }
+        }
 
-        paginated_markets = markets_info[start_idx:end_idx]
-        has_more = end_idx < total
+        # 二进制格式直接按列组装当前页，不提取每个市场的信息字典
+        if fmt != 'json':
+            page_markets = [raw_markets[i] for i in page_rows] + archived_markets
+            quotes = page_quotes(fetcher, page_markets) if live_prices else None
+            frame = wire_formats.market_frame(fetcher, raw_markets, page_rows, archived_markets, quotes)
+            return binary_response(fmt, frame, data,
+                                   f"成功获取 {wire_formats.frame_length(frame)} 个市场数据")
+
+        # 提取市场信息
+        paginated_markets = fetcher.extract_markets_info([raw_markets[i] for i in page_rows] + archived_markets)
+
+        # 只为当前页的活跃市场补充实时价格
+        if live_prices:
+            with profiling.stage('enrich'):
+                paginated_markets = fetcher.price_enricher.enrich(paginated_markets)
 
         return jsonify(create_response(
             success=True,
-            data={
-                'markets': paginated_markets,
-                'pagination': {
-                    'page': page,
-                    'limit': page_size,
-                    'total': total,
-                    'total_pages': total_pages,
-                    'has_more': has_more
-                },
-                'filters_applied': {
-                    'category': category,
-                    'active_only': active_only
-                }
-            },
+            data={'markets': paginated_markets, **data},
             message=f"成功获取 {len(paginated_markets)} 个市场数据"
         )), 200
 
+    except UpstreamUnavailableError as e:
+        return upstream_unavailable_response(e)
+
     except Exception as e:
         return jsonify(create_response(
             success=False,
@@ -312,7 +646,7 @@ def get_market_detail(market_id):
         fetcher = get_market_fetcher()
 
         # 获取所有市场数据
-        raw_markets = fetcher.get_markets(limit=None)
+        raw_markets = fetcher.get_markets(limit=None, max_age=snapshot_max_age())
 
         if not raw_markets:
             return jsonify(create_response(
@@ -331,6 +665,11 @@ def get_market_detail(market_id):
                 target_market = market_info
                 break
 
+        if not target_market and fetcher.archive is not None:
+            archived = fetcher.archive.get(market_id)
+            if archived is not None:
+                target_market = fetcher.extract_market_info(archived)
+
         if not target_market:
             return jsonify(create_response(
                 success=False,
@@ -340,12 +679,18 @@ def get_market_detail(market_id):
                 }
             )), 404
 
+        if live_prices_requested():
+            target_market = fetcher.price_enricher.enrich([target_market])[0]
+
         return jsonify(create_response(
             success=True,
             data=target_market,
             message="市场详情获取成功"
         )), 200
 
+    except UpstreamUnavailableError as e:
+        return upstream_unavailable_response(e)
+
     except Exception as e:
         return jsonify(create_response(
             success=False,
@@ -363,7 +708,7 @@ def get_market_categories():
         fetcher = get_market_fetcher()
 
         # 获取少量市场数据来推断分类
-        raw_markets = fetcher.get_markets(limit=100)
+        raw_markets = fetcher.get_markets(limit=100, max_age=snapshot_max_age())
 
         if not raw_markets:
             return jsonify(create_response(
@@ -374,22 +719,11 @@ def get_market_categories():
                 message="未获取到市场数据，无法推断分类"
             )), 200
 
-        # 提取所有分类
-        categories = set()
-        for market in raw_markets:
-            market_info = fetcher.extract_market_info(market)
-            category = market_info.get('category', 'other')
-            categories.add(category)
-
         # 统计各分类的市场数量
         category_counts = {}
-        for category in categories:
-            category_counts[category] = 0
-
-        for market in raw_markets:
-            market_info = fetcher.extract_market_info(market)
+        for market_info in fetcher.extract_markets_info(raw_markets):
             category = market_info.get('category', 'other')
-            category_counts[category] += 1
+            category_counts[category] = category_counts.get(category, 0) + 1
 
         # 按数量排序
         sorted_categories = sorted(
@@ -422,6 +756,9 @@ def get_market_categories():
             message=f"成功获取 {len(result)} 个市场分类"
         )), 200
 
+    except UpstreamUnavailableError as e:
+        return upstream_unavailable_response(e)
+
     except Exception as e:
         return jsonify(create_response(
             success=False,
@@ -439,7 +776,7 @@ def get_market_stats():
         fetcher = get_market_fetcher()
 
         # 获取市场数据
-        raw_markets = fetcher.get_markets(limit=1000)
+        raw_markets = fetcher.get_markets(limit=1000, max_age=snapshot_max_age())
 
         if not raw_markets:
             return jsonify(create_response(
@@ -460,9 +797,7 @@ def get_market_stats():
         category_counts = {}
         accepting_orders = 0
 
-        for market in raw_markets:
-            market_info = fetcher.extract_market_info(market)
-
+        for market_info in fetcher.extract_markets_info(raw_markets):
             if market_info.get('active', False):
                 active_markets += 1
 
@@ -480,8 +815,12 @@ def get_market_stats():
             'active_markets': active_markets,
             'closed_markets': closed_markets,
             'accepting_orders': accepting_orders,
+            'archived_markets': len(fetcher.archive) if fetcher.archive is not None else 0,
             'categories': category_counts,
-            'last_updated': datetime.utcnow().isoformat()
+            # 数据的更新时间取快照拉取时间，快照未变化时响应内容（和ETag）不变
+            'last_updated': datetime.utcfromtimestamp(
+                fetcher.snapshot.fetched_at if fetcher.snapshot else time.time()
+            ).isoformat()
         }
 
         return jsonify(create_response(
@@ -490,6 +829,9 @@ def get_market_stats():
             message="市场统计信息获取成功"
         )), 200
 
+    except UpstreamUnavailableError as e:
+        return upstream_unavailable_response(e)
+
     except Exception as e:
         return jsonify(create_response(
             success=False,
@@ -497,4 +839,725 @@ def get_market_stats():
                 'code': 'STATS_FETCH_FAILED',
                 'message': f'获取统计信息失败: {str(e)}'
             }
-        )), 500
\ No newline at end of file
+        )), 500
+
+
+@api_bp.route('/markets/facets', methods=['GET'])
+def get_market_facets():
+    """当前筛选条件下各分类、标签、状态和到期时间段的市场数（同一分面内多个取值用逗号分隔）"""
+    try:
+        fetcher = get_market_fetcher()
+
+        active_only = request.args.get('active_only', type=lambda v: v.lower() == 'true')
+        filters = {
+            dimension: [value.strip() for value in request.args[dimension].split(',') if value.strip()]
+            for dimension in FACET_DIMENSIONS if request.args.get(dimension)
+        }
+
+        allowed = {'status': STATUS_VALUES, 'end_date': END_DATE_VALUES}
+        for dimension, values in allowed.items():
+            invalid = [value for value in filters.get(dimension, []) if value not in values]
+            if invalid:
+                return jsonify(create_response(
+                    success=False,
+                    error={
+                        'code': 'INVALID_FACET_FILTER',
+                        'message': f"{dimension}必须是 {', '.join(values)} 之一"
+                    }
+                )), 400
+
+        with profiling.stage('fetch'):
+            raw_markets = fetcher.get_markets(limit=None, max_age=snapshot_max_age())
+
+        # 位图随快照构建一次，每次请求只做位图交集和编码计数
+        with profiling.stage('facets'):
+            result = fetcher.facet_index(raw_markets).facets(filters, active_only=active_only)
+
+        return jsonify(create_response(
+            success=True,
+            data={
+                'total': result['total'],
+                'facets': result['facets'],
+                # 分面只统计内存中的市场，已归档的已结算市场单独给出数量
+                'archived_markets': len(fetcher.archive) if fetcher.archive is not None and not active_only else 0,
+                'filters_applied': {
+                    **filters,
+                    'active_only': active_only
+                }
+            },
+            message=f"筛选条件下共有 {result['total']} 个市场"
+        )), 200
+
+    except UpstreamUnavailableError as e:
+        return upstream_unavailable_response(e)
+
+    except Exception as e:
+        return jsonify(create_response(
+            success=False,
+            error={
+                'code': 'FACETS_FETCH_FAILED',
+                'message': f'获取分面计数失败: {str(e)}'
+            }
+        )), 500
+
+
+def calendar_response(field: str):
+    """按到期日历查询时间窗口内的未结算市场（field 为 "end" 或 "start"）"""
+    labels = {'end': ('到期', 'seconds_remaining'), 'start': ('开赛', 'seconds_until_start')}
+    label, offset_key = labels[field]
+    fmt, error_response = negotiate_response_format()
+    if error_response:
+        return error_response
+
+    try:
+        limit = request.args.get('limit', app_config.get('default_limit', 50), type=int)
+        category = request.args.get('category', type=str)
+        try:
+            within = parse_duration(request.args.get('within', '24h'))
+            bucket = parse_duration(request.args['histogram']) if request.args.get('histogram') else None
+        except ValueError as e:
+            return jsonify(create_response(
+                success=False,
+                error={
+                    'code': 'INVALID_DURATION',
+                    'message': f'{e}（示例: 90、30m、6h、2d）'
+                }
+            )), 400
+
+        if limit < 1 or limit > 1000:
+            return jsonify(create_response(
+                success=False,
+                error={
+                    'code': 'INVALID_LIMIT',
+                    'message': 'limit必须在1到1000之间'
+                }
+            )), 400
+
+        if bucket is not None and within / bucket > 500:
+            return jsonify(create_response(
+                success=False,
+                error={
+                    'code': 'INVALID_HISTOGRAM',
+                    'message': '直方图时间段不能超过500个'
+                }
+            )), 400
+
+        fetcher = get_market_fetcher()
+
+        with profiling.stage('fetch'):
+            raw_markets = fetcher.get_markets(limit=None, max_age=snapshot_max_age())
+
+        # 时间索引随快照构建一次，窗口查询为两次二分查找
+        now = time.time()
+        with profiling.stage('filter'):
+            calendar = fetcher.expiry_calendar(raw_markets)
+            rows = calendar.window(field, within, now)
+            if category:
+                rows = rows[fetcher.market_columns(raw_markets).mask(category=category)[rows]]
+
+        data = {
+            'total': len(rows),
+            'within_seconds': within,
+            'filters_applied': {
+                'category': category
+            }
+        }
+        if bucket is not None:
+            with profiling.stage('histogram'):
+                data['histogram'] = calendar.histogram(field, within, bucket, now, rows=rows)
+        message = f"{within / 3600:g} 小时内{label}的市场共 {len(rows)} 个"
+
+        if fmt != 'json':
+            frame = wire_formats.market_frame(fetcher, raw_markets, rows[:limit])
+            frame[offset_key] = (calendar.times[field][rows[:limit]] - now).round(1)
+            return binary_response(fmt, frame, data, message)
+
+        markets_info = fetcher.extract_markets_info([raw_markets[i] for i in rows[:limit]])
+        for market_info, row in zip(markets_info, rows[:limit]):
+            market_info[offset_key] = round(float(calendar.times[field][row]) - now, 1)
+
+        return jsonify(create_response(
+            success=True,
+            data={'markets': markets_info, **data},
+            message=message
+        )), 200
+
+    except UpstreamUnavailableError as e:
+        return upstream_unavailable_response(e)
+
+    except Exception as e:
+        return jsonify(create_response(
+            success=False,
+            error={
+                'code': 'CALENDAR_FETCH_FAILED',
+                'message': f'获取{label}市场失败: {str(e)}'
+            }
+        )), 500
+
+
+@api_bp.route('/markets/expiring', methods=['GET'])
+def get_expiring_markets():
+    """within 时间内到期的未结算市场（按到期时间从早到晚，histogram 指定直方图时间段宽度）"""
+    return calendar_response('end')
+
+
+@api_bp.route('/markets/starting', methods=['GET'])
+def get_starting_markets():
+    """within 时间内开赛的未结算市场（按开赛时间从早到晚，histogram 指定直方图时间段宽度）"""
+    return calendar_response('start')
+
+
+def replication_stats():
+    """当前节点的复制角色和状态（副本节点包含复制延迟）"""
+    if snapshot_replica is not None:
+        return snapshot_replica.stats()
+    if snapshot_publisher is not None:
+        return snapshot_publisher.stats()
+    return {'role': 'standalone'}
+
+
+@api_bp.route('/replication/changes', methods=['GET'])
+def get_replication_changes():
+    """
+    主节点向副本发布快照变化（长轮询）
+
+    since 为副本当前版本、epoch 为副本已知的主节点纪元、wait 为没有新版本时的最长等待秒数；
+    副本版本仍在差异历史中时返回按版本顺序的差异，否则返回gzip压缩的完整快照。
+    需要复制接口权限；每个客户端地址同时进行的长轮询数不超过 REPLICATION_MAX_POLLS_PER_CLIENT
+    """
+    forbidden = replication_forbidden_response()
+    if forbidden:
+        return forbidden
+
+    try:
+        get_market_fetcher()
+        if snapshot_publisher is None:
+            return jsonify(create_response(
+                success=False,
+                error={
+                    'code': 'REPLICATION_DISABLED',
+                    'message': '当前节点不是复制主节点（REPLICATION_ROLE=primary）'
+                }
+            )), 404
+
+        since = request.args.get('since', 0, type=int)
+        wait = min(max(request.args.get('wait', 0, type=float), 0), 60)
+        client = request.remote_addr or ''
+        if wait > 0 and not begin_replication_poll(client):
+            return jsonify(create_response(
+                success=False,
+                error={
+                    'code': 'TOO_MANY_POLLS',
+                    'message': '同一客户端同时进行的复制长轮询过多'
+                }
+            )), 429
+        try:
+            snapshot_publisher.note_replica(request.args.get('replica'), since)
+            changes = snapshot_publisher.changes_since(since, epoch=request.args.get('epoch') or None, wait=wait)
+        finally:
+            if wait > 0:
+                end_replication_poll(client)
+        envelope = create_response(
+            success=True,
+            data=changes,
+            message=f"快照版本 {since} -> {changes['version']}"
+        )
+
+        if changes['full'] and 'gzip' in request.accept_encodings:
+            response = Response(snapshot_publisher.full_body(changes, envelope), mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+            return response
+        return Response(json.dumps(envelope, ensure_ascii=False), mimetype='application/json')
+
+    except Exception as e:
+        return jsonify(create_response(
+            success=False,
+            error={
+                'code': 'REPLICATION_FAILED',
+                'message': f'获取快照变化失败: {str(e)}'
+            }
+        )), 500
+
+
+def begin_replication_poll(client):
+    """登记一个复制长轮询，该客户端已达到并发上限时返回False"""
+    with replication_polls_lock:
+        polling = replication_polls.get(client, 0)
+        if polling >= app_config.get('replication_max_polls_per_client', 2):
+            return False
+        replication_polls[client] = polling + 1
+        return True
+
+
+def end_replication_poll(client):
+    """长轮询结束后注销"""
+    with replication_polls_lock:
+        remaining = replication_polls.get(client, 1) - 1
+        if remaining > 0:
+            replication_polls[client] = remaining
+        else:
+            replication_polls.pop(client, None)
+
+
+def is_loopback(address):
+    """请求来源是否为本机回环地址"""
+    try:
+        return ipaddress.ip_address(address or '').is_loopback
+    except ValueError:
+        return False
+
+
+def admin_forbidden_response():
+    """
+    校验管理接口权限，失败时返回403响应
+
+    配置了ADMIN_TOKEN时需要携带匹配的X-Admin-Token请求头；未配置时只允许本机访问
+    """
+    admin_token = app_config.get('admin_token')
+    if admin_token:
+        if hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token):
+            return None
+        message = '管理接口需要有效的X-Admin-Token'
+    else:
+        if is_loopback(request.remote_addr):
+            return None
+        message = '未配置ADMIN_TOKEN时管理接口只允许本机访问'
+    return jsonify(create_response(
+        success=False,
+        error={
+            'code': 'FORBIDDEN',
+            'message': message
+        }
+    )), 403
+
+
+def replication_forbidden_response():
+    """
+    校验复制接口权限，失败时返回403响应
+
+    配置了REPLICATION_TOKEN时需要携带匹配的X-Replication-Token请求头；未配置时与管理接口相同
+    """
+    replication_token = app_config.get('replication_token')
+    if not replication_token:
+        return admin_forbidden_response()
+    if hmac.compare_digest(request.headers.get('X-Replication-Token', ''), replication_token):
+        return None
+    return jsonify(create_response(
+        success=False,
+        error={
+            'code': 'FORBIDDEN',
+            'message': '复制接口需要有效的X-Replication-Token'
+        }
+    )), 403
+
+
+@api_bp.route('/events', methods=['GET'])
+def get_events():
+    """获取负风险多结果事件列表（含结果价格之和、溢价率和领先结果，支持分页和筛选）"""
+    try:
+        fetcher = get_market_fetcher()
+
+        limit = request.args.get('limit', app_config.get('default_limit', 50), type=int)
+        page = request.args.get('page', 1, type=int)
+        category = request.args.get('category', type=str)
+        active_only = request.args.get('active_only', type=lambda v: v.lower() == 'true')
+
+        if limit > 1000:
+            return jsonify(create_response(
+                success=False,
+                error={
+                    'code': 'INVALID_LIMIT',
+                    'message': 'limit不能超过1000'
+                }
+            )), 400
+
+        if page < 1:
+            return jsonify(create_response(
+                success=False,
+                error={
+                    'code': 'INVALID_PAGE',
+                    'message': 'page必须大于0'
+                }
+            )), 400
+
+        # 事件索引随快照构建一次，之后的请求直接复用
+        with profiling.stage('fetch'):
+            events = fetcher.get_event_index(max_age=snapshot_max_age()).events
+
+        with profiling.stage('filter'):
+            if category:
+                events = [e for e in events if e['category'].lower() == category.lower()]
+
+            if active_only:
+                events = [e for e in events if e['active']]
+
+        with profiling.stage('paginate'):
+            total = len(events)
+            page_size = limit if limit > 0 else total
+            total_pages = (total + page_size - 1) // page_size if page_size > 0 else 1
+            start_idx = (page - 1) * page_size
+            end_idx = start_idx + page_size
+            paginated_events = events[start_idx:end_idx]
+
+        return jsonify(create_response(
+            success=True,
+            data={
+                'events': paginated_events,
+                'pagination': {
+                    'page': page,
+                    'limit': page_size,
+                    'total': total,
+                    'total_pages': total_pages,
+                    'has_more': end_idx < total
+                },
+                'filters_applied': {
+                    'category': category,
+                    'active_only': active_only
+                }
+            },
+            message=f"成功获取 {len(paginated_events)} 个事件"
+        )), 200
+
+    except UpstreamUnavailableError as e:
+        return upstream_unavailable_response(e)
+
+    except Exception as e:
+        return jsonify(create_response(
+            success=False,
+            error={
+                'code': 'EVENTS_FETCH_FAILED',
+                'message': f'获取事件数据失败: {str(e)}'
+            }
+        )), 500
+
+
+@api_bp.route('/events/<event_id>', methods=['GET'])
+def get_event_detail(event_id):
+    """获取单个多结果事件（按ID直接查找索引）"""
+    try:
+        event = get_market_fetcher().get_event_index(max_age=snapshot_max_age()).get(event_id)
+
+        if event is None:
+            return jsonify(create_response(
+                success=False,
+                error={
+                    'code': 'EVENT_NOT_FOUND',
+                    'message': f'未找到事件ID: {event_id}'
+                }
+            )), 404
+
+        return jsonify(create_response(
+            success=True,
+            data=event,
+            message="事件详情获取成功"
+        )), 200
+
+    except UpstreamUnavailableError as e:
+        return upstream_unavailable_response(e)
+
+    except Exception as e:
+        return jsonify(create_response(
+            success=False,
+            error={
+                'code': 'EVENT_DETAIL_FAILED',
+                'message': f'获取事件详情失败: {str(e)}'
+            }
+        )), 500
+
+
+@api_bp.route('/scanner', methods=['GET'])
+def get_scanner_results():
+    """跨市场定价异常（互补代币价格之和、负风险事件结果价格之和偏离1），按偏离幅度排序"""
+    try:
+        fetcher = get_market_fetcher()
+
+        kind = request.args.get('kind', type=str)
+        min_magnitude = request.args.get('min_magnitude', 0, type=float)
+        limit = request.args.get('limit', app_config.get('default_limit', 50), type=int)
+
+        if kind and kind not in SCAN_KINDS:
+            return jsonify(create_response(
+                success=False,
+                error={
+                    'code': 'INVALID_KIND',
+                    'message': f"kind必须是 {', '.join(SCAN_KINDS)} 之一"
+                }
+            )), 400
+
+        if limit < 1 or limit > 1000:
+            return jsonify(create_response(
+                success=False,
+                error={
+                    'code': 'INVALID_LIMIT',
+                    'message': 'limit必须在1到1000之间'
+                }
+            )), 400
+
+        with profiling.stage('fetch'):
+            raw_markets = fetcher.get_markets(limit=None, max_age=snapshot_max_age())
+
+        # 刷新后已扫描过的快照直接复用结果
+        with profiling.stage('scan'):
+            result = market_scanner.scan(raw_markets)
+
+        with profiling.stage('filter'):
+            anomalies = [
+                a for a in result['anomalies']
+                if (not kind or a['kind'] == kind) and a['magnitude'] >= min_magnitude
+            ]
+
+        return jsonify(create_response(
+            success=True,
+            data={
+                'anomalies': anomalies[:limit],
+                'total': len(anomalies),
+                'scanned_markets': result['scanned_markets'],
+                'scan_duration_ms': result['duration_ms'],
+                'scanned_at': result['scanned_at'],
+                'tolerance': result['tolerance'],
+                'filters_applied': {
+                    'kind': kind,
+                    'min_magnitude': min_magnitude
+                }
+            },
+            message=f"发现 {len(anomalies)} 个定价异常"
+        )), 200
+
+    except UpstreamUnavailableError as e:
+        return upstream_unavailable_response(e)
+
+    except Exception as e:
+        return jsonify(create_response(
+            success=False,
+            error={
+                'code': 'SCANNER_FAILED',
+                'message': f'异常扫描失败: {str(e)}'
+            }
+        )), 500
+
+
+@api_bp.route('/admin/profiling', methods=['GET'])
+def get_profiling():
+    """获取剖析状态和最慢的N个请求"""
+    forbidden = admin_forbidden_response()
+    if forbidden:
+        return forbidden
+
+    try:
+        top = request.args.get('top', 10, type=int)
+        route = request.args.get('route', type=str)
+        traces = profiling.profiler.slowest(len(profiling.profiler.traces))
+        if route:
+            traces = [t for t in traces if t['route'] == route]
+
+        return jsonify(create_response(
+            success=True,
+            data={
+                'profiler': profiling.profiler.stats(),
+                'slowest': traces[:top]
+            },
+            message="剖析数据获取成功"
+        )), 200
+
+    except Exception as e:
+        return jsonify(create_response(
+            success=False,
+            error={
+                'code': 'PROFILING_FETCH_FAILED',
+                'message': f'剖析数据获取失败: {str(e)}'
+            }
+        )), 500
+
+
+@api_bp.route('/admin/profiling', methods=['PUT'])
+def update_profiling():
+    """运行时开启/关闭剖析或调整抽样比例"""
+    forbidden = admin_forbidden_response()
+    if forbidden:
+        return forbidden
+
+    try:
+        data = request.get_json() or {}
+        sample_rate = data.get('sample_rate')
+        buffer_size = data.get('buffer_size')
+        stack_interval = data.get('stack_interval')
+
+        if sample_rate is not None and (not isinstance(sample_rate, (int, float)) or not 0 <= sample_rate <= 1):
+            return jsonify(create_response(
+                success=False,
+                error={
+                    'code': 'INVALID_VALUE',
+                    'message': 'sample_rate 必须在0到1之间'
+                }
+            )), 400
+
+        if buffer_size is not None and (not isinstance(buffer_size, int) or buffer_size <= 0):
+            return jsonify(create_response(
+                success=False,
+                error={
+                    'code': 'INVALID_VALUE',
+                    'message': 'buffer_size 必须是正整数'
+                }
+            )), 400
+
+        if stack_interval is not None and (not isinstance(stack_interval, (int, float)) or stack_interval < 0):
+            return jsonify(create_response(
+                success=False,
+                error={
+                    'code': 'INVALID_VALUE',
+                    'message': 'stack_interval 不能为负数'
+                }
+            )), 400
+
+        profiling.profiler.configure(
+            sample_rate=sample_rate,
+            buffer_size=buffer_size,
+            stack_interval=stack_interval
+        )
+
+        return jsonify(create_response(
+            success=True,
+            data=profiling.profiler.stats(),
+            message="剖析配置已更新"
+        )), 200
+
+    except Exception as e:
+        return jsonify(create_response(
+            success=False,
+            error={
+                'code': 'PROFILING_UPDATE_FAILED',
+                'message': f'剖析配置更新失败: {str(e)}'
+            }
+        )), 500
+
+
+@api_bp.route('/admin/profiling/flamegraph', methods=['GET'])
+def get_profiling_flamegraph():
+    """导出折叠栈格式的调用栈样本（可直接输入flamegraph.pl或speedscope）"""
+    forbidden = admin_forbidden_response()
+    if forbidden:
+        return forbidden
+
+    route = request.args.get('route', type=str)
+    return profiling.profiler.collapsed_stacks(route), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+
+@api_bp.route('/alerts', methods=['GET'])
+def get_alerts():
+    """告警流（按ID递增，轮询时传入上次收到的最大ID作为 since）"""
+    try:
+        since = request.args.get('since', 0, type=int)
+        limit = request.args.get('limit', 100, type=int)
+
+        if limit < 1 or limit > 1000:
+            return jsonify(create_response(
+                success=False,
+                error={
+                    'code': 'INVALID_LIMIT',
+                    'message': 'limit必须在1到1000之间'
+                }
+            )), 400
+
+        engine = get_alert_engine()
+        alerts = engine.alerts_since(since, limit)
+
+        return jsonify(create_response(
+            success=True,
+            data={
+                'alerts': alerts,
+                'last_id': alerts[-1]['id'] if alerts else since,
+                'engine': engine.stats()
+            },
+            message=f"成功获取 {len(alerts)} 条告警"
+        )), 200
+
+    except Exception as e:
+        return jsonify(create_response(
+            success=False,
+            error={
+                'code': 'ALERTS_FETCH_FAILED',
+                'message': f'获取告警失败: {str(e)}'
+            }
+        )), 500
+
+
+@api_bp.route('/alerts/rules', methods=['GET'])
+def get_alert_rules():
+    """获取告警规则列表"""
+    rules = get_alert_engine().list_rules()
+    return jsonify(create_response(
+        success=True,
+        data={
+            'rules': rules,
+            'total': len(rules)
+        },
+        message=f"成功获取 {len(rules)} 条告警规则"
+    )), 200
+
+
+@api_bp.route('/alerts/rules', methods=['POST'])
+def create_alert_rule():
+    """添加告警规则（相同ID的规则会被替换）"""
+    forbidden = admin_forbidden_response()
+    if forbidden:
+        return forbidden
+
+    try:
+        rule = get_alert_engine().add_rule(request.get_json(silent=True))
+
+        return jsonify(create_response(
+            success=True,
+            data=rule,
+            message="告警规则已添加"
+        )), 201
+
+    except ValueError as e:
+        return jsonify(create_response(
+            success=False,
+            error={
+                'code': 'INVALID_RULE',
+                'message': str(e)
+            }
+        )), 400
+
+    except Exception as e:
+        return jsonify(create_response(
+            success=False,
+            error={
+                'code': 'ALERT_RULE_SAVE_FAILED',
+                'message': f'告警规则保存失败: {str(e)}'
+            }
+        )), 500
+
+
+@api_bp.route('/alerts/rules/<rule_id>', methods=['DELETE'])
+def delete_alert_rule(rule_id):
+    """删除告警规则"""
+    forbidden = admin_forbidden_response()
+    if forbidden:
+        return forbidden
+
+    try:
+        if not get_alert_engine().remove_rule(rule_id):
+            return jsonify(create_response(
+                success=False,
+                error={
+                    'code': 'RULE_NOT_FOUND',
+                    'message': f'未找到告警规则: {rule_id}'
+                }
+            )), 404
+
+        return jsonify(create_response(
+            success=True,
+            data={'id': rule_id},
+            message="告警规则已删除"
+        )), 200
+
+    except Exception as e:
+        return jsonify(create_response(
+            success=False,
+            error={
+                'code': 'ALERT_RULE_DELETE_FAILED',
+                'message': f'告警规则删除失败: {str(e)}'
+            }
+        )), 500
@@ -0,0 +1,297 @@
+"""
+Web API 的 Python 客户端
+接口与 frontend/js/api.js 对应（市场列表、详情、分类、分面、统计、到期日历、配置、健康检查），
+所有请求复用同一个保持连接的会话；GET 响应按URL缓存在本地，再次请求时带上 If-None-Match，
+服务端返回304时直接使用缓存内容；iter_markets 按页自动翻页逐个返回市场。
+AsyncPolymarketClient 为基于 httpx 的异步版本。
+
+使用示例:
+  from api_client import PolymarketClient
+
+  with PolymarketClient("http://localhost:5000/api/v1") as client:
+      stats = client.get_market_stats()["data"]
+      for market in client.iter_markets(category="sports", active_only=True):
+          print(market["title"], market["current_price"])
+"""
+
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+DEFAULT_BASE_URL = "http://localhost:5000/api/v1"
+
+
+class PolymarketAPIError(Exception):
+    """API返回错误（非2xx状态码或 success=false）"""
+
+    def __init__(self, message: str, status: int = None, code: str = None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+class ResponseCache:
+    """
+    按URL缓存的GET响应（ETag, 解码后的响应），超过容量时淘汰最久未使用的条目
+
+    缓存的响应会原样返回给多个调用方，调用方不应修改返回的对象。
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url: str) -> Optional[Tuple[str, Dict]]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+
+    def put(self, url: str, etag: str, payload: Dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[url] = (etag, payload)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _query_value(value):
+    """查询参数值（布尔值与前端一致地转为 true/false）"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+class _Endpoints:
+    """各API端点（同步和异步客户端共用，_get/_put 返回结果或协程）"""
+
+    # ==================== 市场数据相关API ====================
+
+    def get_markets(self, **params):
+        """获取市场列表（limit、page、category、active_only、live_prices）"""
+        return self._get("/markets", params)
+
+    def get_market_detail(self, market_id: str):
+        """获取单个市场详情"""
+        return self._get(f"/markets/{market_id}")
+
+    def get_market_categories(self):
+        """获取市场分类列表"""
+        return self._get("/markets/categories")
+
+    def get_market_facets(self, **params):
+        """获取当前筛选条件下各分面取值的市场数（category、tag、status、end_date、active_only）"""
+        return self._get("/markets/facets", params)
+
+    def get_market_stats(self):
+        """获取市场统计信息"""
+        return self._get("/markets/stats")
+
+    def get_expiring_markets(self, within: str = "24h", **params):
+        """获取 within 内到期的未结算市场（category、limit、histogram）"""
+        return self._get("/markets/expiring", {"within": within, **params})
+
+    def get_starting_markets(self, within: str = "24h", **params):
+        """获取 within 内开赛的未结算市场（category、limit、histogram）"""
+        return self._get("/markets/starting", {"within": within, **params})
+
+    # ==================== 配置相关API ====================
+
+    def get_config(self):
+        """获取当前配置"""
+        return self._get("/config")
+
+    def update_config(self, config_data: Dict):
+        """更新配置"""
+        return self._put("/config", config_data)
+
+    # ==================== 系统相关API ====================
+
+    def health_check(self):
+        """健康检查"""
+        return self._get("/health")
+
+    def readiness_check(self, deep: bool = False):
+        """就绪检查（deep=True 时附加上游连通性检查）"""
+        return self._get("/ready", {"deep": True} if deep else None)
+
+    def get_system_status(self):
+        """获取系统状态"""
+        return self._get("/status")
+
+    # ==================== 内部方法 ====================
+
+    def _url(self, endpoint: str, params: Dict = None) -> str:
+        params = {key: _query_value(value) for key, value in (params or {}).items() if value is not None}
+        query = urlencode(sorted(params.items()))
+        return f"{self.base_url}{endpoint}?{query}" if query else f"{self.base_url}{endpoint}"
+
+    def _cached_headers(self, url: str) -> Tuple[Optional[Tuple[str, Dict]], Dict]:
+        cached = self.cache.get(url)
+        return cached, ({"If-None-Match": cached[0]} if cached else {})
+
+    def _handle(self, url: str, status: int, headers, decode, cached) -> Dict:
+        """处理响应：304时返回缓存内容，成功时缓存带ETag的响应，失败时抛出 PolymarketAPIError"""
+        if status == 304 and cached is not None:
+            self.cache.hits += 1
+            return cached[1]
+        self.cache.misses += 1
+        try:
+            payload = decode()
+        except ValueError:
+            raise PolymarketAPIError(f"HTTP {status}: 响应不是JSON", status=status)
+        if status >= 400 or not payload.get("success", True):
+            error = payload.get("error") or {}
+            raise PolymarketAPIError(error.get("message") or f"HTTP {status}", status=status, code=error.get("code"))
+        etag = headers.get("ETag")
+        if etag:
+            self.cache.put(url, etag, payload)
+        return payload
+
+    @staticmethod
+    def _page_info(payload: Dict) -> Tuple[list, bool]:
+        data = payload.get("data") or {}
+        return data.get("markets") or [], bool((data.get("pagination") or {}).get("has_more"))
+
+
+class PolymarketClient(_Endpoints):
+    """
+    同步客户端（线程安全，多个线程可共用一个实例）
+    """
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, timeout: float = 30, pool_size: int = 10,
+                 cache_size: int = 256, session: requests.Session = None):
+        """
+        Args:
+            base_url: API根地址（含 /api/v1）
+            timeout: 单个请求的超时时间（秒）
+            pool_size: 连接池大小（并发使用同一客户端的线程数）
+            cache_size: 本地缓存的GET响应数量上限（0表示不缓存）
+            session: 自定义的 requests 会话（None表示新建）
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.cache = ResponseCache(cache_size)
+        self.session = session or requests.Session()
+        if session is None:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+
+    def _get(self, endpoint: str, params: Dict = None) -> Dict:
+        url = self._url(endpoint, params)
+        cached, headers = self._cached_headers(url)
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise PolymarketAPIError(f"请求失败: {e}")
+        return self._handle(url, response.status_code, response.headers, response.json, cached)
+
+    def _put(self, endpoint: str, data: Dict) -> Dict:
+        url = self._url(endpoint)
+        try:
+            response = self.session.put(url, json=data, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise PolymarketAPIError(f"请求失败: {e}")
+        return self._handle(url, response.status_code, response.headers, response.json, None)
+
+    def iter_markets(self, page_size: int = 100, **params) -> Iterator[Dict]:
+        """
+        按页获取并逐个返回市场，直到没有更多页
+
+        Args:
+            page_size: 每页市场数量（最大1000）
+            **params: 其他筛选参数（category、active_only、live_prices）
+        """
+        page = 1
+        while True:
+            markets, has_more = self._page_info(self.get_markets(limit=page_size, page=page, **params))
+            yield from markets
+            if not has_more or not markets:
+                return
+            page += 1
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncPolymarketClient(_Endpoints):
+    """
+    异步客户端（依赖 httpx，接口与 PolymarketClient 相同，端点方法需要 await）
+    """
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, timeout: float = 30, pool_size: int = 10,
+                 cache_size: int = 256):
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("异步客户端需要httpx库，请运行: pip install httpx")
+
+        self.base_url = base_url.rstrip("/")
+        self.cache = ResponseCache(cache_size)
+        self._httpx = httpx
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    async def _get(self, endpoint: str, params: Dict = None) -> Dict:
+        url = self._url(endpoint, params)
+        cached, headers = self._cached_headers(url)
+        try:
+            response = await self.client.get(url, headers=headers)
+        except self._httpx.HTTPError as e:
+            raise PolymarketAPIError(f"请求失败: {e}")
+        return self._handle(url, response.status_code, response.headers, response.json, cached)
+
+    async def _put(self, endpoint: str, data: Dict) -> Dict:
+        url = self._url(endpoint)
+        try:
+            response = await self.client.put(url, json=data)
+        except self._httpx.HTTPError as e:
+            raise PolymarketAPIError(f"请求失败: {e}")
+        return self._handle(url, response.status_code, response.headers, response.json, None)
+
+    async def iter_markets(self, page_size: int = 100, **params) -> AsyncIterator[Dict]:
+        """按页获取并逐个返回市场（async for），直到没有更多页"""
+        page = 1
+        while True:
+            markets, has_more = self._page_info(await self.get_markets(limit=page_size, page=page, **params))
+            for market in markets:
+                yield market
+            if not has_more or not markets:
+                return
+            page += 1
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
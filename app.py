@@ -6,7 +6,9 @@ Polymarket Web Application - Flask Backend
 
 import os
 from datetime import datetime
-from flask import Flask, request, jsonify, render_template
+import time
+from flask import Flask, Response, request, jsonify, render_template
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -14,6 +16,22 @@ from flask_restful import Api
 
 from api.routes import api_bp
 from config import config as app_config
+import limiter_storage  # noqa: F401  注册 file:// 限流存储后端
+import metrics
+import profiling
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """记录JSON序列化耗时的JSON提供器"""
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.SERIALIZE_SECONDS.observe(elapsed)
+            profiling.record_stage("serialize", elapsed)
 
 
 def create_app():
@@ -22,6 +40,7 @@ def create_app():
                 static_folder='frontend',
                 static_url_path='',
                 template_folder='frontend')
+    app.json = TimedJSONProvider(app)
 
     # 配置CORS
     CORS(app, resources={
@@ -32,10 +51,11 @@ def create_app():
         }
     })
 
-    # 配置限流
+    # 配置限流（多worker部署时使用 file:// 或 redis:// 共享存储）
     limiter = Limiter(
         key_func=get_remote_address,
-        default_limits=["100 per minute"]
+        default_limits=[app_config.get("ratelimit_default", "100 per minute")],
+        storage_uri=app_config.get("ratelimit_storage_uri", "memory://")
     )
     limiter.init_app(app)
 
@@ -48,6 +68,12 @@ def create_app():
         """首页 - 市场列表界面"""
         return render_template('index.html')
 
+    @app.route('/metrics')
+    @limiter.exempt
+    def prometheus_metrics():
+        """Prometheus文本格式的运行指标"""
+        return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
     @app.route('/settings')
     def settings():
         """设置页面"""
@@ -0,0 +1,188 @@
+"""
+已结算市场归档
+已结算的市场不会再变化，本模块把它们从内存快照中移出，逐条压缩追加到本地文件；
+内存中只保留 condition_id -> (偏移量, 长度, 分类) 的索引，按ID查找只读取一条记录
+"""
+
+import os
+import json
+import zlib
+import struct
+import logging
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+# 记录格式：记录头长度(2字节) + 数据长度(4字节) + 记录头JSON + zlib压缩的市场JSON
+# 记录头不压缩，启动时只读记录头即可重建索引
+_RECORD_PREFIX = struct.Struct(">HI")
+
+
+def is_resolved(market: Dict) -> bool:
+    """市场是否已结算且已产生获胜结果（此后不会再变化）"""
+    return bool(market.get("closed")) and any(token.get("winner") for token in market.get("tokens") or ())
+
+
+class MarketArchive:
+    """
+    只追加的已结算市场归档
+
+    文件末尾写了一半的记录（进程中途退出）在加载时截掉；索引条目写入后不再修改，
+    读取不需要持锁。
+    """
+
+    def __init__(self, path: str, category_of: Callable[[Dict], str] = None):
+        """
+        Args:
+            path: 归档文件路径
+            category_of: 从原始市场数据推断分类的函数（分类写入索引，按分类筛选时不必读取记录）
+        """
+        self.path = path
+        self.category_of = category_of or (lambda market: market.get("category") or "other")
+        self._index: Dict[str, tuple] = {}
+        # question_id -> condition_id（市场详情按任一ID查找）
+        self._aliases: Dict[str, str] = {}
+        # ids() 的结果缓存：分类（None表示全部）-> (构建时的记录数, ID列表)，追加记录时清空
+        self._ids_cache: Dict[Optional[str], tuple] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """读取记录头重建索引"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r+b") as f:
+            file_size = os.fstat(f.fileno()).st_size
+            offset = 0
+            while offset + _RECORD_PREFIX.size <= file_size:
+                f.seek(offset)
+                header_length, data_length = _RECORD_PREFIX.unpack(f.read(_RECORD_PREFIX.size))
+                end = offset + _RECORD_PREFIX.size + header_length + data_length
+                if end > file_size:
+                    break
+                try:
+                    header = json.loads(f.read(header_length))
+                except ValueError:
+                    break
+                self._add_entry(header, offset + _RECORD_PREFIX.size + header_length, data_length)
+                offset = end
+            if offset < file_size:
+                logger.warning(f"归档文件末尾有不完整的记录，截断 {file_size - offset} 字节: {self.path}")
+                f.truncate(offset)
+        self._size = offset
+        logger.info(f"已加载归档索引: {len(self._index)} 个已结算市场")
+
+    def _add_entry(self, header: Dict, data_offset: int, data_length: int):
+        condition_id = header["id"]
+        self._index[condition_id] = (data_offset, data_length, header.get("cat") or "other")
+        question_id = header.get("qid")
+        if question_id and question_id != condition_id:
+            self._aliases[question_id] = condition_id
+
+    def __contains__(self, condition_id: str) -> bool:
+        return condition_id in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def add_many(self, markets: Iterable[Dict]) -> int:
+        """
+        追加尚未归档的市场
+
+        Returns:
+            新归档的市场数
+        """
+        with self._lock:
+            records = []
+            entries = []
+            seen = set()
+            offset = self._size
+            for market in markets:
+                condition_id = market.get("condition_id")
+                if not condition_id or condition_id in self._index or condition_id in seen:
+                    continue
+                seen.add(condition_id)
+                fields = {"id": condition_id, "qid": market.get("question_id"), "cat": self.category_of(market)}
+                header = json.dumps(fields, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+                data = zlib.compress(json.dumps(market, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+                records.append(_RECORD_PREFIX.pack(len(header), len(data)) + header + data)
+                entries.append((fields, offset + _RECORD_PREFIX.size + len(header), len(data)))
+                offset += len(records[-1])
+            if not records:
+                return 0
+
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            try:
+                with open(self.path, "ab") as f:
+                    f.write(b"".join(records))
+            except OSError:
+                # 截掉写了一半的数据，保持文件末尾与索引一致
+                if os.path.exists(self.path):
+                    os.truncate(self.path, self._size)
+                raise
+            # 数据写入文件后再更新索引，读取方不会看到指向未写入数据的条目
+            for fields, data_offset, data_length in entries:
+                self._add_entry(fields, data_offset, data_length)
+            self._size = offset
+            self._ids_cache = {}
+            return len(records)
+
+    def _read(self, f, entry: tuple) -> Dict:
+        f.seek(entry[0])
+        return json.loads(zlib.decompress(f.read(entry[1])))
+
+    def get(self, market_id: str) -> Optional[Dict]:
+        """按 condition_id 或 question_id 读取一个已归档市场"""
+        entry = self._index.get(market_id) or self._index.get(self._aliases.get(market_id))
+        if entry is None:
+            return None
+        with open(self.path, "rb") as f:
+            return self._read(f, entry)
+
+    def get_many(self, condition_ids: List[str]) -> List[Dict]:
+        """按给定顺序读取多个已归档市场（不存在的ID忽略）"""
+        entries = [self._index[cid] for cid in condition_ids if cid in self._index]
+        if not entries:
+            return []
+        with open(self.path, "rb") as f:
+            # 按文件位置顺序读取，再恢复调用方的顺序
+            loaded = {entry: self._read(f, entry) for entry in sorted(entries)}
+        return [loaded[entry] for entry in entries]
+
+    def ids(self, category: str = None) -> List[str]:
+        """
+        按归档顺序列出已归档市场ID（可按分类筛选，只读索引）
+
+        结果按分类缓存到下一次追加记录，返回的列表由多次调用共享，调用方不要修改。
+        """
+        key = category.lower() if category else None
+        count = len(self._index)
+        cached = self._ids_cache.get(key)
+        if cached is not None and cached[0] == count:
+            return cached[1]
+        items = list(self._index.items())
+        ids = [cid for cid, _ in items] if key is None else [cid for cid, entry in items if entry[2].lower() == key]
+        self._ids_cache[key] = (len(items), ids)
+        return ids
+
+    def iter_markets(self) -> Iterator[Dict]:
+        """按归档顺序逐个读取全部已归档市场"""
+        entries = list(self._index.values())
+        if not entries:
+            return
+        with open(self.path, "rb") as f:
+            for entry in entries:
+                yield self._read(f, entry)
+
+    def stats(self) -> Dict:
+        return {
+            "path": self.path,
+            "markets": len(self._index),
+            "bytes": self._size
+        }
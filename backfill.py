@@ -0,0 +1,345 @@
+"""
+历史价格回填
+从市场列表枚举全部代币，按有限并发逐个代币请求CLOB的历史价格端点（/prices-history），
+结果在内存中攒够一批后整批写入本地按列存储的目录：每批一个 .npz 分块文件（代币编码、时间戳、价格三列）。
+分块文件写完后原子改名，同时记录该批完成的代币，因此已提交的分块就是检查点；
+中断后重新运行同一命令，只请求尚未提交的代币。
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from config import config
+from rate_limit import PRIORITY_BACKGROUND
+from trades import _token_ids
+
+
+logger = logging.getLogger(__name__)
+
+
+MANIFEST_NAME = "manifest.json"
+PART_PATTERN = "part-{:05d}.npz"
+
+
+def market_token_ids(markets: Iterable[Dict]) -> List[str]:
+    """市场列表中的全部代币ID（去重，保持市场顺序）"""
+    return list(dict.fromkeys(token_id for market in markets for token_id in _token_ids(market)))
+
+
+class HistoryStore:
+    """
+    历史价格的列式存储目录
+
+    manifest.json 记录回填参数（时间范围和粒度），恢复时沿用；
+    每个分块文件包含 token_id（本块完成的全部代币，包括没有历史数据的）、
+    token（每行在 token_id 中的下标）、t（Unix时间戳）、p（价格）。
+    写到一半的分块（.tmp）在打开时删除。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(path, name))
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.path, MANIFEST_NAME)
+
+    def load_manifest(self) -> Optional[Dict]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write_manifest(self, manifest: Dict):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def parts(self) -> List[str]:
+        """已提交的分块文件路径（按写入顺序）"""
+        return sorted(
+            os.path.join(self.path, name) for name in os.listdir(self.path)
+            if name.startswith("part-") and name.endswith(".npz")
+        )
+
+    def reset(self):
+        """删除全部分块和回填参数（重新开始回填）"""
+        for part in self.parts():
+            os.remove(part)
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+
+    def completed_tokens(self) -> set:
+        """已提交的代币ID（只读取各分块的 token_id 列）"""
+        completed = set()
+        for part in self.parts():
+            with np.load(part, allow_pickle=False) as data:
+                completed.update(data["token_id"].tolist())
+        return completed
+
+    def write_part(self, results: Dict[str, List[Dict]]) -> int:
+        """
+        把一批代币的历史价格写为一个新分块
+
+        Args:
+            results: {代币ID: [{"t", "p"}, ...]}
+
+        Returns:
+            写入的行数
+        """
+        token_ids = list(results)
+        counts = np.fromiter((len(results[token_id]) for token_id in token_ids), dtype=np.int64,
+                             count=len(token_ids))
+        rows = int(counts.sum())
+        points = (point for token_id in token_ids for point in results[token_id])
+        t = np.empty(rows, dtype=np.int64)
+        p = np.empty(rows, dtype=np.float64)
+        for i, point in enumerate(points):
+            t[i] = point["t"]
+            p[i] = point["p"]
+
+        existing = self.parts()
+        index = int(os.path.basename(existing[-1])[5:10]) + 1 if existing else 0
+        final_path = os.path.join(self.path, PART_PATTERN.format(index))
+        tmp_path = final_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, token_id=np.array(token_ids, dtype=str),
+                     token=np.repeat(np.arange(len(token_ids), dtype=np.int32), counts), t=t, p=p)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, final_path)
+        return rows
+
+    def read(self) -> Dict[str, np.ndarray]:
+        """
+        读取全部分块并合并
+
+        Returns:
+            {"token_id": 代币ID（按行）, "t": 时间戳, "p": 价格}
+        """
+        token_ids, t, p = [], [], []
+        for part in self.parts():
+            with np.load(part, allow_pickle=False) as data:
+                token_ids.append(data["token_id"][data["token"]])
+                t.append(data["t"])
+                p.append(data["p"])
+        if not t:
+            return {"token_id": np.array([], dtype=str), "t": np.array([], dtype=np.int64),
+                    "p": np.array([], dtype=np.float64)}
+        return {"token_id": np.concatenate(token_ids), "t": np.concatenate(t), "p": np.concatenate(p)}
+
+    def to_frame(self):
+        """读取为 pandas DataFrame（token_id, t, p）"""
+        import pandas as pd
+
+        return pd.DataFrame(self.read())
+
+
+@dataclass
+class BackfillProgress:
+    """回填进度（吞吐量和预计剩余时间按本次运行计算，不含之前已完成的代币）"""
+
+    total: int
+    skipped: int = 0
+    done: int = 0
+    failed: int = 0
+    points: int = 0
+    committed: int = 0
+    started_at: float = field(default_factory=time.time)
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.total - self.skipped - self.done - self.failed)
+
+    @property
+    def elapsed(self) -> float:
+        return max(1e-9, time.time() - self.started_at)
+
+    @property
+    def tokens_per_second(self) -> float:
+        return (self.done + self.failed) / self.elapsed
+
+    @property
+    def points_per_second(self) -> float:
+        return self.points / self.elapsed
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        rate = self.tokens_per_second
+        return self.remaining / rate if rate > 0 else None
+
+    def summary(self) -> Dict:
+        eta = self.eta_seconds
+        return {
+            "total_tokens": self.total,
+            "skipped_tokens": self.skipped,
+            "completed_tokens": self.done,
+            "failed_tokens": self.failed,
+            "committed_tokens": self.committed,
+            "remaining_tokens": self.remaining,
+            "points": self.points,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "tokens_per_second": round(self.tokens_per_second, 2),
+            "points_per_second": round(self.points_per_second, 1),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+        }
+
+
+class HistoryBackfill:
+    """
+    按代币回填历史价格
+
+    工作线程只负责请求上游（经过获取器的调度器、熔断器和重试），解析结果在调用线程中缓冲，
+    缓冲的行数达到 flush_rows 或距上次提交超过 flush_interval 秒时整批写入一个分块。
+    请求失败的代币不写入，下次运行时重试。
+    """
+
+    def __init__(self, fetcher, output: str, concurrency: int = None, fidelity: int = None,
+                 start_ts: int = None, end_ts: int = None, flush_rows: int = 200000,
+                 flush_interval: float = 30, restart: bool = False):
+        """
+        Args:
+            fetcher: PolymarketMarketFetcher实例（提供上游地址和调用控制）
+            output: 存储目录
+            concurrency: 同时请求的代币数
+            fidelity: 历史价格粒度（分钟，None表示60）
+            start_ts: 起始时间（Unix时间戳，None表示由上游决定）
+            end_ts: 截止时间（Unix时间戳，None表示当前时间）
+            flush_rows: 缓冲的行数达到该值时写入分块
+            flush_interval: 距上次写入超过该时间（秒）时写入分块
+            restart: 删除已有的分块，重新开始回填
+
+        目录中已有回填参数时（中断后恢复）沿用原来的时间范围和粒度，保证同一批数据的口径一致。
+        """
+        self.fetcher = fetcher
+        self.store = HistoryStore(output)
+        self.concurrency = concurrency or config.get("backfill_concurrency", 8)
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+
+        if restart:
+            self.store.reset()
+        manifest = self.store.load_manifest()
+        if manifest is None:
+            manifest = {
+                "fidelity": fidelity or 60,
+                "start_ts": start_ts,
+                "end_ts": int(end_ts if end_ts is not None else time.time()),
+                "created_at": time.time(),
+            }
+            self.store.write_manifest(manifest)
+            self.resumed = False
+        else:
+            self.resumed = True
+            requested = {"fidelity": fidelity, "start_ts": start_ts, "end_ts": end_ts}
+            changed = [key for key, value in requested.items() if value is not None and value != manifest.get(key)]
+            if changed:
+                logger.info(f"存储目录中已有回填参数，沿用原参数（忽略: {', '.join(changed)}）")
+        self.manifest = manifest
+
+    def _history_url(self, token_id: str) -> str:
+        params = [f"market={token_id}", f"fidelity={self.manifest['fidelity']}", f"endTs={self.manifest['end_ts']}"]
+        if self.manifest.get("start_ts") is not None:
+            params.append(f"startTs={self.manifest['start_ts']}")
+        return f"{self.fetcher.api_url.rstrip('/')}/prices-history?{'&'.join(params)}"
+
+    def fetch_history(self, token_id: str) -> List[Dict]:
+        """请求一个代币的历史价格"""
+        from py_clob_client.http_helpers.helpers import get
+
+        response = self.fetcher._call_upstream("prices-history", get, self._history_url(token_id),
+                                               priority=PRIORITY_BACKGROUND)
+        history = (response or {}).get("history") if isinstance(response, dict) else response
+        return [point for point in history or () if point.get("t") is not None and point.get("p") is not None]
+
+    def run(self, token_ids: List[str], progress: Callable[[BackfillProgress], None] = None,
+            report_interval: float = 5, stop_event: threading.Event = None) -> Dict:
+        """
+        回填一批代币（已提交的代币跳过）
+
+        Args:
+            token_ids: 代币ID列表
+            progress: 进度回调，每 report_interval 秒和结束时调用一次
+            report_interval: 进度回调间隔（秒）
+            stop_event: 设置后停止提交新请求，写入已完成的结果后返回（Ctrl+C效果相同）
+
+        Returns:
+            进度汇总（BackfillProgress.summary()，另含 interrupted 和 output）
+        """
+        completed = self.store.completed_tokens()
+        pending = [token_id for token_id in dict.fromkeys(token_ids) if token_id not in completed]
+        state = BackfillProgress(total=len(set(token_ids)), skipped=len(set(token_ids)) - len(pending))
+        if self.resumed and state.skipped:
+            logger.info(f"从检查点恢复：{state.skipped} 个代币已完成，剩余 {len(pending)} 个")
+
+        buffer: Dict[str, List[Dict]] = {}
+        buffered_rows = 0
+        last_flush = last_report = time.time()
+        interrupted = False
+
+        def flush():
+            nonlocal buffer, buffered_rows, last_flush
+            if buffer:
+                self.store.write_part(buffer)
+                state.committed += len(buffer)
+            buffer, buffered_rows, last_flush = {}, 0, time.time()
+
+        queue = iter(pending)
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency), thread_name_prefix="backfill") as executor:
+            try:
+                while True:
+                    # 在途请求不超过并发数的两倍，不必一次提交全部代币
+                    while not (stop_event and stop_event.is_set()) and len(in_flight) < 2 * self.concurrency:
+                        token_id = next(queue, None)
+                        if token_id is None:
+                            break
+                        in_flight[executor.submit(self.fetch_history, token_id)] = token_id
+                    if not in_flight:
+                        break
+
+                    finished, _ = wait(in_flight, timeout=report_interval, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        token_id = in_flight.pop(future)
+                        try:
+                            history = future.result()
+                        except Exception as e:
+                            state.failed += 1
+                            logger.warning(f"获取历史价格失败 {token_id}: {e}")
+                            continue
+                        buffer[token_id] = history
+                        buffered_rows += len(history)
+                        state.done += 1
+                        state.points += len(history)
+
+                    now = time.time()
+                    if buffered_rows >= self.flush_rows or now - last_flush >= self.flush_interval:
+                        flush()
+                    if progress and now - last_report >= report_interval:
+                        last_report = now
+                        progress(state)
+                interrupted = bool(stop_event and stop_event.is_set()) and state.remaining > 0
+            except KeyboardInterrupt:
+                interrupted = True
+                for future in in_flight:
+                    future.cancel()
+                logger.warning("回填被中断，写入已完成的结果")
+            finally:
+                flush()
+
+        if progress:
+            progress(state)
+        return {**state.summary(), "interrupted": interrupted, "output": self.store.path}
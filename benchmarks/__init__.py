@@ -0,0 +1 @@
+# 基准测试包：合成市场语料、本地CLOB桩服务器和可复现的性能测量
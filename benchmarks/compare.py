@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+基准结果对比
+比较两次 benchmarks.run 的JSON输出，列出各指标变化并在退化超过阈值时返回非零退出码
+
+使用示例:
+  python -m benchmarks.compare baseline.json current.json
+  python -m benchmarks.compare baseline.json current.json --threshold 0.2
+"""
+
+import sys
+import json
+import argparse
+from typing import Dict, Iterator, Tuple
+
+
+# 以这些后缀结尾的指标越小越好
+LOWER_IS_BETTER = ("_seconds", "_ms", "_bytes")
+# 以这些后缀结尾的指标越大越好
+HIGHER_IS_BETTER = ("_per_second",)
+
+
+def flatten(results: Dict, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    """将嵌套结果展开为 (路径, 数值) 对"""
+    for key, value in results.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from flatten(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def compare(baseline: Dict, current: Dict, threshold: float):
+    """
+    对比两次结果
+
+    Returns:
+        (对比行列表, 退化指标列表)
+    """
+    base_values = dict(flatten(baseline["results"]))
+    rows = []
+    regressions = []
+
+    for path, value in flatten(current["results"]):
+        base = base_values.get(path)
+        if base in (None, 0):
+            continue
+
+        change = (value - base) / base
+        if path.endswith(LOWER_IS_BETTER):
+            regressed = change > threshold
+        elif path.endswith(HIGHER_IS_BETTER):
+            regressed = change < -threshold
+        else:
+            continue
+
+        rows.append((path, base, value, change, regressed))
+        if regressed:
+            regressions.append(path)
+
+    return rows, regressions
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="对比两次基准测试结果")
+    parser.add_argument("baseline", help="基线结果JSON")
+    parser.add_argument("current", help="当前结果JSON")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定退化的相对变化阈值 (默认: 0.1)")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+
+    rows, regressions = compare(baseline, current, args.threshold)
+
+    print(f"基线: {baseline['meta'].get('commit')}  当前: {current['meta'].get('commit')}")
+    for path, base, value, change, regressed in rows:
+        marker = "❌" if regressed else "  "
+        print(f"{marker} {path:<70} {base:>14.4f} -> {value:>14.4f} ({change:+.1%})")
+
+    if regressions:
+        print(f"\n发现 {len(regressions)} 项性能退化（阈值 {args.threshold:.0%}）")
+        sys.exit(1)
+    print("\n未发现性能退化")
+
+
+if __name__ == "__main__":
+    main()
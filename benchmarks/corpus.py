@@ -0,0 +1,202 @@
+"""
+合成市场语料生成器
+按固定随机种子生成与CLOB /markets 响应结构一致的市场数据（字段形状参见 debug_full_api.py 的输出）
+"""
+
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+
+# 语料时间基准固定，保证同一种子生成完全相同的数据
+BASE_TIME = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+CATEGORY_TEMPLATES = {
+    "politics": {
+        "questions": [
+            "Will {name} win the {year} {office} election?",
+            "Will {name} be the {party} nominee for {office} in {year}?",
+            "Will Congress pass the {bill} before {month} {year}?",
+        ],
+        "tags": ["Politics", "Elections", "US Politics", "World", "All"],
+        "outcomes": ("Yes", "No"),
+    },
+    "crypto": {
+        "questions": [
+            "Will Bitcoin reach ${price:,} by {month} {day}?",
+            "Will Ethereum close above ${price:,} on {month} {day}?",
+            "Will BTC hit a new all-time high in {month} {year}?",
+        ],
+        "tags": ["Crypto", "Bitcoin", "Ethereum", "Crypto Prices", "All"],
+        "outcomes": ("Yes", "No"),
+    },
+    "sports": {
+        "questions": [
+            "NBA: {team} vs. {team2}",
+            "Will {team} win the {year} NFL championship game?",
+            "Soccer: Will {team} beat {team2} on {month} {day}?",
+        ],
+        "tags": ["Sports", "NBA", "NFL", "Soccer", "Games", "All"],
+        "outcomes": None,
+    },
+    "finance": {
+        "questions": [
+            "Will the Fed cut rates at the {month} {year} meeting?",
+            "Will US inflation exceed {pct}% in {month}?",
+            "Will the S&P 500 stock index close above {price:,} on {month} {day}?",
+        ],
+        "tags": ["Economy", "Fed Rates", "Stocks", "Finance", "All"],
+        "outcomes": ("Yes", "No"),
+    },
+    "other": {
+        "questions": [
+            "Will {name} release a new album before {month} {year}?",
+            "Will the movie '{title}' gross over ${price:,}M opening weekend?",
+            "Will it snow in {city} on {month} {day}?",
+        ],
+        "tags": ["Pop Culture", "Movies", "Weather", "Science", "All"],
+        "outcomes": ("Yes", "No"),
+    },
+}
+
+NAMES = ["Alice Carter", "Bruno Silva", "Chen Wei", "Dana Brooks", "Elena Petrova", "Farah Khan",
+         "George Lin", "Hiro Tanaka", "Ines Moreau", "Jonas Berg"]
+TEAMS = ["Lakers", "Celtics", "Warriors", "Bulls", "Chiefs", "Eagles", "Arsenal", "Barcelona",
+         "Real Madrid", "Yankees", "Dodgers", "Heat"]
+CITIES = ["New York", "London", "Tokyo", "Paris", "Berlin", "Toronto"]
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August",
+          "September", "October", "November", "December"]
+FILLER = ("This market will resolve according to the official results published by the relevant "
+          "authority. If the outcome is ambiguous or the event is cancelled, the market will resolve "
+          "to 50-50. Resolution source: the primary resolution source listed on the event page, "
+          "with a consensus of credible reporting used as a fallback. ")
+
+
+def _hex_id(rng: random.Random) -> str:
+    return "0x" + "%064x" % rng.getrandbits(256)
+
+
+def _iso(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _question(rng: random.Random, category: str) -> str:
+    template = rng.choice(CATEGORY_TEMPLATES[category]["questions"])
+    team, team2 = rng.sample(TEAMS, 2)
+    return template.format(
+        name=rng.choice(NAMES), year=rng.choice([2025, 2026, 2027]), office=rng.choice(["presidential", "senate", "mayoral"]),
+        party=rng.choice(["Democratic", "Republican"]), bill=rng.choice(["budget bill", "infrastructure act", "tax reform"]),
+        month=rng.choice(MONTHS), day=rng.randint(1, 28), price=rng.choice([50000, 75000, 100000, 150000, 4000, 6000]),
+        team=team, team2=team2, pct=rng.choice([2, 3, 4, 5]), title=rng.choice(["Orbit", "Northwind", "Ember"]),
+        city=rng.choice(CITIES)
+    )
+
+
+def _tokens(rng: random.Random, category: str, question: str, closed: bool) -> List[Dict]:
+    outcomes = CATEGORY_TEMPLATES[category]["outcomes"]
+    if outcomes is None:
+        # 体育对阵类市场以队名作为结果
+        outcomes = tuple(question.split(": ", 1)[-1].split(" vs. ")) if " vs. " in question else ("Yes", "No")
+
+    yes_price = round(rng.uniform(0.01, 0.99), 3)
+    prices = [yes_price, round(1 - yes_price + rng.uniform(-0.02, 0.02), 3)]
+    winner_index = rng.randrange(2) if closed else None
+    if closed:
+        prices = [1.0 if i == winner_index else 0.0 for i in range(2)]
+
+    return [
+        {
+            "token_id": str(rng.getrandbits(252)),
+            "outcome": outcome,
+            "price": prices[i],
+            "winner": closed and i == winner_index
+        }
+        for i, outcome in enumerate(outcomes)
+    ]
+
+
+def generate_markets(count: int, seed: int = 42, closed_ratio: float = 0.6,
+                     neg_risk_ratio: float = 0.3) -> List[Dict]:
+    """
+    生成合成市场语料
+
+    Args:
+        count: 市场数量
+        seed: 随机种子（相同种子生成相同数据）
+        closed_ratio: 已结算市场比例（真实市场全集以历史市场为主）
+        neg_risk_ratio: 属于负风险多结果事件的市场比例
+
+    Returns:
+        与CLOB /markets 响应中 data 元素结构一致的市场列表
+    """
+    rng = random.Random(seed)
+    categories = list(CATEGORY_TEMPLATES)
+    markets = []
+    neg_risk_group = None
+    group_remaining = 0
+
+    for index in range(count):
+        category = rng.choice(categories)
+        question = _question(rng, category)
+        closed = rng.random() < closed_ratio
+        end_date = BASE_TIME + timedelta(hours=rng.randint(-24 * 365, 24 * 365))
+
+        # 负风险事件：连续若干个市场共享同一个 neg_risk_market_id
+        if group_remaining == 0 and rng.random() < neg_risk_ratio:
+            neg_risk_group = _hex_id(rng)
+            group_remaining = rng.randint(2, 10)
+        neg_risk = group_remaining > 0
+        if neg_risk:
+            group_remaining -= 1
+
+        game_start = None
+        if category == "sports" and rng.random() < 0.7:
+            game_start = _iso(end_date - timedelta(hours=rng.randint(1, 6)))
+
+        market = {
+            "enable_order_book": True,
+            "active": not closed or rng.random() < 0.1,
+            "closed": closed,
+            "archived": closed and rng.random() < 0.3,
+            "accepting_orders": not closed,
+            "accepting_order_timestamp": _iso(end_date - timedelta(days=30)) if not closed else None,
+            "minimum_order_size": rng.choice([5, 10, 15]),
+            "minimum_tick_size": rng.choice([0.01, 0.001]),
+            "condition_id": _hex_id(rng),
+            "question_id": _hex_id(rng),
+            "question": question,
+            "description": FILLER * rng.randint(1, 4),
+            "market_slug": question.lower().replace(" ", "-")[:60] + f"-{index}",
+            "end_date_iso": _iso(end_date),
+            "game_start_time": game_start,
+            "seconds_delay": 3 if game_start else 0,
+            "fpmm": "",
+            "maker_base_fee": 0,
+            "taker_base_fee": 0,
+            "notifications_enabled": True,
+            "neg_risk": neg_risk,
+            "neg_risk_market_id": neg_risk_group if neg_risk else "",
+            "neg_risk_request_id": _hex_id(rng) if neg_risk else "",
+            "icon": f"https://polymarket-upload.s3.us-east-2.amazonaws.com/{category}-{index % 50}.png",
+            "image": f"https://polymarket-upload.s3.us-east-2.amazonaws.com/{category}-{index % 50}.png",
+            "rewards": {"rates": None, "min_size": 0, "max_spread": 0},
+            "is_50_50_outcome": False,
+            "tokens": _tokens(rng, category, question, closed),
+            "tags": rng.sample(CATEGORY_TEMPLATES[category]["tags"], rng.randint(1, 3)),
+        }
+        markets.append(market)
+
+    return markets
+
+
+def save_corpus(markets: List[Dict], path: str):
+    """保存语料到JSON文件"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(markets, f, ensure_ascii=False)
+
+
+def load_corpus(path: str) -> List[Dict]:
+    """从JSON文件加载语料"""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
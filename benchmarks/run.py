@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+基准测试入口
+生成合成语料并通过本地CLOB桩服务器测量CLI启动开销、提取吞吐量、异常扫描耗时、内存（含字符串驻留前后的快照占用）、CLI端到端耗时和API各路由延迟，以及
+响应格式（JSON/MessagePack/Arrow）的编码耗时和大小，结果以JSON输出，可用 benchmarks.compare 在提交之间对比
+
+使用示例:
+  python -m benchmarks.run                                  # 默认规模 1000,10000
+  python -m benchmarks.run --sizes 1000,100000 --output bench.json
+  python -m benchmarks.run --latency 0.05 --skip cli        # 模拟50ms上游延迟，跳过CLI测试
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from benchmarks.corpus import generate_markets
+from benchmarks.stub_server import StubClobServer
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _benchmark_env(bucket_dir: str) -> Dict[str, str]:
+    """基准测试使用的环境变量：放开上游令牌桶，降低日志量"""
+    return {
+        "UPSTREAM_RATE": "1000000",
+        "UPSTREAM_BURST": "1000000",
+        "UPSTREAM_BUCKET_PATH": os.path.join(bucket_dir, "bucket.json"),
+        "LOG_LEVEL": "WARNING",
+        "SNAPSHOT_REFRESH_INTERVAL": "0",
+    }
+
+
+def _latency_summary(samples: List[float]) -> Dict:
+    samples = sorted(samples)
+    return {
+        "iterations": len(samples),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+    }
+
+
+def _parse_importtime(stderr: str) -> List[Tuple[str, int]]:
+    """解析 -X importtime 输出，返回顶层模块的 (模块名, 累计微秒)"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # 顶层导入没有缩进，嵌套导入的累计时间已包含在其父模块中
+        if not name.startswith("  "):
+            modules.append((name.strip(), int(cumulative)))
+    return modules
+
+
+def _imports_numpy(stderr: str) -> bool:
+    """-X importtime 输出中是否出现numpy（包括嵌套导入）"""
+    return any(line.rsplit("|", 1)[-1].strip() == "numpy"
+               for line in stderr.splitlines() if line.startswith("import time:"))
+
+
+def bench_startup(env: Dict[str, str], repeat: int) -> Dict:
+    """
+    CLI启动开销：不需要访问网络的调用路径的墙钟时间和 -X importtime 统计的导入耗时
+
+    import_fetcher 只导入 polymarket_markets（使用本地快照的运行路径），不允许加载numpy
+    """
+    results = {}
+    main_path = os.path.join(REPO_ROOT, "main.py")
+    scenarios = {
+        "help": [main_path, "--help"],
+        "show_config": [main_path, "--show-config"],
+        "import_fetcher": ["-c", "import polymarket_markets"],
+    }
+    run_env = {**os.environ, **env}
+
+    for name, args in scenarios.items():
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, *args], cwd=REPO_ROOT, env=run_env, stdout=subprocess.DEVNULL, check=True)
+            samples.append(time.perf_counter() - started)
+
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", *args],
+            cwd=REPO_ROOT, env=run_env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True
+        )
+        modules = _parse_importtime(completed.stderr)
+        heaviest = sorted(modules, key=lambda item: item[1], reverse=True)[:5]
+        results[name] = {
+            "best_seconds": round(min(samples), 4),
+            "import_ms": round(sum(us for _, us in modules) / 1000, 3),
+            "heaviest_imports": [[module, round(us / 1000, 3)] for module, us in heaviest],
+            "imports_numpy": _imports_numpy(completed.stderr),
+        }
+
+    if results["import_fetcher"]["imports_numpy"]:
+        raise RuntimeError("import polymarket_markets 不应加载numpy（字典编码列、分面和到期日历应在使用时导入）")
+    return results
+
+
+def bench_extract(markets: List[Dict], repeat: int) -> Dict:
+    """串行 extract_market_info 吞吐量（取多次运行中的最快一次）"""
+    from polymarket_markets import PolymarketMarketFetcher
+
+    fetcher = PolymarketMarketFetcher()
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fetcher.extract_markets_info(markets, workers=1)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    return {
+        "markets": len(markets),
+        "best_seconds": round(best, 6),
+        "markets_per_second": round(len(markets) / best, 1) if best else None,
+    }
+
+
+def bench_scan(markets: List[Dict], repeat: int) -> Dict:
+    """全量定价异常扫描耗时（取多次运行中的最快一次）"""
+    from scanner import scan_markets
+
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        anomalies = scan_markets(markets)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    return {
+        "markets": len(markets),
+        "anomalies": len(anomalies),
+        "best_seconds": round(best, 6),
+        "markets_per_second": round(len(markets) / best, 1) if best else None,
+    }
+
+
+def bench_parallel_extract(markets: List[Dict], repeat: int) -> Dict:
+    """多进程批量提取在不同worker数量下的吞吐量（首次运行用于启动进程池，不计入结果）"""
+    from polymarket_markets import PolymarketMarketFetcher
+
+    fetcher = PolymarketMarketFetcher()
+    fetcher.parallel_threshold = 0
+    cpu_count = os.cpu_count() or 1
+    worker_counts = sorted(n for n in {1, 2, 4, 8, cpu_count} if n <= max(2, cpu_count))
+
+    results = {"cpu_count": cpu_count}
+    serial_best = None
+    for workers in worker_counts:
+        fetcher.extract_markets_info(markets, workers=workers)
+        best = min(_timed(fetcher.extract_markets_info, markets, workers=workers) for _ in range(repeat))
+        serial_best = serial_best or best
+        results[f"workers_{workers}"] = {
+            "best_seconds": round(best, 6),
+            "markets_per_second": round(len(markets) / best, 1),
+            "speedup": round(serial_best / best, 2),
+        }
+    return results
+
+
+def _timed(func, *args, **kwargs) -> float:
+    started = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - started
+
+
+def bench_memory(markets: List[Dict]) -> Dict:
+    """提取过程的内存峰值和提取结果占用"""
+    from polymarket_markets import PolymarketMarketFetcher
+
+    fetcher = PolymarketMarketFetcher()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    markets_info = fetcher.extract_markets_info(markets, workers=1)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del markets_info
+
+    return {
+        "markets": len(markets),
+        "extract_peak_bytes": peak - baseline,
+        "extract_retained_bytes": retained - baseline,
+    }
+
+
+def bench_interning(markets: List[Dict], repeat: int) -> Dict:
+    """解码后快照的内存占用（驻留重复字符串前后）以及按分类筛选的耗时（提取后比较字符串 vs 字典编码）"""
+    import gc
+    from interning import MarketColumns, intern_markets
+    from polymarket_markets import PolymarketMarketFetcher
+
+    payload = json.dumps(markets)
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    decoded = json.loads(payload)
+    decoded_bytes = tracemalloc.get_traced_memory()[0] - baseline
+    intern_markets(decoded)
+    gc.collect()
+    interned_bytes = tracemalloc.get_traced_memory()[0] - baseline
+    fetcher = PolymarketMarketFetcher()
+    columns = MarketColumns(decoded, category_of=fetcher._extract_category)
+    columns_bytes = tracemalloc.get_traced_memory()[0] - baseline - interned_bytes
+    tracemalloc.stop()
+
+    category = columns.categories.values[0] if len(columns.categories) else "other"
+    extract_best = min(
+        _timed(lambda: [m for m in fetcher.extract_markets_info(decoded, workers=1)
+                        if m.get("category", "").lower() == category])
+        for _ in range(repeat)
+    )
+    codes_best = min(_timed(columns.select, category=category, active_only=True) for _ in range(repeat))
+
+    return {
+        "markets": len(markets),
+        "decoded_bytes": decoded_bytes,
+        "interned_bytes": interned_bytes,
+        "reduction": round(1 - interned_bytes / decoded_bytes, 4) if decoded_bytes else None,
+        "columns_bytes": columns_bytes,
+        "filter_extract_seconds": round(extract_best, 6),
+        "filter_codes_seconds": round(codes_best, 6),
+    }
+
+
+def bench_wire_formats(markets: List[Dict], repeat: int) -> Dict:
+    """整个快照作为一页时各响应格式的编码耗时、客户端解码耗时和响应大小（JSON为提取市场信息后序列化）"""
+    import numpy as np
+    import wire_formats
+    from interning import intern_markets
+    from polymarket_markets import PolymarketMarketFetcher
+
+    fetcher = PolymarketMarketFetcher()
+    decoded = json.loads(json.dumps(markets))
+    intern_markets(decoded)
+    rows = np.arange(len(decoded))
+    # 字典编码列和到期日历随快照构建，不计入编码耗时
+    fetcher.market_columns(decoded)
+    fetcher.expiry_calendar(decoded)
+    envelope = {"success": True, "timestamp": datetime.utcnow().isoformat(), "data": {}, "message": ""}
+
+    def encode_json():
+        markets_info = fetcher.extract_markets_info(decoded, workers=1)
+        return json.dumps({**envelope, "data": {"markets": markets_info}}).encode()
+
+    def encode_binary(fmt):
+        return wire_formats.encode(fmt, wire_formats.market_frame(fetcher, decoded, rows), envelope)
+
+    def decode_arrow(body):
+        import pyarrow as pa
+        return pa.ipc.open_stream(body).read_all()
+
+    def decode_msgpack(body):
+        import msgpack
+        return msgpack.unpackb(body)
+
+    formats = {
+        "json": (encode_json, json.loads),
+        "msgpack": (lambda: encode_binary("msgpack"), decode_msgpack),
+        "arrow": (lambda: encode_binary("arrow"), decode_arrow),
+    }
+    results = {"markets": len(markets)}
+    for name, (encoder, decoder) in formats.items():
+        module = wire_formats.missing_dependency(name)
+        if module:
+            results[name] = {"unavailable": module}
+            continue
+        body = encoder()
+        results[name] = {
+            "payload_bytes": len(body),
+            "encode_seconds": round(min(_timed(encoder) for _ in range(repeat)), 6),
+            "decode_seconds": round(min(_timed(decoder, body) for _ in range(repeat)), 6),
+        }
+    return results
+
+
+def bench_cli(server_url: str, env: Dict[str, str], repeat: int) -> Dict:
+    """main.py 端到端运行时间（子进程，包含解释器启动和全部分页拉取）"""
+    results = {}
+    snapshot_path = os.path.join(os.path.dirname(env["UPSTREAM_BUCKET_PATH"]), "cli_snapshot.json")
+    scenarios = {
+        "all": ["--all", "--save-snapshot", snapshot_path],
+        "limit_50": ["--limit", "50"],
+        # 读取上面 --all 场景保存的本地快照，不访问上游
+        "from_snapshot_limit_50": ["--from-snapshot", snapshot_path, "--limit", "50"],
+    }
+    run_env = {**os.environ, **env}
+
+    for name, extra_args in scenarios.items():
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, os.path.join(REPO_ROOT, "main.py"), "--api-url", server_url, *extra_args],
+                cwd=REPO_ROOT, env=run_env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+            )
+            samples.append(time.perf_counter() - started)
+            if completed.returncode != 0:
+                raise RuntimeError(f"CLI场景 {name} 失败: {completed.stderr.decode()[-500:]}")
+        results[name] = {"best_seconds": round(min(samples), 4), "mean_seconds": round(statistics.mean(samples), 4)}
+
+    return results
+
+
+def bench_api(server_url: str, markets: List[Dict], iterations: int) -> Dict:
+    """API各路由延迟（Flask测试客户端，首个请求经上游，其余读取快照）"""
+    from config import config as app_config
+    import api.routes as routes
+    from app import create_app
+
+    app_config.set("clob_api_url", server_url)
+    app_config.set("snapshot_refresh_interval", 0)
+    app_config.set("snapshot_max_age", 3600)
+    routes.market_fetcher = None
+    routes.snapshot_refresher = None
+
+    client = create_app().test_client()
+    sample_id = markets[len(markets) // 2]["question_id"]
+    route_paths = {
+        "/api/v1/markets": "/api/v1/markets?limit=50",
+        "/api/v1/markets?limit=-1": "/api/v1/markets?limit=-1",
+        "/api/v1/markets?category": "/api/v1/markets?category=politics&active_only=true",
+        "/api/v1/markets/<market_id>": f"/api/v1/markets/{sample_id}",
+        "/api/v1/markets/stats": "/api/v1/markets/stats",
+        "/api/v1/markets/categories": "/api/v1/markets/categories",
+        "/api/v1/health": "/api/v1/health",
+        "/api/v1/ready": "/api/v1/ready",
+    }
+
+    # 冷启动：首个请求需要从上游拉取全部分页
+    started = time.perf_counter()
+    response = client.get("/api/v1/markets?limit=-1")
+    cold = time.perf_counter() - started
+    if response.status_code != 200:
+        raise RuntimeError(f"API冷启动请求失败: {response.status_code}")
+
+    results = {"cold_full_fetch_ms": round(cold * 1000, 3), "routes": {}}
+    for name, path in route_paths.items():
+        samples = []
+        payload_bytes = 0
+        for _ in range(iterations):
+            started = time.perf_counter()
+            response = client.get(path)
+            samples.append(time.perf_counter() - started)
+            payload_bytes = len(response.data)
+        results["routes"][name] = {**_latency_summary(samples), "payload_bytes": payload_bytes}
+
+    return results
+
+
+def collect_metadata(args) -> Dict:
+    """记录运行环境，便于在提交之间对比"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        "commit": commit,
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "sizes": args.sizes,
+        "latency": args.latency,
+        "page_size": args.page_size,
+    }
+
+
+def setup_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Polymarket 工具基准测试")
+    parser.add_argument("--sizes", type=lambda v: [int(x) for x in v.split(",")], default=[1000, 10000],
+                        help="语料规模列表，逗号分隔 (默认: 1000,10000)")
+    parser.add_argument("--seed", type=int, default=42, help="语料随机种子 (默认: 42)")
+    parser.add_argument("--latency", type=float, default=0.0, help="桩服务器每个请求的延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="桩服务器附加随机延迟上限（秒）")
+    parser.add_argument("--page-size", type=int, default=1000, help="桩服务器每页市场数量 (默认: 1000)")
+    parser.add_argument("--repeat", type=int, default=3, help="吞吐量和CLI测试的重复次数 (默认: 3)")
+    parser.add_argument("--iterations", type=int, default=20, help="每个API路由的请求次数 (默认: 20)")
+    parser.add_argument("--skip", type=lambda v: set(v.split(",")), default=set(),
+                        help="跳过的测试，逗号分隔（startup,extract,scan,parallel,memory,interning,formats,cli,api）")
+    parser.add_argument("--output", "-o", type=str, help="结果输出JSON文件（默认输出到标准输出）")
+    return parser
+
+
+def main():
+    """主函数"""
+    args = setup_argparse().parse_args()
+
+    with tempfile.TemporaryDirectory() as bucket_dir:
+        env = _benchmark_env(bucket_dir)
+        # 上游调度器和日志级别在首次导入时读取环境变量，必须在导入项目模块前设置
+        os.environ.update(env)
+
+        results = {"meta": collect_metadata(args), "results": {}}
+        if "startup" not in args.skip:
+            print("CLI启动开销测试...", file=sys.stderr)
+            results["results"]["startup"] = bench_startup(env, args.repeat)
+
+        for size in args.sizes:
+            print(f"生成 {size} 个合成市场...", file=sys.stderr)
+            markets = generate_markets(size, seed=args.seed)
+            size_results = {}
+
+            if "extract" not in args.skip:
+                size_results["extract"] = bench_extract(markets, args.repeat)
+            if "scan" not in args.skip:
+                size_results["scan"] = bench_scan(markets, args.repeat)
+            if "parallel" not in args.skip:
+                size_results["parallel_extract"] = bench_parallel_extract(markets, args.repeat)
+            if "memory" not in args.skip:
+                size_results["memory"] = bench_memory(markets)
+            if "interning" not in args.skip:
+                size_results["interning"] = bench_interning(markets, args.repeat)
+            if "formats" not in args.skip:
+                size_results["formats"] = bench_wire_formats(markets, args.repeat)
+
+            with StubClobServer(markets, page_size=args.page_size, latency=args.latency,
+                                jitter=args.jitter) as server:
+                if "cli" not in args.skip:
+                    print(f"  CLI端到端测试 ({size})...", file=sys.stderr)
+                    size_results["cli"] = bench_cli(server.url, env, args.repeat)
+                if "api" not in args.skip:
+                    print(f"  API路由延迟测试 ({size})...", file=sys.stderr)
+                    size_results["api"] = bench_api(server.url, markets, args.iterations)
+                size_results["upstream_requests"] = dict(server.request_counts)
+
+            results["results"][str(size)] = size_results
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"结果已写入: {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
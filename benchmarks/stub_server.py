@@ -0,0 +1,252 @@
+"""
+本地CLOB桩服务器
+以与真实CLOB相同的分页格式提供合成市场数据，可配置响应延迟和每页大小，
+另外提供单个市场、批量报价、订单簿、按市场的成交记录和按代币的历史价格端点，用于基准测试和不依赖网络的测试
+"""
+
+import json
+import time
+import base64
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import urlparse, parse_qs
+
+
+END_CURSOR = "LTE="
+
+
+def encode_cursor(offset: int) -> str:
+    return base64.b64encode(str(offset).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.b64decode(cursor).decode())
+    except (ValueError, UnicodeDecodeError):
+        return 0
+
+
+class StubClobServer:
+    """
+    本地CLOB桩服务器
+
+    用法:
+        with StubClobServer(markets, latency=0.05) as server:
+            fetcher = PolymarketMarketFetcher(api_url=server.url)
+    """
+
+    def __init__(self, markets: List[Dict], page_size: int = 1000, latency: float = 0.0,
+                 jitter: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        """
+        Args:
+            markets: 市场语料
+            page_size: 每页市场数量
+            latency: 每个请求的固定延迟（秒）
+            jitter: 附加的随机延迟上限（秒）
+            host: 监听地址
+            port: 监听端口（0表示自动分配）
+        """
+        self.markets = markets
+        self.page_size = page_size
+        self.latency = latency
+        self.jitter = jitter
+        self.request_counts: Dict[str, int] = {}
+        self.trades: Dict[str, List[Dict]] = {}
+        self._page_cache: Dict[tuple, bytes] = {}
+        self._token_prices: Dict[str, float] = None
+        # 历史价格端点未指定 endTs 时的截止时间（固定值，保证同一请求的结果可重复）
+        self.history_end = int(time.time())
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubClobServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stub-clob", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StubClobServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _count(self, path: str):
+        with self._lock:
+            self.request_counts[path] = self.request_counts.get(path, 0) + 1
+
+    def add_trades(self, condition_id: str, trades: List[Dict]):
+        """为市场追加成交记录（成交记录端点按时间倒序返回）"""
+        with self._lock:
+            self.trades.setdefault(condition_id, []).extend(trades)
+
+    def _market_page(self, path: str, cursor: str) -> bytes:
+        """生成（并缓存）一页市场数据的响应体"""
+        offset = decode_cursor(cursor)
+        key = (path, offset)
+        cached = self._page_cache.get(key)
+        if cached is not None:
+            return cached
+
+        page = self.markets[offset:offset + self.page_size]
+        if path == "/simplified-markets":
+            page = [
+                {k: m[k] for k in ("condition_id", "rewards", "tokens", "active", "closed", "archived", "accepting_orders")}
+                for m in page
+            ]
+        next_offset = offset + self.page_size
+        body = json.dumps({
+            "limit": self.page_size,
+            "count": len(page),
+            "next_cursor": encode_cursor(next_offset) if next_offset < len(self.markets) else END_CURSOR,
+            "data": page
+        }).encode()
+        self._page_cache[key] = body
+        return body
+
+    def handle_get(self, path: str, query: Dict[str, List[str]]):
+        """
+        处理GET请求
+
+        Returns:
+            (状态码, 响应体bytes)
+        """
+        if path == "/":
+            return 200, b'"OK"'
+        if path in ("/markets", "/simplified-markets"):
+            cursor = query.get("next_cursor", ["MA=="])[0]
+            return 200, self._market_page(path, cursor)
+        if path.startswith("/markets/"):
+            condition_id = path.rsplit("/", 1)[-1]
+            market = next((m for m in self.markets if m.get("condition_id") == condition_id), None)
+            if market is None:
+                return 404, json.dumps({"error": "market not found"}).encode()
+            return 200, json.dumps(market).encode()
+        if path == "/prices-history":
+            return 200, self._price_history(query)
+        if path.startswith("/live-activity/events/"):
+            condition_id = path.rsplit("/", 1)[-1]
+            with self._lock:
+                trades = sorted(self.trades.get(condition_id, []), key=lambda t: t["timestamp"], reverse=True)
+            return 200, json.dumps(trades).encode()
+        return 404, json.dumps({"error": f"not found: {path}"}).encode()
+
+    def _price_history(self, query: Dict[str, List[str]]) -> bytes:
+        """
+        代币的历史价格（与真实CLOB相同的 {"history": [{"t", "p"}, ...]} 格式）
+
+        每fidelity分钟一个点，价格在语料价格附近按代币ID确定性地波动，同一请求总是返回相同结果；
+        未知代币返回空历史。
+        """
+        token_id = query.get("market", [""])[0]
+        price = self.token_prices().get(token_id)
+        if price is None:
+            return json.dumps({"history": []}).encode()
+        end = int(query.get("endTs", [self.history_end])[0])
+        start = int(query.get("startTs", [end - 86400])[0])
+        step = max(1, int(query.get("fidelity", ["60"])[0])) * 60
+        rng = random.Random(f"{token_id}:{start}")
+        history = [
+            {"t": t, "p": round(min(0.999, max(0.001, price + rng.uniform(-0.05, 0.05))), 4)}
+            for t in range(-(-start // step) * step, end + 1, step)
+        ]
+        return json.dumps({"history": history}).encode()
+
+    def token_prices(self) -> Dict[str, float]:
+        """代币ID到语料中价格的索引"""
+        if self._token_prices is None:
+            self._token_prices = {
+                token["token_id"]: token["price"] for market in self.markets for token in market.get("tokens", [])
+            }
+        return self._token_prices
+
+    def handle_post(self, path: str, body):
+        """
+        处理POST请求（批量报价端点，子类可扩展更多端点）
+
+        报价以语料中的代币价格为中间价，价差固定为0.02；订单簿买卖各一档，每档100份。
+        """
+        if path not in ("/midpoints", "/spreads", "/prices", "/books") or not isinstance(body, list):
+            return 404, json.dumps({"error": f"not found: {path}"}).encode()
+
+        prices = self.token_prices()
+        if path == "/books":
+            books = [
+                {
+                    "market": "", "asset_id": item["token_id"], "timestamp": str(int(time.time() * 1000)),
+                    "last_trade_price": str(prices[item["token_id"]]), "min_order_size": "5",
+                    "neg_risk": False, "tick_size": "0.01", "hash": "",
+                    "bids": [{"price": str(round(prices[item["token_id"]] - 0.01, 4)), "size": "100"}],
+                    "asks": [{"price": str(round(prices[item["token_id"]] + 0.01, 4)), "size": "100"}]
+                }
+                for item in body if item.get("token_id") in prices
+            ]
+            return 200, json.dumps(books).encode()
+
+        result = {}
+        for item in body:
+            token_id = item.get("token_id")
+            if token_id not in prices:
+                continue
+            price = prices[token_id]
+            if path == "/midpoints":
+                result[token_id] = str(price)
+            elif path == "/spreads":
+                result[token_id] = "0.02"
+            else:
+                side_prices = result.setdefault(token_id, {})
+                side_prices[item.get("side") or "BUY"] = str(round(price - 0.01 if item.get("side") == "BUY" else price + 0.01, 4))
+        return 200, json.dumps(result).encode()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _delay(self):
+                delay = server.latency + (random.uniform(0, server.jitter) if server.jitter else 0)
+                if delay > 0:
+                    time.sleep(delay)
+
+            def _send(self, status: int, body: bytes):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                server._count(parsed.path)
+                self._delay()
+                self._send(*server.handle_get(parsed.path, parse_qs(parsed.query)))
+
+            def do_POST(self):
+                parsed = urlparse(self.path)
+                server._count(parsed.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw) if raw else None
+                except ValueError:
+                    body = None
+                self._delay()
+                self._send(*server.handle_post(parsed.path, body))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -3,6 +3,7 @@
 """
 
 import os
+import tempfile
 from typing import Dict, Any
 from dotenv import load_dotenv
 
@@ -22,6 +23,81 @@ class Config:
             "log_level": os.getenv("LOG_LEVEL", "INFO"),
             "request_timeout": int(os.getenv("REQUEST_TIMEOUT", "30")),
             "max_retries": int(os.getenv("MAX_RETRIES", "3")),
+            "hedge_delay": float(os.getenv("HEDGE_DELAY", "0")),
+            "retry_backoff": float(os.getenv("RETRY_BACKOFF", "0.5")),
+            "circuit_failure_threshold": int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+            "circuit_reset_timeout": float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30")),
+            
+            # 快照配置
+            "snapshot_refresh_interval": float(os.getenv("SNAPSHOT_REFRESH_INTERVAL", "30")),
+            "snapshot_max_age": float(os.getenv("SNAPSHOT_MAX_AGE", "60")),
+            "readiness_max_staleness": float(os.getenv("READINESS_MAX_STALENESS", "300")),
+            "deep_check_interval": float(os.getenv("DEEP_CHECK_INTERVAL", "30")),
+            "snapshot_path": os.getenv("SNAPSHOT_PATH"),
+            "archive_path": os.getenv("ARCHIVE_PATH"),
+            "tiered_refresh": os.getenv("TIERED_REFRESH", "false").lower() == "true",
+            # 分层刷新配置（只包含设置了的层级间隔，其余用默认值）
+            "tier_intervals": {
+                tier: float(os.getenv(f"TIER_INTERVAL_{tier.upper()}"))
+                for tier in ("live", "hot", "warm", "cold") if os.getenv(f"TIER_INTERVAL_{tier.upper()}")
+            },
+            "tier_batch_size": int(os.getenv("TIER_BATCH_SIZE", "50")),
+            "tier_concurrency": int(os.getenv("TIER_CONCURRENCY", "4")),
+            "tier_volatility_threshold": float(os.getenv("TIER_VOLATILITY_THRESHOLD", "0.02")),
+            
+            # 快照复制配置（standalone / primary / replica）
+            "replication_role": os.getenv("REPLICATION_ROLE", "standalone").lower(),
+            "replication_primary_url": os.getenv("REPLICATION_PRIMARY_URL"),
+            "replication_wait": float(os.getenv("REPLICATION_WAIT", "25")),
+            "replication_history": int(os.getenv("REPLICATION_HISTORY", "20")),
+            "replication_replica_id": os.getenv("REPLICATION_REPLICA_ID"),
+            # 留空时复制接口与管理接口相同（ADMIN_TOKEN或只允许本机访问）
+            "replication_token": os.getenv("REPLICATION_TOKEN"),
+            "replication_max_polls_per_client": int(os.getenv("REPLICATION_MAX_POLLS_PER_CLIENT", "2")),
+            
+            # 实时价格配置
+            "price_enrichment": os.getenv("PRICE_ENRICHMENT", "true").lower() == "true",
+            "price_batch_size": int(os.getenv("PRICE_BATCH_SIZE", "500")),
+            "price_concurrency": int(os.getenv("PRICE_CONCURRENCY", "4")),
+            "price_cache_ttl": float(os.getenv("PRICE_CACHE_TTL", "10")),
+            
+            # 历史价格回填配置
+            "backfill_concurrency": int(os.getenv("BACKFILL_CONCURRENCY", "8")),
+            
+            # 批量提取配置（未设置进程数时按CPU核数）
+            "extract_workers": int(os.getenv("EXTRACT_WORKERS")) if os.getenv("EXTRACT_WORKERS") else None,
+            "extract_parallel_threshold": int(os.getenv("EXTRACT_PARALLEL_THRESHOLD", "20000")),
+            
+            # 成交记录配置
+            "trade_ingest_interval": float(os.getenv("TRADE_INGEST_INTERVAL", "60")),
+            "trade_ingest_max_markets": int(os.getenv("TRADE_INGEST_MAX_MARKETS", "200")),
+            "trade_concurrency": int(os.getenv("TRADE_CONCURRENCY", "4")),
+            
+            # 告警配置
+            "alert_rules_path": os.getenv("ALERT_RULES_PATH", "data/alert_rules.json"),
+            "alert_webhook_url": os.getenv("ALERT_WEBHOOK_URL"),
+            "alert_feed_size": int(os.getenv("ALERT_FEED_SIZE", "500")),
+            
+            # 定价异常扫描配置
+            "scanner_tolerance": float(os.getenv("SCANNER_TOLERANCE", "0.02")),
+            "scanner_max_results": int(os.getenv("SCANNER_MAX_RESULTS", "500")),
+            
+            # 性能剖析配置
+            "profiling_sample_rate": float(os.getenv("PROFILING_SAMPLE_RATE", "0")),
+            "profiling_buffer_size": int(os.getenv("PROFILING_BUFFER_SIZE", "200")),
+            "profiling_stack_interval": float(os.getenv("PROFILING_STACK_INTERVAL", "0.005")),
+            "admin_token": os.getenv("ADMIN_TOKEN"),
+            
+            # 限流配置
+            "ratelimit_storage_uri": os.getenv("RATELIMIT_STORAGE_URI", "memory://"),
+            "ratelimit_default": os.getenv("RATELIMIT_DEFAULT", "100 per minute"),
+            "upstream_rate": float(os.getenv("UPSTREAM_RATE", "10")),
+            "upstream_burst": int(os.getenv("UPSTREAM_BURST", "20")),
+            "upstream_max_queue": int(os.getenv("UPSTREAM_MAX_QUEUE", "100")),
+            # 留空表示令牌桶只在进程内生效
+            "upstream_bucket_path": os.getenv(
+                "UPSTREAM_BUCKET_PATH", os.path.join(tempfile.gettempdir(), "polymarket_upstream_bucket.json")
+            ),
             
             # 可选的身份验证配置
             "private_key": os.getenv("PRIVATE_KEY"),
@@ -0,0 +1,109 @@
+"""
+多结果事件聚合
+负风险（neg_risk）事件由若干个共享 neg_risk_market_id 的二元市场组成，每个市场对应一个结果。
+本模块在每份快照上构建一次事件索引，预先计算事件级汇总（结果价格之和、溢价率、领先结果），
+事件视图不必再逐个查询市场详情
+"""
+
+from typing import Callable, Dict, List, Optional
+
+
+def outcome_token(market: Dict) -> Optional[Dict]:
+    """市场中代表该结果的代币（优先 "Yes"，否则第一个代币）"""
+    tokens = market.get("tokens") or []
+    if not tokens:
+        return None
+    return next((t for t in tokens if str(t.get("outcome", "")).lower() == "yes"), tokens[0])
+
+
+def outcome_quote(market: Dict) -> Optional[Dict]:
+    """结果代币的报价（价格无法解析时按0计）"""
+    token = outcome_token(market)
+    if token is None:
+        return None
+    try:
+        price = float(token.get("price"))
+    except (TypeError, ValueError):
+        price = 0.0
+    return {"token_id": token.get("token_id"), "price": price, "winner": bool(token.get("winner", False))}
+
+
+def event_id_of(market: Dict) -> Optional[str]:
+    """市场所属负风险事件的ID（不属于多结果事件时返回None）"""
+    if not market.get("neg_risk"):
+        return None
+    return market.get("neg_risk_market_id") or None
+
+
+class EventIndex:
+    """
+    单份快照上的事件索引（构建后只读）
+
+    events 保持事件在快照中首次出现的顺序，by_id 用于按ID查找。
+    """
+
+    def __init__(self, markets: List[Dict], category_of: Callable[[Dict], str] = None):
+        """
+        Args:
+            markets: 原始市场数据列表
+            category_of: 从原始市场数据推断分类的函数（取事件中第一个市场的分类）
+        """
+        category_of = category_of or (lambda market: market.get("category") or "other")
+        self.markets = markets
+        self.by_id: Dict[str, Dict] = {}
+
+        for market in markets:
+            event_id = event_id_of(market)
+            if event_id is None:
+                continue
+            event = self.by_id.get(event_id)
+            if event is None:
+                event = self.by_id[event_id] = {
+                    "event_id": event_id,
+                    "title": market.get("question") or "未知标题",
+                    "category": category_of(market),
+                    "outcomes": []
+                }
+            quote = outcome_quote(market)
+            event["outcomes"].append({
+                "condition_id": market.get("condition_id"),
+                "question": market.get("question"),
+                "token_id": quote["token_id"] if quote else None,
+                "price": quote["price"] if quote else 0.0,
+                "winner": quote["winner"] if quote else False,
+                "active": market.get("active", False),
+                "closed": market.get("closed", False),
+                "end_date": market.get("end_date_iso")
+            })
+
+        for event in self.by_id.values():
+            self._aggregate(event)
+        self.events: List[Dict] = list(self.by_id.values())
+
+    @staticmethod
+    def _aggregate(event: Dict):
+        """计算事件级汇总字段"""
+        outcomes = event["outcomes"]
+        price_sum = sum(outcome["price"] for outcome in outcomes)
+        leading = max(outcomes, key=lambda outcome: outcome["price"])
+        end_dates = [outcome["end_date"] for outcome in outcomes if outcome["end_date"]]
+        event.update(
+            market_count=len(outcomes),
+            active=any(outcome["active"] and not outcome["closed"] for outcome in outcomes),
+            closed=all(outcome["closed"] for outcome in outcomes),
+            price_sum=round(price_sum, 6),
+            # 溢价率：结果价格之和超出1的部分（负值表示低于1）
+            overround=round(price_sum - 1, 6),
+            leading_outcome={
+                "condition_id": leading["condition_id"],
+                "question": leading["question"],
+                "price": leading["price"]
+            },
+            end_date=max(end_dates) if end_dates else None
+        )
+
+    def get(self, event_id: str) -> Optional[Dict]:
+        return self.by_id.get(event_id)
+
+    def __len__(self) -> int:
+        return len(self.events)
@@ -0,0 +1,116 @@
+"""
+到期日历
+每份快照解析一次 end_date_iso 和 game_start_time，按时间排序后保存为数组；
+"N小时内到期/开赛" 的查询和按时间段的直方图通过二分查找回答，不必逐个解析全部市场
+"""
+
+import re
+import time
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+
+
+# 日历支持的时间字段：名称 -> 原始字段
+CALENDAR_FIELDS = {"end": "end_date_iso", "start": "game_start_time"}
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+_DURATION_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*$", re.IGNORECASE)
+# 时长上限（5年），更大的时间窗口没有意义，并且会让时间戳换算溢出
+MAX_DURATION = 5 * 365 * 86400
+
+
+def parse_duration(value) -> float:
+    """
+    解析时长（"90"、"30m"、"6h"、"2d"、"1w"，不带单位时为秒）
+
+    Raises:
+        ValueError: 格式不正确、不大于0或超过 MAX_DURATION
+    """
+    match = _DURATION_PATTERN.match(str(value))
+    if not match:
+        raise ValueError(f"无法解析时长: {value}")
+    seconds = float(match.group(1)) * _DURATION_UNITS[(match.group(2) or "s").lower()]
+    if seconds <= 0:
+        raise ValueError(f"时长必须大于0: {value}")
+    if seconds > MAX_DURATION:
+        raise ValueError(f"时长不能超过 {MAX_DURATION // (365 * 86400)} 年: {value}")
+    return seconds
+
+
+def parse_timestamp(value) -> float:
+    """ISO时间字符串转Unix时间戳（为空或无法解析时为NaN）"""
+    if not value:
+        return np.nan
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return np.nan
+
+
+class ExpiryCalendar:
+    """
+    单份市场列表上的时间索引（构建后只读）
+
+    对每个时间字段保存按市场顺序的时间戳数组（供分面等按行使用），
+    以及按时间排序的 (时间戳, 市场下标) 数组；已结算的市场不进入排序数组。
+    """
+
+    def __init__(self, markets: List[Dict]):
+        self.markets = markets
+        self.times: Dict[str, np.ndarray] = {}
+        self._sorted: Dict[str, tuple] = {}
+        open_rows = np.fromiter((not m.get("closed", False) for m in markets), dtype=bool, count=len(markets))
+        for name, field in CALENDAR_FIELDS.items():
+            times = np.fromiter((parse_timestamp(m.get(field)) for m in markets), dtype=float, count=len(markets))
+            self.times[name] = times
+            rows = np.flatnonzero(open_rows & ~np.isnan(times))
+            order = np.argsort(times[rows], kind="stable")
+            self._sorted[name] = (times[rows][order], rows[order])
+
+    @property
+    def end_times(self) -> np.ndarray:
+        return self.times["end"]
+
+    def window(self, field: str, within: float, now: float = None) -> np.ndarray:
+        """
+        时间落在 [now, now + within] 内的未结算市场下标（按时间从早到晚）
+
+        Args:
+            field: "end"（到期）或 "start"（比赛开始）
+            within: 时间窗口长度（秒）
+            now: 窗口起点（Unix时间戳，None表示当前时间）
+        """
+        now = time.time() if now is None else now
+        times, rows = self._sorted[field]
+        lo = np.searchsorted(times, now, side="left")
+        hi = np.searchsorted(times, now + within, side="right")
+        return rows[lo:hi]
+
+    def histogram(self, field: str, within: float, bucket: float, now: float = None,
+                  rows: np.ndarray = None) -> List[Dict]:
+        """
+        [now, now + within] 内按固定宽度时间段统计的未结算市场数
+
+        Args:
+            rows: 只统计这些市场（window 返回的按时间排序的下标，经过其他条件筛选后），None表示全部
+
+        Returns:
+            [{"start", "end", "count"}, ...]（start/end 为ISO时间）
+        """
+        now = time.time() if now is None else now
+        times = self._sorted[field][0] if rows is None else self.times[field][rows]
+        count = max(1, int(np.ceil(within / bucket)))
+        edges = now + bucket * np.arange(count + 1, dtype=float)
+        edges[-1] = now + within
+        positions = np.searchsorted(times, edges, side="left")
+        positions[-1] = np.searchsorted(times, edges[-1], side="right")
+        return [
+            {
+                "start": datetime.utcfromtimestamp(edges[i]).isoformat(),
+                "end": datetime.utcfromtimestamp(edges[i + 1]).isoformat(),
+                "count": int(positions[i + 1] - positions[i])
+            }
+            for i in range(len(edges) - 1)
+        ]
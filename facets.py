@@ -0,0 +1,148 @@
+"""
+分面计数
+在每份快照的字典编码列上为每个分类、标签、状态和到期时间段维护位图（NumPy 布尔数组），
+筛选条件按位图求交集；各分面的计数在同一遍中用 np.bincount 对编码列统计，
+不必为每个分面值重新筛选市场列表
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from expiry import parse_timestamp
+from interning import MarketColumns, STATUS_LABELS
+
+
+FACET_DIMENSIONS = ("category", "tag", "status", "end_date")
+
+# 状态分面的取值（与 STATUS_LABELS 中的编码一一对应）
+STATUS_VALUES = ("active", "inactive", "closed")
+
+# 到期时间段：(名称, 距现在的秒数上限)，已过期和没有到期时间的市场单独成段
+END_DATE_BUCKETS = (("expired", 0), ("24h", 86400), ("7d", 7 * 86400), ("30d", 30 * 86400), ("later", np.inf))
+END_DATE_VALUES = tuple(name for name, _ in END_DATE_BUCKETS) + ("none",)
+
+
+class FacetIndex:
+    """
+    单份市场列表上的分面位图（按需构建并缓存，到期时间段随查询时间计算）
+    """
+
+    def __init__(self, columns: MarketColumns, end_times: np.ndarray = None):
+        """
+        Args:
+            columns: 市场列表的字典编码列
+            end_times: 按市场顺序的到期时间戳（通常取自到期日历，None表示在此解析）
+        """
+        self.columns = columns
+        self.markets = columns.markets
+        if end_times is None:
+            end_times = np.fromiter((parse_timestamp(m.get("end_date_iso")) for m in columns.markets),
+                                    dtype=float, count=len(columns))
+        self.end_times = end_times
+        self._bitmaps: Dict[tuple, np.ndarray] = {}
+
+    def end_date_codes(self, now: float) -> np.ndarray:
+        """每个市场所在的到期时间段编码（END_DATE_VALUES 中的下标）"""
+        remaining = self.end_times - now
+        bounds = np.array([limit for _, limit in END_DATE_BUCKETS[:-1]], dtype=float)
+        codes = np.searchsorted(bounds, remaining, side="left")
+        codes[np.isnan(remaining)] = len(END_DATE_VALUES) - 1
+        return codes
+
+    def values(self, dimension: str) -> List[str]:
+        """分面的全部取值（与计数编码的顺序一致）"""
+        if dimension == "category":
+            return self.columns.categories.values
+        if dimension == "tag":
+            return self.columns.tags.values
+        if dimension == "status":
+            return list(STATUS_VALUES)
+        return list(END_DATE_VALUES)
+
+    def codes_of(self, dimension: str, value: str) -> List[int]:
+        """分面取值对应的编码（未知取值为空列表）"""
+        if dimension == "category":
+            return self.columns.categories.lookup(value, ignore_case=True)
+        if dimension == "tag":
+            return self.columns.tags.lookup(value)
+        if dimension == "status":
+            return self.columns.statuses.lookup(STATUS_LABELS[STATUS_VALUES.index(value)]) \
+                if value in STATUS_VALUES else []
+        return [END_DATE_VALUES.index(value)] if value in END_DATE_VALUES else []
+
+    def bitmap(self, dimension: str, code: int, end_codes: np.ndarray = None) -> np.ndarray:
+        """一个分面取值的位图（到期时间段依赖查询时间，不缓存）"""
+        if dimension == "end_date":
+            return end_codes == code
+        key = (dimension, code)
+        bitmap = self._bitmaps.get(key)
+        if bitmap is None:
+            if dimension == "tag":
+                bitmap = np.zeros(len(self.columns), dtype=bool)
+                bitmap[self.columns.tag_rows[self.columns.tag_codes == code]] = True
+            elif dimension == "category":
+                bitmap = self.columns.category_codes == code
+            else:
+                bitmap = self.columns.status_codes == code
+            self._bitmaps[key] = bitmap
+        return bitmap
+
+    def filter_mask(self, dimension: str, values: List[str], end_codes: np.ndarray) -> Optional[np.ndarray]:
+        """同一分面内多个取值取并集（没有条件时返回None）"""
+        if not values:
+            return None
+        mask = np.zeros(len(self.columns), dtype=bool)
+        for value in values:
+            for code in self.codes_of(dimension, value):
+                mask |= self.bitmap(dimension, code, end_codes)
+        return mask
+
+    def facets(self, filters: Dict[str, List[str]] = None, active_only: bool = False,
+               now: float = None) -> Dict:
+        """
+        计算当前筛选条件下每个分面取值的市场数
+
+        每个分面的计数应用其他分面的筛选条件、不应用自身的条件，
+        选中某个分类后仍能看到切换到其他分类时的数量。
+
+        Args:
+            filters: {分面: [取值, ...]}，同一分面内取并集，不同分面之间取交集
+            active_only: 只统计活跃且未结算的市场
+            now: 计算到期时间段的参考时间（Unix时间戳，None表示当前时间）
+
+        Returns:
+            {"total": 满足全部条件的市场数, "facets": {分面: [{"value", "count"}, ...]}}
+        """
+        filters = filters or {}
+        now = now if now is not None else datetime.now().timestamp()
+        columns = self.columns
+        end_codes = self.end_date_codes(now)
+        base = self.bitmap("status", 0) if active_only else np.ones(len(columns), dtype=bool)
+        masks = {dimension: self.filter_mask(dimension, filters.get(dimension), end_codes)
+                 for dimension in FACET_DIMENSIONS}
+
+        def combined(exclude: str = None) -> np.ndarray:
+            mask = base.copy()
+            for dimension, dimension_mask in masks.items():
+                if dimension != exclude and dimension_mask is not None:
+                    mask &= dimension_mask
+            return mask
+
+        codes = {"category": columns.category_codes, "status": columns.status_codes, "end_date": end_codes}
+        result = {}
+        for dimension in FACET_DIMENSIONS:
+            mask = combined(exclude=dimension)
+            values = self.values(dimension)
+            if dimension == "tag":
+                counts = np.bincount(columns.tag_codes[mask[columns.tag_rows]], minlength=len(values))
+            else:
+                counts = np.bincount(codes[dimension][mask], minlength=len(values))
+            entries = [{"value": value, "count": int(count)} for value, count in zip(values, counts)]
+            if dimension in ("category", "tag"):
+                # 分类和标签按数量排序并省略为0的取值；状态和到期时间段保持固定顺序
+                entries = sorted((e for e in entries if e["count"]), key=lambda e: e["count"], reverse=True)
+            result[dimension] = entries
+
+        return {"total": int(combined().sum()), "facets": result}
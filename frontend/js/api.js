@@ -102,6 +102,15 @@ class PolymarketAPI {
         return this.get('/markets/categories');
     }
 
+    /**
+     * 获取当前筛选条件下各分面取值的市场数
+     * @param {Object} params - 筛选条件（category、tag、status、end_date、active_only）
+     * @returns {Promise} 分面计数
+     */
+    async getMarketFacets(params = {}) {
+        return this.get('/markets/facets', params);
+    }
+
     /**
      * 获取市场统计信息
      * @returns {Promise} 统计数据
@@ -139,6 +148,15 @@ class PolymarketAPI {
         return this.get('/health');
     }
 
+    /**
+     * 就绪检查
+     * @param {boolean} deep - 是否附加上游连通性检查
+     * @returns {Promise} 就绪状态
+     */
+    async readinessCheck(deep = false) {
+        return this.get('/ready', deep ? { deep: 'true' } : {});
+    }
+
     /**
      * 获取系统状态
      * @returns {Promise} 系统状态
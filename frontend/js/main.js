@@ -126,23 +126,29 @@ function hideError() {
 }
 
 /**
- * 加载市场分类
+ * 加载市场分类（数量为当前筛选条件下的市场数）
  */
 async function loadCategories() {
     try {
-        const response = await window.polymarketAPI.getMarketCategories();
-        const categories = response.data.categories;
+        const params = {};
+        if (currentFilters.active_only) {
+            params.active_only = true;
+        }
+        const response = await window.polymarketAPI.getMarketFacets(params);
+        const categories = response.data.facets.category;
+        const selected = elements.categoryFilter.value;
 
         // 清空现有选项（保留"所有分类"）
-        elements.categoryFilter.innerHTML = '<option value="">所有分类</option>';
+        elements.categoryFilter.innerHTML = `<option value="">所有分类 (${response.data.total})</option>`;
 
         // 添加分类选项
         categories.forEach(category => {
             const option = document.createElement('option');
-            option.value = category.name;
-            option.textContent = `${category.display_name} (${category.count})`;
+            option.value = category.value;
+            option.textContent = `${window.polymarketAPI.getCategoryDisplayName(category.value)} (${category.count})`;
             elements.categoryFilter.appendChild(option);
         });
+        elements.categoryFilter.value = selected;
     } catch (error) {
         console.error('加载分类失败:', error);
     }
@@ -377,7 +383,8 @@ function applyFilters() {
     // 重置到第一页
     currentPage = 1;
 
-    // 重新加载数据
+    // 重新加载数据和分类计数
+    loadCategories();
     loadMarkets();
 }
 
@@ -395,7 +402,8 @@ function clearFilters() {
     currentFilters = {};
     currentPage = 1;
 
-    // 重新加载数据
+    // 重新加载数据和分类计数
+    loadCategories();
     loadMarkets();
 }
 
@@ -215,9 +215,9 @@ async function validateConfig() {
         }
 
         // 测试API连接
-        const healthResponse = await window.polymarketAPI.healthCheck();
+        const readyResponse = await window.polymarketAPI.readinessCheck(true);
 
-        if (healthResponse.success && healthResponse.data.clob_api_connected) {
+        if (readyResponse.success && readyResponse.data.clob_api_connected) {
             showSuccess('配置验证成功！API连接正常。');
         } else {
             showError('配置验证失败：API连接异常。');
@@ -240,9 +240,10 @@ async function checkSystemStatus() {
     try {
         const healthResponse = await window.polymarketAPI.healthCheck();
         const statusResponse = await window.polymarketAPI.getSystemStatus();
+        const readyResponse = await window.polymarketAPI.readinessCheck(true).catch(() => null);
 
         // 更新API状态
-        if (healthResponse.success && healthResponse.data.clob_api_connected) {
+        if (readyResponse && readyResponse.success && readyResponse.data.clob_api_connected) {
             elements.apiStatus.textContent = '在线';
             elements.apiStatus.className = 'badge bg-success';
         } else {
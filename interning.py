@@ -0,0 +1,166 @@
+"""
+重复字段的字符串驻留与字典编码
+上游JSON解码后，每个市场的标签、结果名称（"Yes"/"No"）、分类、到期时间等重复字符串都是独立对象。
+本模块在快照生成时把这些字段替换为同一份字符串，并为分类、标签、结果和状态构建字典编码列，
+按这些字段做等值筛选时比较整数编码，不必逐个提取市场信息
+"""
+
+from typing import Callable, Dict, Iterable, List
+
+import numpy as np
+
+
+# 直接驻留的顶层字符串字段（同一事件的市场通常共用描述、图标和到期时间）
+INTERNED_FIELDS = (
+    "category", "question", "description", "icon", "image", "end_date_iso", "game_start_time",
+    "accepting_order_timestamp", "neg_risk_market_id", "minimum_order_size", "minimum_tick_size"
+)
+
+# 状态编码对应 market_status 的显示文本
+STATUS_LABELS = ("活跃", "已关闭", "已结算")
+
+
+def intern_markets(markets: Iterable[Dict], pool: Dict[str, str] = None) -> Dict[str, str]:
+    """
+    原地驻留原始市场数据中的重复字符串（标签、代币结果名称和 INTERNED_FIELDS）
+
+    Args:
+        markets: 刚从上游解码的原始市场数据
+        pool: 字符串池（None表示新建），同一个池中相等的字符串只保留一份
+
+    Returns:
+        使用的字符串池
+    """
+    pool = {} if pool is None else pool
+    for market in markets:
+        for field in INTERNED_FIELDS:
+            value = market.get(field)
+            if isinstance(value, str):
+                market[field] = pool.setdefault(value, value)
+        tags = market.get("tags")
+        if tags:
+            tags[:] = [pool.setdefault(tag, tag) if isinstance(tag, str) else tag for tag in tags]
+        for token in market.get("tokens") or ():
+            outcome = token.get("outcome")
+            if isinstance(outcome, str):
+                token["outcome"] = pool.setdefault(outcome, outcome)
+    return pool
+
+
+class Dictionary:
+    """字典编码：值 <-> 从0开始的整数编码"""
+
+    def __init__(self, values: Iterable[str] = ()):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+        for value in values:
+            self.encode(value)
+
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value: str, ignore_case: bool = False) -> List[int]:
+        """值对应的编码（不存在时为空列表；忽略大小写时可能有多个）"""
+        if not ignore_case:
+            code = self.codes.get(value)
+            return [] if code is None else [code]
+        value = value.lower()
+        return [code for code, candidate in enumerate(self.values)
+                if isinstance(candidate, str) and candidate.lower() == value]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def _status_code(market: Dict) -> int:
+    if market.get("closed", False):
+        return 2
+    return 0 if market.get("active", False) else 1
+
+
+class MarketColumns:
+    """
+    单份市场列表上的字典编码列（构建后只读）
+
+    分类和状态每个市场一个编码；标签和代币结果每个市场有多个值，按CSR方式存储：
+    第 i 个市场的标签编码为 tag_codes[tag_offsets[i]:tag_offsets[i + 1]]。
+    """
+
+    def __init__(self, markets: List[Dict], category_of: Callable[[Dict], str] = None):
+        """
+        Args:
+            markets: 原始市场数据列表
+            category_of: 从原始市场数据推断分类的函数
+        """
+        category_of = category_of or (lambda market: market.get("category") or "other")
+        self.markets = markets
+        self.categories = Dictionary()
+        self.statuses = Dictionary(STATUS_LABELS)
+        self.tags = Dictionary()
+        self.outcomes = Dictionary()
+
+        count = len(markets)
+        self.category_codes = np.fromiter((self.categories.encode(category_of(m)) for m in markets),
+                                          dtype=np.int32, count=count)
+        self.status_codes = np.fromiter((_status_code(m) for m in markets), dtype=np.int8, count=count)
+        self.tag_offsets, self.tag_codes, self.tag_rows = self._encode_multi(
+            self.tags, ((tag for tag in m.get("tags") or () if isinstance(tag, str)) for m in markets), count)
+        self.outcome_offsets, self.outcome_codes, self.outcome_rows = self._encode_multi(
+            self.outcomes,
+            ((t.get("outcome") for t in m.get("tokens") or () if isinstance(t.get("outcome"), str)) for m in markets),
+            count)
+
+    @staticmethod
+    def _encode_multi(dictionary: Dictionary, rows: Iterable[Iterable[str]], count: int):
+        lengths = np.zeros(count + 1, dtype=np.int64)
+        codes = []
+        for i, values in enumerate(rows):
+            before = len(codes)
+            codes.extend(dictionary.encode(value) for value in values)
+            lengths[i + 1] = len(codes) - before
+        # 每个编码所属的市场下标，按多值列筛选或计数时使用
+        rows = np.repeat(np.arange(count), lengths[1:])
+        return np.cumsum(lengths), np.asarray(codes, dtype=np.int32), rows
+
+    def __len__(self) -> int:
+        return len(self.category_codes)
+
+    def _multi_mask(self, rows: np.ndarray, codes: np.ndarray, wanted: List[int]) -> np.ndarray:
+        """多值列中含有任一编码的市场"""
+        mask = np.zeros(len(self), dtype=bool)
+        mask[rows[np.isin(codes, wanted)]] = True
+        return mask
+
+    def mask(self, category: str = None, status: str = None, tag: str = None,
+             outcome: str = None) -> np.ndarray:
+        """
+        按编码做等值筛选（分类忽略大小写），多个条件取交集
+
+        Returns:
+            长度等于市场数的布尔数组
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if category:
+            mask &= np.isin(self.category_codes, self.categories.lookup(category, ignore_case=True))
+        if status:
+            mask &= np.isin(self.status_codes, self.statuses.lookup(status))
+        if tag:
+            mask &= self._multi_mask(self.tag_rows, self.tag_codes, self.tags.lookup(tag))
+        if outcome:
+            mask &= self._multi_mask(self.outcome_rows, self.outcome_codes, self.outcomes.lookup(outcome))
+        return mask
+
+    def select(self, category: str = None, status: str = None, tag: str = None,
+               outcome: str = None, active_only: bool = False) -> np.ndarray:
+        """
+        满足条件的市场下标（保持原顺序）
+
+        Args:
+            active_only: 只保留活跃且未结算的市场（等同于 status="活跃"）
+        """
+        return np.flatnonzero(self.mask(category, status or (STATUS_LABELS[0] if active_only else None),
+                                        tag, outcome))
@@ -0,0 +1,79 @@
+"""
+入站限流存储后端
+注册 file:// 存储方案，使 Flask-Limiter 的计数器可以在同一台机器的多个worker进程间共享。
+独立于 rate_limit 模块，避免CLI导入 limits 库
+"""
+
+import os
+import time
+import tempfile
+import urllib.parse
+from typing import Dict, Optional
+
+from limits.storage import Storage
+
+from rate_limit import _locked_json_file
+
+
+class FileStorage(Storage):
+    """
+    基于共享文件的限流存储（file:///path/to/state.json）
+
+    多个worker进程通过文件锁共享同一份计数器，适用于没有Redis的单机部署；
+    多机部署请使用 redis:// 存储。
+    """
+
+    STORAGE_SCHEME = ["file"]
+
+    def __init__(self, uri: str = None, wrap_exceptions: bool = False, **options):
+        parsed = urllib.parse.urlparse(uri or "")
+        self.path = parsed.path or os.path.join(tempfile.gettempdir(), "polymarket_ratelimit.json")
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return (OSError, ValueError)
+
+    @staticmethod
+    def _purge_expired(state: Dict, now: float):
+        """清理已过期的计数器"""
+        for key in [k for k, (_, expiry) in state.items() if expiry <= now]:
+            del state[key]
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        now = time.time()
+        with _locked_json_file(self.path) as state:
+            self._purge_expired(state, now)
+            count, expires_at = state.get(key, (0, now + expiry))
+            count += amount
+            state[key] = (count, expires_at)
+            return count
+
+    def get(self, key: str) -> int:
+        now = time.time()
+        with _locked_json_file(self.path) as state:
+            self._purge_expired(state, now)
+            return state.get(key, (0, now))[0]
+
+    def get_expiry(self, key: str) -> float:
+        now = time.time()
+        with _locked_json_file(self.path) as state:
+            self._purge_expired(state, now)
+            return state.get(key, (0, now))[1]
+
+    def check(self) -> bool:
+        try:
+            with _locked_json_file(self.path):
+                return True
+        except OSError:
+            return False
+
+    def reset(self) -> Optional[int]:
+        with _locked_json_file(self.path) as state:
+            count = len(state)
+            state.clear()
+            return count
+
+    def clear(self, key: str) -> None:
+        with _locked_json_file(self.path) as state:
+            state.pop(key, None)
@@ -7,9 +7,10 @@ Polymarket 市场数据获取工具 - 主入口
 import argparse
 import sys
 from datetime import datetime
+from typing import Iterable, Iterator
 
-from polymarket_markets import PolymarketMarketFetcher
 from config import config
+from table_render import TABLE_FORMATS
 
 
 def setup_argparse() -> argparse.ArgumentParser:
@@ -26,6 +27,15 @@ def setup_argparse() -> argparse.ArgumentParser:
   python main.py --category politics      # 只显示政治类市场
   python main.py --show-config            # 显示当前配置
   python main.py --api-url https://clob.polymarket.com  # 自定义API URL
+  python main.py --all --save-snapshot data/markets.json   # 获取全部市场并保存本地快照
+  python main.py --from-snapshot data/markets.json -l 20   # 从本地快照读取，不访问网络
+  python main.py --from-snapshot data/markets.json --max-age 600  # 快照超过10分钟时重新获取
+  python main.py --watch 10 -l 30         # 每10秒刷新前30个市场并高亮价格变动
+  python main.py --all --table-format plain | less -S   # 无边框格式，逐行输出到分页器
+  python main.py --scan -l 20             # 扫描全部市场，显示偏离最大的20个定价异常
+  python main.py -l 20 --active-only --volume  # 拉取成交记录和订单簿，显示24h成交额和流动性
+  python main.py --expiring 6h            # 6小时内到期的未结算市场（按到期时间排序）及分布
+  python main.py backfill --since 30d     # 回填全部代币30天的历史价格（可中断，重新运行时继续）
         """
     )
     
@@ -72,6 +82,66 @@ def setup_argparse() -> argparse.ArgumentParser:
         help="自定义CLOB API URL"
     )
     
+    parser.add_argument(
+        "--from-snapshot",
+        type=str,
+        metavar="PATH",
+        help="从本地快照文件读取市场（由 --save-snapshot 或Web应用的 SNAPSHOT_PATH 写入），不访问网络"
+    )
+    
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        metavar="SECONDS",
+        help="与 --from-snapshot 一起使用：快照超过该年龄（秒）或不存在时重新获取全部市场并写回快照文件"
+    )
+    
+    parser.add_argument(
+        "--save-snapshot",
+        type=str,
+        metavar="PATH",
+        help="将本次从上游获取的原始市场数据保存为本地快照文件"
+    )
+    
+    parser.add_argument(
+        "--watch",
+        type=float,
+        metavar="INTERVAL",
+        help="监控模式：每隔INTERVAL秒刷新一次，原地重绘表格并高亮价格变动（与 --from-snapshot 一起使用时监控快照文件）"
+    )
+    
+    parser.add_argument(
+        "--no-live-prices",
+        action="store_true",
+        help="不通过批量报价接口补充实时价格，只使用市场列表中的价格"
+    )
+    
+    parser.add_argument(
+        "--volume",
+        action="store_true",
+        help="为显示的活跃市场拉取最近成交记录和订单簿，显示24小时成交额和流动性（每个市场一次请求）"
+    )
+    
+    parser.add_argument(
+        "--scan",
+        action="store_true",
+        help="扫描全部市场的定价异常（互补代币或负风险事件的价格之和偏离1），按偏离幅度显示前N个"
+    )
+    
+    parser.add_argument(
+        "--expiring",
+        type=str,
+        metavar="DURATION",
+        help="显示DURATION内到期的未结算市场及按时间段的分布（如 90m、6h、2d；基于全部市场）"
+    )
+    
+    parser.add_argument(
+        "--table-format",
+        choices=TABLE_FORMATS,
+        default=config.get("table_format") if config.get("table_format") in TABLE_FORMATS else "grid",
+        help="表格格式：grid 带边框，plain 无边框（适合 less 等分页器和管道）"
+    )
+    
     parser.add_argument(
         "--verbose", "-v",
         action="store_true",
@@ -81,25 +151,277 @@ def setup_argparse() -> argparse.ArgumentParser:
     return parser
 
 
-def filter_markets_by_category(markets_info: list, category: str) -> list:
-    """按分类筛选市场"""
+def filter_markets_by_category(markets_info: Iterable[dict], category: str) -> Iterable[dict]:
+    """按分类筛选市场（惰性筛选，可直接接在逐个提取的生成器之后）"""
     if not category:
         return markets_info
     
-    filtered = [market for market in markets_info if market.get("category", "").lower() == category.lower()]
-    return filtered
+    return (market for market in markets_info if market.get("category", "").lower() == category.lower())
 
 
-def filter_active_markets(markets_info: list) -> list:
-    """筛选活跃市场"""
-    return [market for market in markets_info if market.get("active", False)]
+def filter_active_markets(markets_info: Iterable[dict]) -> Iterable[dict]:
+    """筛选活跃且未结算的市场（惰性筛选）"""
+    return (market for market in markets_info if market.get("active", False) and not market.get("closed", False))
+
+
+def load_local_snapshot(path: str, max_age: float = None):
+    """
+    加载本地快照文件
+    
+    Returns:
+        MarketSnapshot，文件不存在、无法解析或超过max_age时返回None
+    """
+    from snapshot import MarketSnapshot
+    
+    try:
+        snapshot = MarketSnapshot.load(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"无法读取本地快照 {path}: {e}")
+        return None
+    
+    if max_age is not None and snapshot.age > max_age:
+        print(f"本地快照已过期（{snapshot.age:.0f} 秒前获取，允许 {max_age:.0f} 秒）")
+        return None
+    return snapshot
+
+
+def select_markets(fetcher, markets: list, category: str = None, active_only: bool = False,
+                   limit: int = None) -> Iterator[dict]:
+    """
+    从原始市场列表中逐个提取并筛选，满足数量限制后立即停止
+    
+    本地快照通常包含全部市场，先筛选后截取，且不必提取整个快照。
+    """
+    selected = 0
+    for market in markets:
+        if active_only and not (market.get("active", False) and not market.get("closed", False)):
+            continue
+        market_info = fetcher.extract_market_info(market)
+        if category and market_info.get("category", "").lower() != category.lower():
+            continue
+        yield market_info
+        selected += 1
+        if limit and selected >= limit:
+            break
+
+
+def run_scan(markets: list, limit: int = None, table_format: str = "grid"):
+    """扫描定价异常并逐行显示"""
+    from scanner import MarketScanner
+    from table_render import StreamingTable
+    
+    scanner = MarketScanner()
+    result = scanner.scan(markets)
+    anomalies = result["anomalies"]
+    print(f"\n扫描 {result['scanned_markets']} 个市场，耗时 {result['duration_ms']:.1f} 毫秒，"
+          f"发现 {len(anomalies)} 个偏差不小于 {scanner.tolerance} 的定价异常")
+    if not anomalies:
+        return
+    
+    kinds = {"complement": "互补", "neg_risk": "负风险事件"}
+    table = StreamingTable(
+        ["序号", "类型", "标题", "价格之和", "偏差", "结果数"],
+        widths=[6, 10, None, 10, 10, 6], max_widths=[None, None, 60, None, None, None],
+        table_format=table_format
+    )
+    for i, anomaly in enumerate(anomalies[:limit] if limit else anomalies, 1):
+        table.add_row([
+            i, kinds[anomaly["kind"]], anomaly["title"], f"{anomaly['price_sum']:.4f}",
+            f"{anomaly['deviation']:+.4f}", anomaly["outcomes"]
+        ])
+    table.close()
+
+
+# 到期分布的时间段宽度候选（秒），取使时间段不超过24个的最小值
+HISTOGRAM_BUCKETS = (900, 3600, 6 * 3600, 86400, 7 * 86400, 30 * 86400)
+
+
+def format_remaining(seconds: float) -> str:
+    """剩余时间显示文本"""
+    minutes = int(seconds // 60)
+    days, minutes = divmod(minutes, 1440)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f"{days}天{hours}小时"
+    if hours:
+        return f"{hours}小时{minutes}分"
+    return f"{minutes}分"
+
+
+def run_expiring(fetcher, markets: list, within_text: str, category: str = None, limit: int = None,
+                 table_format: str = "grid"):
+    """显示指定时间内到期的未结算市场（按到期时间排序）和按时间段的分布"""
+    import time
+    from expiry import parse_duration
+    from polymarket_markets import market_status
+    from table_render import StreamingTable
+    
+    within = parse_duration(within_text)
+    now = time.time()
+    calendar = fetcher.expiry_calendar(markets)
+    rows = calendar.window("end", within, now)
+    if category:
+        rows = rows[fetcher.market_columns(markets).mask(category=category)[rows]]
+    print(f"\n{within_text} 内到期的未结算市场: {len(rows)} 个")
+    if not len(rows):
+        return
+    
+    bucket = next((b for b in HISTOGRAM_BUCKETS if within / b <= 24), within / 24)
+    histogram = calendar.histogram("end", within, bucket, now, rows=rows)
+    peak = max(entry["count"] for entry in histogram) or 1
+    table = StreamingTable(["时间段（UTC）", "市场数", "分布"], widths=[35, 8, 42], table_format=table_format)
+    for entry in histogram:
+        period = f"{entry['start'][5:16]} ~ {entry['end'][5:16]}".replace("T", " ")
+        table.add_row([period, entry["count"], "█" * round(40 * entry["count"] / peak)])
+    table.close()
+    
+    table = StreamingTable(
+        ["序号", "剩余时间", "到期时间", "标题", "分类", "价格", "状态"],
+        widths=[6, 12, 21, None, 10, 8, 8], max_widths=[None, None, None, 60, None, None, None],
+        table_format=table_format
+    )
+    shown = rows[:limit] if limit else rows
+    for i, (row, market_info) in enumerate(
+            zip(shown, fetcher.extract_markets_info([markets[r] for r in shown])), 1):
+        table.add_row([
+            i, format_remaining(calendar.times["end"][row] - now), market_info["end_date_formatted"],
+            market_info["title"], market_info["category"], f"{market_info['current_price']:.4f}",
+            market_status(market_info)
+        ])
+    table.close()
+
+
+def setup_backfill_argparse() -> argparse.ArgumentParser:
+    """backfill 子命令的参数解析"""
+    parser = argparse.ArgumentParser(
+        prog="main.py backfill",
+        description="从CLOB历史价格端点回填全部代币的历史价格到本地列式存储（中断后重新运行同一命令继续）",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用示例:
+  python main.py backfill                               # 回填全部代币最近30天的小时级历史价格
+  python main.py backfill --since 7d --fidelity 5       # 最近7天，每5分钟一个点
+  python main.py backfill --active-only -c 16           # 只回填活跃市场，16个并发请求
+  python main.py backfill --output data/history --restart   # 删除已有数据重新回填
+        """
+    )
+    parser.add_argument("--output", "-o", type=str, default="data/history", metavar="DIR",
+                        help="存储目录（默认: data/history），目录中已有数据时从检查点继续")
+    parser.add_argument("--since", type=str, default="30d", metavar="DURATION",
+                        help="回填的时间范围（如 6h、7d，默认: 30d；恢复时沿用首次运行的范围）")
+    parser.add_argument("--fidelity", type=int, default=60, metavar="MINUTES",
+                        help="历史价格粒度（分钟，默认: 60）")
+    parser.add_argument("--concurrency", "-c", type=int, default=None,
+                        help="同时请求的代币数（默认: BACKFILL_CONCURRENCY 或 8）")
+    parser.add_argument("--flush-rows", type=int, default=200000, metavar="ROWS",
+                        help="缓冲的价格点达到该数量时整批写入一个分块（默认: 200000）")
+    parser.add_argument("--category", type=str, help="只回填该分类的市场")
+    parser.add_argument("--active-only", action="store_true", help="只回填活跃且未结算的市场")
+    parser.add_argument("--limit", "-l", type=int, default=None, help="只回填前N个市场的代币")
+    parser.add_argument("--restart", action="store_true", help="删除存储目录中已有的数据，重新开始回填")
+    parser.add_argument("--api-url", type=str, help="自定义CLOB API URL")
+    parser.add_argument("--verbose", "-v", action="store_true", help="详细输出模式")
+    return parser
+
+
+def format_progress(progress) -> str:
+    """回填进度行"""
+    eta = progress.eta_seconds
+    eta_text = "-" if eta is None else (f"{eta:.0f}秒" if eta < 60 else format_remaining(eta))
+    finished = progress.skipped + progress.done + progress.failed
+    return (f"进度 {finished}/{progress.total} 个代币（本次完成 {progress.done}，失败 {progress.failed}，"
+            f"已写入 {progress.committed}），{progress.points} 个价格点，"
+            f"{progress.tokens_per_second:.1f} 代币/秒，{progress.points_per_second:.0f} 点/秒，预计剩余 {eta_text}")
+
+
+def run_backfill(argv: list):
+    """backfill 子命令：枚举市场代币并回填历史价格"""
+    import time
+    from backfill import HistoryBackfill, market_token_ids
+    from expiry import parse_duration
+    
+    parser = setup_backfill_argparse()
+    args = parser.parse_args(argv)
+    try:
+        since = parse_duration(args.since)
+    except ValueError as e:
+        parser.error(f"--since: {e}")
+    if args.fidelity <= 0:
+        parser.error("--fidelity 必须大于0")
+    if args.concurrency is not None and args.concurrency <= 0:
+        parser.error("--concurrency 必须大于0")
+    
+    from polymarket_markets import PolymarketMarketFetcher
+    from resilience import UpstreamUnavailableError
+    
+    if args.api_url:
+        config.set("clob_api_url", args.api_url)
+    fetcher = PolymarketMarketFetcher(
+        api_url=config.get("clob_api_url"),
+        timeout=config.get("request_timeout", 30),
+        max_retries=config.get("max_retries", 3),
+        archive_path=config.get("archive_path")
+    )
+    if args.verbose:
+        fetcher.logger.setLevel("DEBUG")
+    else:
+        # 每个请求一行的httpx日志会淹没进度输出
+        import logging
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+    
+    now = int(time.time())
+    backfill = HistoryBackfill(
+        fetcher, args.output, concurrency=args.concurrency, fidelity=args.fidelity,
+        start_ts=now - int(since), end_ts=now, flush_rows=args.flush_rows, restart=args.restart
+    )
+    
+    try:
+        # 只看活跃市场时不读取已结算市场归档
+        markets = fetcher.get_markets(include_archived=not args.active_only)
+    except UpstreamUnavailableError as e:
+        print(f"错误: 上游API不可用: {e}")
+        sys.exit(1)
+    markets = list(select_markets(fetcher, markets, category=args.category, active_only=args.active_only,
+                                  limit=args.limit))
+    token_ids = market_token_ids(markets)
+    
+    manifest = backfill.manifest
+    print(f"{'从检查点继续' if backfill.resumed else '开始'}回填 {len(markets)} 个市场的 {len(token_ids)} 个代币，"
+          f"时间范围 {datetime.fromtimestamp(manifest['start_ts']):%Y-%m-%d %H:%M} ~ "
+          f"{datetime.fromtimestamp(manifest['end_ts']):%Y-%m-%d %H:%M}，粒度 {manifest['fidelity']} 分钟，"
+          f"并发 {backfill.concurrency}，输出到 {args.output}")
+    summary = backfill.run(token_ids, progress=lambda progress: print(format_progress(progress)))
+    
+    if summary["interrupted"]:
+        print(f"\n回填已中断，已完成的 {summary['committed_tokens']} 个代币已写入；重新运行同一命令继续")
+        sys.exit(130)
+    print(f"\n回填完成: {summary['completed_tokens']} 个代币，{summary['points']} 个价格点，"
+          f"耗时 {summary['elapsed_seconds']:.1f} 秒")
+    if summary["failed_tokens"]:
+        print(f"{summary['failed_tokens']} 个代币获取失败，重新运行同一命令重试")
+        sys.exit(1)
 
 
 def main():
     """主函数"""
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        run_backfill(sys.argv[2:])
+        return
+    
     parser = setup_argparse()
     args = parser.parse_args()
     
+    if args.max_age is not None and not args.from_snapshot:
+        parser.error("--max-age 需要与 --from-snapshot 一起使用")
+    if args.watch is not None and args.watch <= 0:
+        parser.error("--watch 的刷新间隔必须大于0")
+    if args.expiring is not None:
+        from expiry import parse_duration
+        try:
+            parse_duration(args.expiring)
+        except ValueError as e:
+            parser.error(f"--expiring: {e}")
+    
     # 显示配置
     if args.show_config:
         config.print_config()
@@ -110,6 +432,10 @@ def main():
         print("配置验证失败，请检查环境变量设置")
         sys.exit(1)
     
+    # 数据获取相关模块（含py-clob-client）较重，只在确实需要获取数据时导入
+    from polymarket_markets import PolymarketMarketFetcher
+    from resilience import UpstreamUnavailableError
+    
     # 更新API URL（如果通过命令行指定）
     if args.api_url:
         config.set("clob_api_url", args.api_url)
@@ -123,47 +449,143 @@ def main():
     fetcher = PolymarketMarketFetcher(
         api_url=config.get("clob_api_url"),
         timeout=config.get("request_timeout", 30),
-        max_retries=config.get("max_retries", 3)
+        max_retries=config.get("max_retries", 3),
+        archive_path=config.get("archive_path")
     )
     
     # 设置日志级别
     if args.verbose:
         fetcher.logger.setLevel("DEBUG")
     
-    # 获取市场数据
     limit = None if args.all else args.limit
-    markets = fetcher.get_markets(limit)
     
-    if not markets:
-        print("错误: 未能获取到市场数据")
-        sys.exit(1)
+    # 监控模式：整个监控期间复用同一个获取器和上游连接
+    if args.watch is not None:
+        from watch import MarketWatcher, run_watch
+        
+        if not args.verbose:
+            # 日志输出（包括httpx的请求日志）会打断实时表格
+            import logging
+            logging.getLogger().setLevel(logging.WARNING)
+        watcher = MarketWatcher(
+            fetcher, limit=limit, category=args.category,
+            active_only=args.active_only, snapshot_path=args.from_snapshot,
+            enricher=None if args.no_live_prices or args.from_snapshot else fetcher.price_enricher
+        )
+        run_watch(watcher, args.watch)
+        return
     
-    # 提取关键信息
-    markets_info = []
-    for market in markets:
-        market_info = fetcher.extract_market_info(market)
-        markets_info.append(market_info)
+    # 本地快照模式：快照可用时不访问网络
+    snapshot = load_local_snapshot(args.from_snapshot, args.max_age) if args.from_snapshot else None
+    if args.from_snapshot and snapshot is None:
+        if args.max_age is None:
+            sys.exit(1)
+        # 设置了 --max-age：重新获取全部市场并写回快照文件
+        try:
+            snapshot = fetcher.refresh_snapshot()
+        except Exception as e:
+            print(f"错误: 上游API不可用: {e}")
+            sys.exit(1)
+        try:
+            snapshot.save(args.from_snapshot)
+            print(f"本地快照已更新: {args.from_snapshot}")
+        except OSError as e:
+            print(f"警告: 写入本地快照失败: {e}")
     
-    # 应用筛选条件
-    if args.category:
-        markets_info = filter_markets_by_category(markets_info, args.category)
-        print(f"按分类 '{args.category}' 筛选，剩余 {len(markets_info)} 个市场")
+    # 扫描和到期日历模式：始终基于全部市场，数量限制只作用于显示的结果
+    if args.scan or args.expiring:
+        if snapshot is not None:
+            markets = snapshot.markets
+        else:
+            try:
+                markets = fetcher.get_markets()
+            except UpstreamUnavailableError as e:
+                print(f"错误: 上游API不可用: {e}")
+                sys.exit(1)
+        if args.scan:
+            run_scan(markets, limit=limit, table_format=args.table_format)
+        else:
+            run_expiring(fetcher, markets, args.expiring, category=args.category, limit=limit,
+                         table_format=args.table_format)
+        print(f"\n完成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        return
+    
+    if snapshot is not None:
+        print(f"使用本地快照: {args.from_snapshot}（{snapshot.age:.0f} 秒前获取，共 {len(snapshot)} 个市场"
+              f"{'' if snapshot.complete else '，不完整'}）")
+        markets_info = select_markets(
+            fetcher, snapshot.markets, category=args.category,
+            active_only=args.active_only, limit=limit
+        )
+    else:
+        # 获取市场数据
+        try:
+            # 只看活跃市场时不读取已结算市场归档
+            markets = fetcher.get_markets(limit, include_archived=not args.active_only)
+        except UpstreamUnavailableError as e:
+            print(f"错误: 上游API不可用: {e}")
+            sys.exit(1)
+        
+        if not markets:
+            print("错误: 未能获取到市场数据")
+            sys.exit(1)
+        
+        if args.save_snapshot:
+            from snapshot import MarketSnapshot
+            
+            # 按数量提前停止翻页时获取器不保存截断的列表，直接保存本次获取的市场（标记为不完整）
+            saved = fetcher.snapshot
+            if saved is None or (limit and len(markets) >= limit):
+                saved = MarketSnapshot(markets, complete=False)
+            try:
+                saved.save(args.save_snapshot)
+                print(f"本地快照已保存到: {args.save_snapshot}")
+            except OSError as e:
+                print(f"警告: 写入本地快照失败: {e}")
+        
+        if fetcher.extract_workers > 1 and len(markets) >= fetcher.parallel_threshold:
+            # 市场数量很大时多进程批量提取
+            markets_info = fetcher.extract_markets_info(markets)
+        else:
+            # 边提取边筛选，表格逐行输出
+            markets_info = (fetcher.extract_market_info(market) for market in markets)
+        
+        # 应用筛选条件
+        if args.category:
+            markets_info = filter_markets_by_category(markets_info, args.category)
+            print(f"按分类 '{args.category}' 筛选")
+        
+        if args.active_only:
+            markets_info = filter_active_markets(markets_info)
+            print("只显示活跃市场")
+        
+        # 按块为活跃市场补充实时价格（本地快照模式不访问网络，不补充）
+        if not args.no_live_prices:
+            markets_info = fetcher.price_enricher.enrich_stream(markets_info)
+    
+    # 成交量需要先确定要显示的市场再批量拉取
+    if args.volume:
+        from rate_limit import PRIORITY_INTERACTIVE
+        
+        markets_info = list(markets_info)
+        tradable = [m for m in markets_info if m.get("active") and not m.get("closed")]
+        print(f"正在获取 {len(tradable)} 个活跃市场的成交记录和订单簿...")
+        fetcher.trade_tape.ingest(tradable, priority=PRIORITY_INTERACTIVE)
+        markets_info = fetcher.trade_tape.apply(markets_info)
     
-    if args.active_only:
-        markets_info = filter_active_markets(markets_info)
-        print(f"筛选活跃市场，剩余 {len(markets_info)} 个市场")
+    # 导出需要完整列表，否则直接流式显示
+    if args.export_json:
+        markets_info = list(markets_info)
     
     # 显示结果
-    if markets_info:
-        fetcher.display_markets_table(markets_info)
-        
-        # 导出数据
-        if args.export_json:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"polymarket_markets_{timestamp}.json"
-            fetcher.export_to_json(markets_info, filename)
-    else:
-        print("没有符合筛选条件的市场数据")
+    stats = fetcher.display_markets_table(markets_info, table_format=args.table_format,
+                                          show_volume=args.volume)
+    
+    # 导出数据
+    if args.export_json and stats.total:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"polymarket_markets_{timestamp}.json"
+        fetcher.export_to_json(markets_info, filename)
     
     print(f"\n完成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
@@ -0,0 +1,235 @@
+"""
+运行指标模块
+提供轻量的计数器、仪表和直方图，并以Prometheus文本格式导出
+
+指标保存在进程内存中；多worker部署时每个worker分别暴露自己的指标。
+"""
+
+import abc
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+
+# 默认延迟直方图分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    """转义标签值"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    """指标基类（子类实现 _samples 输出样本行）"""
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 registry: "Registry" = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    @abc.abstractmethod
+    def _samples(self) -> List[str]:
+        """当前样本行（调用时已持有锁）"""
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    metric_type = "counter"
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def sync(self, total: float, *labelvalues):
+        """从外部维护的累计值同步计数"""
+        with self._lock:
+            self._values[labelvalues] = total
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    """可任意设置的仪表"""
+
+    metric_type = "gauge"
+
+    def set(self, value: float, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class Histogram(_Metric):
+    """分桶直方图"""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS, registry: "Registry" = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labelvalues)
+            if series is None:
+                # [各分桶计数..., +Inf计数, 总和]
+                series = self._values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labelvalues):
+        """记录代码块耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for labels, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric):
+        self._metrics[metric.name] = metric
+
+    def register_collector(self, collector: Callable[[], None]):
+        """注册在导出前调用的回调（用于更新快照年龄等按需计算的仪表）"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """以Prometheus文本格式（0.0.4）导出全部指标"""
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ==================== 应用指标 ====================
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "polymarket_http_request_duration_seconds", "API请求处理耗时", ("route", "method", "status")
+)
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "polymarket_upstream_request_duration_seconds", "上游CLOB调用耗时（每次尝试）", ("endpoint",)
+)
+UPSTREAM_ERRORS = Counter(
+    "polymarket_upstream_errors_total", "上游CLOB调用失败次数（每次尝试）", ("endpoint", "error")
+)
+UPSTREAM_EVENTS = Counter(
+    "polymarket_upstream_events_total", "上游调用事件累计次数（重试、对冲、超时、回退缓存等）", ("event",)
+)
+CIRCUIT_TRANSITIONS = Counter(
+    "polymarket_circuit_breaker_transitions_total", "熔断器状态转换次数", ("transition",)
+)
+CIRCUIT_STATE = Gauge(
+    "polymarket_circuit_breaker_open", "熔断器状态（0关闭，0.5半开，1打开）"
+)
+EXTRACT_BATCH_SECONDS = Histogram(
+    "polymarket_extract_batch_duration_seconds", "批量提取市场信息耗时"
+)
+EXTRACT_MARKETS = Counter(
+    "polymarket_extract_markets_total", "已提取的市场数量"
+)
+SNAPSHOT_MARKETS = Gauge(
+    "polymarket_snapshot_markets", "当前快照中的市场数量", ("endpoint",)
+)
+SNAPSHOT_AGE_SECONDS = Gauge(
+    "polymarket_snapshot_age_seconds", "当前快照年龄（秒）", ("endpoint",)
+)
+TIER_MARKETS = Gauge(
+    "polymarket_refresh_tier_markets", "各刷新层级的市场数", ("tier",)
+)
+TIER_STALENESS_SECONDS = Gauge(
+    "polymarket_refresh_tier_max_staleness_seconds", "各刷新层级中距上次刷新最久的市场（秒）", ("tier",)
+)
+ARCHIVED_MARKETS = Gauge(
+    "polymarket_archived_markets", "已移入本地归档的已结算市场数量"
+)
+REPLICATION_LAG_SECONDS = Gauge(
+    "polymarket_replication_lag_seconds", "副本节点的复制延迟（秒）"
+)
+REPLICATION_VERSIONS_BEHIND = Gauge(
+    "polymarket_replication_versions_behind", "副本节点落后主节点的快照版本数"
+)
+SNAPSHOT_CACHE_REQUESTS = Counter(
+    "polymarket_snapshot_cache_requests_total", "市场列表请求的快照缓存结果（hit/miss/stale）", ("endpoint", "result")
+)
+PRICE_CACHE_REQUESTS = Counter(
+    "polymarket_price_cache_requests_total", "实时报价的代币缓存结果（hit/miss）", ("result",)
+)
+TRADES_INGESTED = Counter(
+    "polymarket_trades_ingested_total", "计入滚动成交量窗口的成交笔数"
+)
+ALERTS_TRIGGERED = Counter(
+    "polymarket_alerts_triggered_total", "触发的告警数", ("type",)
+)
+ALERT_WEBHOOK_DELIVERIES = Counter(
+    "polymarket_alert_webhook_deliveries_total", "告警Webhook推送结果（sent/failed/dropped）", ("result",)
+)
+SERIALIZE_SECONDS = Histogram(
+    "polymarket_json_serialize_duration_seconds", "JSON响应序列化耗时"
+)
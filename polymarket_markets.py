@@ -5,31 +5,121 @@ Polymarket Market Data Fetcher
 """
 
 import os
-import sys
 import json
+import time
 import logging
 import argparse
-from typing import List, Dict, Optional
+import itertools
+import threading
+from collections import Counter
+from functools import lru_cache
+from typing import TYPE_CHECKING, Iterable, List, Dict, Optional
 from datetime import datetime
 
-import requests
-from dotenv import load_dotenv
-from tabulate import tabulate
+from config import config
+from rate_limit import (
+    PRIORITY_INTERACTIVE, UpstreamRateLimitError, UpstreamScheduler, get_upstream_scheduler
+)
+from resilience import (
+    CircuitBreaker, CircuitOpenError, UpstreamUnavailableError,
+    backoff_delays, is_retryable, run_with_timeout
+)
+from snapshot import MarketSnapshot
+from archive import MarketArchive, is_resolved
+from pricing import PriceEnricher
+from events import EventIndex, event_id_of
+from trades import TradeTape
+from table_render import MarketStats, StreamingTable
+import metrics
+import profiling
 
-# 尝试导入py-clob-client，如果失败则提供安装提示
-try:
-    from py_clob_client.client import ClobClient
-    from py_clob_client.constants import AMOY
-except ImportError:
-    print("错误: 未找到py-clob-client库")
-    print("请运行: pip install py-clob-client")
-    sys.exit(1)
+if TYPE_CHECKING:
+    # 字典编码列、分面和到期日历依赖numpy，在第一次使用时才导入
+    from interning import MarketColumns
+    from facets import FacetIndex
+    from expiry import ExpiryCalendar
+
+# py-clob-client 等较重的依赖在首次使用时才导入，
+# 避免 --help、--show-config 和读取本地快照的调用承担约1秒的导入开销
+
+
+# CLOB分页起始游标（base64编码的偏移量"0"）
+START_CURSOR = "MA=="
+# CLOB分页结束游标（与 py_clob_client.constants.END_CURSOR 相同）
+END_CURSOR = "LTE="
+
+
+# 提取市场信息实际用到的原始字段（发送给子进程前只保留这些字段，减少序列化开销）
+EXTRACT_FIELDS = (
+    "question", "description", "question_id", "condition_id", "category", "end_date_iso",
+    "game_start_time", "active", "closed", "accepting_orders", "minimum_order_size",
+    "minimum_tick_size", "neg_risk", "neg_risk_market_id", "tags", "tokens"
+)
+
+_extract_pool = None
+_extract_pool_workers = 0
+_extract_pool_lock = threading.Lock()
+_worker_fetcher = None
+
+
+def _get_extract_pool(workers: int):
+    """获取进程共享的提取进程池（worker数量变化时重建）"""
+    global _extract_pool, _extract_pool_workers
+    with _extract_pool_lock:
+        if _extract_pool is None or _extract_pool_workers != workers:
+            if _extract_pool is not None:
+                _extract_pool.shutdown(wait=False)
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            
+            # 父进程中有后台线程（快照刷新、上游请求），fork可能继承被占用的锁，优先使用forkserver
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _extract_pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _extract_pool_workers = workers
+        return _extract_pool
+
+
+def _extract_chunk(chunk: List[Dict]) -> List[Dict]:
+    """
+    子进程中提取一批市场信息
+    
+    描述原样来自输入且通常是最大的字段，不再传回父进程，由父进程从原始数据补回。
+    """
+    global _worker_fetcher
+    if _worker_fetcher is None:
+        _worker_fetcher = PolymarketMarketFetcher()
+    results = []
+    for market in chunk:
+        market_info = _worker_fetcher.extract_market_info(market)
+        if "description" in market_info:
+            market_info["description"] = None
+        results.append(market_info)
+    return results
+
+
+@lru_cache(maxsize=4096)
+def _format_time(value: str) -> str:
+    """ISO时间转显示格式（无法解析时原样返回）；相同输入返回同一个字符串对象"""
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).strftime("%Y-%m-%d %H:%M:%S")
+    except (ValueError, AttributeError):
+        return value
+
+
+def market_status(market_info: Dict) -> str:
+    """市场状态显示文本"""
+    if market_info.get("closed", False):
+        return "已结算"
+    return "活跃" if market_info.get("active", False) else "已关闭"
 
 
 class PolymarketMarketFetcher:
     """Polymarket市场数据获取器"""
     
-    def __init__(self, api_url: str = None, timeout: int = 30, max_retries: int = 3):
+    def __init__(self, api_url: str = None, timeout: int = 30, max_retries: int = 3,
+                 scheduler: UpstreamScheduler = None, breaker: CircuitBreaker = None,
+                 hedge_delay: float = None, archive_path: str = None):
         """
         初始化市场数据获取器
         
@@ -37,12 +127,44 @@ class PolymarketMarketFetcher:
             api_url: CLOB API URL
             timeout: 请求超时时间（秒）
             max_retries: 最大重试次数
+            scheduler: 上游调用调度器（None表示使用进程共享的全局调度器）
+            breaker: 上游熔断器（None表示按配置创建）
+            hedge_delay: 对冲请求延迟（秒，0表示不对冲，None表示使用配置）
+            archive_path: 已结算市场归档文件（None表示不归档）
         """
         self.api_url = api_url or os.getenv("CLOB_API_URL", "https://clob.polymarket.com")
         self.timeout = timeout
         self.max_retries = max_retries
+        self.scheduler = scheduler or get_upstream_scheduler()
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=config.get("circuit_failure_threshold", 5),
+            reset_timeout=config.get("circuit_reset_timeout", 30)
+        )
+        self.hedge_delay = hedge_delay if hedge_delay is not None else config.get("hedge_delay", 0)
+        self.retry_backoff = config.get("retry_backoff", 0.5)
+        self.extract_workers = config.get("extract_workers") or os.cpu_count() or 1
+        self.parallel_threshold = config.get("extract_parallel_threshold", 20000)
+        self.upstream_stats = Counter()
+        self.snapshots: Dict[str, MarketSnapshot] = {}
+        # 快照更新回调 listener(endpoint, snapshot)，例如告警引擎
+        self.snapshot_listeners: List = []
+        # 副本节点的市场列表只由主节点推送（install_snapshot），读取时不访问上游
+        self.replica = False
+        self._event_index: Optional[EventIndex] = None
+        self._columns: Optional["MarketColumns"] = None
+        self._facet_index: Optional["FacetIndex"] = None
+        self._calendar: Optional["ExpiryCalendar"] = None
+        self._snapshot_lock = threading.Lock()
+        self._positions: Dict[str, tuple] = {}
+        self._last_ping = (None, False)
+        self._ping_lock = threading.Lock()
         self.client = None
         self.logger = self._setup_logging()
+        self.price_enricher = PriceEnricher(self)
+        self.trade_tape = TradeTape(self)
+        self.archive = MarketArchive(archive_path, category_of=self._extract_category) if archive_path else None
+        # 上次完整刷新时首次看到已结算的市场，下次刷新再归档（快照回调可以先看到状态变化）
+        self._resolving: set = set()
         
     def _setup_logging(self) -> logging.Logger:
         """设置日志记录"""
@@ -54,85 +176,475 @@ class PolymarketMarketFetcher:
     
     def initialize_client(self) -> bool:
         """初始化CLOB客户端"""
+        try:
+            from py_clob_client.client import ClobClient
+        except ImportError:
+            self.logger.error("未找到py-clob-client库，请运行: pip install py-clob-client")
+            return False
+        
         try:
             self.client = ClobClient(self.api_url)
+            self._apply_http_timeout()
             self.logger.info(f"成功连接到Polymarket CLOB API: {self.api_url}")
             return True
         except Exception as e:
             self.logger.error(f"初始化CLOB客户端失败: {e}")
             return False
     
-    def get_markets(self, limit: int = None) -> List[Dict]:
+    def _apply_http_timeout(self):
         """
-        获取完整市场列表（包含标题、价格等信息）
+        把单次调用超时设置到 py_clob_client 的HTTP客户端上
+
+        run_with_timeout 只是不再等待超时的调用，网络层也设置超时后，被放弃的调用才会结束并让出上游线程。
+        py_clob_client 的所有请求共用一个模块级 httpx 客户端，因此该设置对整个进程生效。
+        """
+        try:
+            from py_clob_client.http_helpers import helpers
+        except ImportError:
+            return
+        http_client = getattr(helpers, "_http_client", None)
+        if http_client is not None:
+            http_client.timeout = self.timeout
+    
+    @property
+    def snapshot(self) -> Optional[MarketSnapshot]:
+        """最近一次成功获取的完整市场列表快照"""
+        return self.snapshots.get("markets")
+    
+    def _call_upstream(self, endpoint: str, func, *args, priority: int = PRIORITY_INTERACTIVE):
+        """
+        经过调度器、熔断器、超时和重试执行一次CLOB调用
         
         Args:
-            limit: 限制返回的市场数量（None表示获取所有）
+            endpoint: 上游端点名称（用于日志）
+            func: 实际执行调用的函数
+            priority: 调用优先级
             
         Returns:
-            市场数据列表
+            上游响应
         """
-        if not self.client:
-            if not self.initialize_client():
-                return []
+        if not self.breaker.allow_request():
+            self.upstream_stats["circuit_rejected"] += 1
+            raise CircuitOpenError(f"上游熔断中，暂停调用: {endpoint}")
         
-        try:
-            self.logger.info("正在获取完整市场列表...")
-            markets_data = self.client.get_markets()
+        delays = backoff_delays(self.max_retries, base=self.retry_backoff)
+        while True:
+            if not self.scheduler.acquire(priority=priority, timeout=self.timeout):
+                self.breaker.release()
+                raise UpstreamRateLimitError(f"等待上游配额超时: {endpoint}")
             
+            started = time.perf_counter()
+            try:
+                result = run_with_timeout(
+                    lambda: func(*args),
+                    self.timeout,
+                    hedge_delay=self.hedge_delay,
+                    can_hedge=lambda: self.scheduler.acquire(priority=priority, timeout=0),
+                    stats=self.upstream_stats
+                )
+            except Exception as e:
+                metrics.UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint)
+                metrics.UPSTREAM_ERRORS.inc(endpoint, type(e).__name__)
+                if not is_retryable(e):
+                    # 上游已正常响应（如4xx），不计入熔断
+                    self.breaker.record_success()
+                    raise
+                
+                delay = next(delays, None)
+                if delay is None:
+                    self.upstream_stats["failures"] += 1
+                    self.breaker.record_failure()
+                    raise
+                
+                self.upstream_stats["retries"] += 1
+                self.logger.warning(f"调用上游 {endpoint} 失败，{delay:.2f} 秒后重试: {e}")
+                time.sleep(delay)
+                continue
+            
+            metrics.UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint)
+            self.breaker.record_success()
+            return result
+    
+    def _market_list_source(self, endpoint: str):
+        """返回市场列表端点的描述和按游标分页的调用函数"""
+        sources = {
+            "markets": ("完整市场列表", lambda cursor: self.client.get_markets(next_cursor=cursor)),
+            "simplified-markets": (
+                "简化市场列表", lambda cursor: self.client.get_simplified_markets(next_cursor=cursor)
+            ),
+        }
+        return sources[endpoint]
+    
+    def refresh_snapshot(self, endpoint: str = "markets", priority: int = PRIORITY_INTERACTIVE,
+                         max_markets: int = None) -> MarketSnapshot:
+        """
+        按游标逐页从上游拉取市场列表并更新快照（失败时直接抛出异常，不回退缓存）
+        
+        Args:
+            endpoint: "markets" 或 "simplified-markets"
+            priority: 上游调用优先级
+            max_markets: 获取到该数量后停止翻页（None表示获取所有页）
+            
+        Returns:
+            新的市场快照；因 max_markets 提前停止翻页时只返回给调用方，
+            不替换共享快照、不通知快照回调（截断的列表不能代表完整的市场集合）
+        """
+        if not self.client and not self.initialize_client():
+            raise UpstreamUnavailableError("CLOB客户端初始化失败")
+        
+        description, func = self._market_list_source(endpoint)
+        self.logger.info(f"正在获取{description}...")
+        
+        markets = []
+        cursor = START_CURSOR
+        complete = True
+        while True:
+            markets_data = self._call_upstream(endpoint, func, cursor, priority=priority)
             if not markets_data or "data" not in markets_data:
-                self.logger.warning("未获取到市场数据")
-                return []
+                break
             
-            markets = markets_data["data"]
+            markets.extend(markets_data["data"])
+            cursor = markets_data.get("next_cursor")
+            if not cursor or cursor == END_CURSOR:
+                break
+            if max_markets and len(markets) >= max_markets:
+                complete = False
+                break
+        
+        if markets:
             self.logger.info(f"成功获取到 {len(markets)} 个市场")
+        else:
+            self.logger.warning("未获取到市场数据")
+        
+        # 重复字符串（标签、结果名称、分类、到期时间等）每份快照只保留一份
+        from interning import intern_markets
+        intern_markets(markets)
+        if not complete:
+            return MarketSnapshot(markets, complete=False)
+        if endpoint == "markets" and self.archive is not None:
+            markets = self._partition(markets)
+        
+        snapshot = MarketSnapshot(markets, complete=complete)
+        with self._snapshot_lock:
+            self.snapshots[endpoint] = snapshot
+        self._notify_listeners(endpoint, snapshot)
+        return snapshot
+    
+    def _partition(self, markets: List[Dict]) -> List[Dict]:
+        """
+        把已结算市场移入归档，返回留在内存中的市场
+        
+        只对完整的市场列表调用。已归档的市场直接丢弃；新出现的已结算市场先在快照中保留一个刷新周期，
+        下次完整刷新时再归档（首次刷新时直接归档）。待归档集合按本轮结果合并更新：
+        本轮归档的市场移出，新出现的加入，其余保留。
+        """
+        first = self.snapshots.get("markets") is None
+        hot = []
+        resolved = []
+        resolving = set()
+        for market in markets:
+            if is_resolved(market):
+                condition_id = market.get("condition_id")
+                if condition_id in self.archive:
+                    continue
+                if first or condition_id in self._resolving:
+                    resolved.append(market)
+                    continue
+                resolving.add(condition_id)
+            hot.append(market)
+        self._resolving = (self._resolving - {market.get("condition_id") for market in resolved}) | resolving
+        
+        try:
+            archived = self.archive.add_many(resolved)
+        except OSError as e:
+            # 写入失败时本轮仍保留在内存中，下次刷新重试
+            self.logger.error(f"写入已结算市场归档失败: {e}")
+            self._resolving |= {market.get("condition_id") for market in resolved}
+            return hot + resolved
+        if archived:
+            self.logger.info(f"已归档 {archived} 个已结算市场，内存中保留 {len(hot)} 个市场")
+        return hot
+    
+    def replace_markets(self, endpoint: str, updates: Dict[str, Dict]) -> Optional[MarketSnapshot]:
+        """
+        用单独获取的市场数据替换快照中的对应市场，生成新的快照版本
+        
+        新快照保留原快照的拉取时间和完整性标记（快照年龄仍表示完整列表的年龄）；
+        不在快照中的市场忽略。
+        
+        Args:
+            endpoint: "markets" 或 "simplified-markets"
+            updates: {condition_id: 原始市场数据}
             
-            # 如果指定了限制，则截取前N个市场
-            if limit and len(markets) > limit:
-                markets = markets[:limit]
-                self.logger.info(f"限制显示前 {limit} 个市场")
+        Returns:
+            新快照，没有可替换的市场时返回None
+        """
+        with self._snapshot_lock:
+            current = self.snapshots.get(endpoint)
+            if current is None or not updates:
+                return None
+            positions = self._positions.get(endpoint)
+            if positions is None or positions[0] is not current.markets:
+                positions = (current.markets, {m.get("condition_id"): i for i, m in enumerate(current.markets)})
+            index = positions[1]
             
-            return markets
+            markets = list(current.markets)
+            changes = {}
+            for condition_id, market in updates.items():
+                i = index.get(condition_id)
+                if i is not None:
+                    markets[i] = market
+                    changes[condition_id] = market
+            if not changes:
+                return None
             
-        except Exception as e:
-            self.logger.error(f"获取市场数据失败: {e}")
-            return []
+            # 快照回调按 changes 只处理被替换的市场，价格时间按合并时刻记录
+            snapshot = MarketSnapshot(markets, fetched_at=current.fetched_at, complete=current.complete,
+                                      updated_at=time.time(), changes=changes)
+            self.snapshots[endpoint] = snapshot
+            # 位置不变，索引直接沿用到新列表
+            self._positions[endpoint] = (markets, index)
+        self._notify_listeners(endpoint, snapshot)
+        return snapshot
     
-    def get_simplified_markets(self, limit: int = None) -> List[Dict]:
+    def install_snapshot(self, endpoint: str, snapshot: MarketSnapshot):
         """
-        获取简化市场列表（仅包含基本信息）
+        安装从其他节点收到的快照（副本节点应用主节点发布的版本），并通知快照回调
+        
+        Args:
+            endpoint: "markets" 或 "simplified-markets"
+            snapshot: 新快照（保留主节点的拉取时间）
+        """
+        from interning import intern_markets
+        intern_markets(snapshot.markets)
+        with self._snapshot_lock:
+            self.snapshots[endpoint] = snapshot
+        self._notify_listeners(endpoint, snapshot)
+    
+    def _notify_listeners(self, endpoint: str, snapshot: MarketSnapshot):
+        for listener in self.snapshot_listeners:
+            try:
+                listener(endpoint, snapshot)
+            except Exception as e:
+                self.logger.warning(f"快照更新回调执行失败: {e}")
+    
+    def _fetch_market_list(self, endpoint: str, limit: int = None,
+                           priority: int = PRIORITY_INTERACTIVE, max_age: float = None) -> List[Dict]:
+        """
+        获取市场列表：快照足够新时直接复用，否则拉取上游，失败时回退到最近一次成功的快照
+        
+        Raises:
+            UpstreamUnavailableError: 上游不可用且没有缓存快照
+        """
+        cached = self.snapshots.get(endpoint)
+        if self.replica and endpoint == "markets":
+            # 副本节点不论快照年龄都直接使用（复制延迟见 /api/v1/status 的 replication）
+            if cached is None:
+                raise UpstreamUnavailableError("副本节点尚未从主节点收到快照")
+            metrics.SNAPSHOT_CACHE_REQUESTS.inc(endpoint, "hit")
+            markets = cached.markets
+        elif (max_age is not None and cached is not None and cached.age <= max_age
+                and (cached.complete or (limit and len(cached) >= limit))):
+            metrics.SNAPSHOT_CACHE_REQUESTS.inc(endpoint, "hit")
+            markets = cached.markets
+        else:
+            metrics.SNAPSHOT_CACHE_REQUESTS.inc(endpoint, "miss")
+            try:
+                markets = self.refresh_snapshot(endpoint, priority=priority, max_markets=limit).markets
+            except Exception as e:
+                self.logger.error(f"获取市场数据失败: {e}")
+                cached = self.snapshots.get(endpoint)
+                if cached is None:
+                    raise UpstreamUnavailableError(f"上游不可用且无缓存数据: {e}") from e
+                
+                metrics.SNAPSHOT_CACHE_REQUESTS.inc(endpoint, "stale")
+                self.upstream_stats["stale_served"] += 1
+                self.logger.warning(f"上游不可用，使用 {cached.age:.0f} 秒前的缓存快照")
+                markets = cached.markets
+        
+        # 如果指定了限制，则截取前N个市场
+        if limit and len(markets) > limit:
+            markets = markets[:limit]
+            self.logger.info(f"限制显示前 {limit} 个市场")
+        
+        return markets
+    
+    def ping_upstream(self, max_age: float = 30) -> bool:
+        """
+        轻量检查上游连通性（请求CLOB根路径，不下载市场数据）
+        
+        Args:
+            max_age: 复用上次检查结果的最长时间（秒），用于限制检查频率
+            
+        Returns:
+            上游是否可达
+        """
+        with self._ping_lock:
+            checked_at, connected = self._last_ping
+            if checked_at is not None and time.monotonic() - checked_at < max_age:
+                return connected
+            
+            try:
+                if not self.client and not self.initialize_client():
+                    raise UpstreamUnavailableError("CLOB客户端初始化失败")
+                self._call_upstream("ok", self.client.get_ok)
+                connected = True
+            except Exception as e:
+                self.logger.warning(f"上游连通性检查失败: {e}")
+                connected = False
+            
+            self._last_ping = (time.monotonic(), connected)
+            return connected
+    
+    def get_markets(self, limit: int = None, priority: int = PRIORITY_INTERACTIVE,
+                    max_age: float = None, include_archived: bool = False) -> List[Dict]:
+        """
+        获取完整市场列表（包含标题、价格等信息）
         
         Args:
             limit: 限制返回的市场数量（None表示获取所有）
+            priority: 上游调用优先级（后台任务使用PRIORITY_BACKGROUND）
+            max_age: 可直接复用的快照最大年龄（秒，None表示总是请求上游）
+            include_archived: 是否在内存中的市场之后追加已归档的已结算市场（从本地归档读取）
             
         Returns:
             市场数据列表
+            
+        Raises:
+            UpstreamUnavailableError: 上游不可用且没有缓存快照
+        """
+        markets = self._fetch_market_list("markets", limit=limit, priority=priority, max_age=max_age)
+        if include_archived and self.archive is not None and len(self.archive):
+            remaining = limit - len(markets) if limit else None
+            if remaining is None or remaining > 0:
+                markets = markets + list(itertools.islice(self.archive.iter_markets(), remaining))
+        return markets
+    
+    def get_event_index(self, priority: int = PRIORITY_INTERACTIVE, max_age: float = None) -> EventIndex:
         """
-        if not self.client:
-            if not self.initialize_client():
-                return []
+        获取负风险多结果事件索引（每份快照只构建一次）
         
-        try:
-            self.logger.info("正在获取简化市场列表...")
-            markets_data = self.client.get_simplified_markets()
-            
-            if not markets_data or "data" not in markets_data:
-                self.logger.warning("未获取到市场数据")
-                return []
+        Args:
+            priority: 上游调用优先级
+            max_age: 可直接复用的快照最大年龄（秒，None表示总是请求上游）
             
-            markets = markets_data["data"]
-            self.logger.info(f"成功获取到 {len(markets)} 个市场")
+        Raises:
+            UpstreamUnavailableError: 上游不可用且没有缓存快照
+        """
+        markets = self._fetch_market_list("markets", priority=priority, max_age=max_age)
+        index = self._event_index
+        if index is None or index.markets is not markets:
+            index = self._event_index = EventIndex(markets, category_of=self._extract_category)
+        return index
+    
+    def market_columns(self, markets: List[Dict]) -> "MarketColumns":
+        """
+        市场列表的字典编码列（同一个列表对象只构建一次，通常就是当前快照）
+        
+        Args:
+            markets: get_markets 返回的原始市场数据列表
+        """
+        from interning import MarketColumns
+
+        columns = self._columns
+        if columns is None or columns.markets is not markets:
+            columns = self._columns = MarketColumns(markets, category_of=self._extract_category)
+        return columns
+    
+    def expiry_calendar(self, markets: List[Dict]) -> "ExpiryCalendar":
+        """市场列表的到期/开赛时间索引（同一个列表对象只构建一次）"""
+        from expiry import ExpiryCalendar
+
+        calendar = self._calendar
+        if calendar is None or calendar.markets is not markets:
+            calendar = self._calendar = ExpiryCalendar(markets)
+        return calendar
+    
+    def facet_index(self, markets: List[Dict]) -> "FacetIndex":
+        """市场列表的分面位图（与字典编码列一起按列表对象缓存）"""
+        from facets import FacetIndex
+
+        columns = self.market_columns(markets)
+        index = self._facet_index
+        if index is None or index.columns is not columns:
+            index = self._facet_index = FacetIndex(columns, self.expiry_calendar(markets).end_times)
+        return index
+    
+    def get_simplified_markets(self, limit: int = None, priority: int = PRIORITY_INTERACTIVE,
+                               max_age: float = None) -> List[Dict]:
+        """
+        获取简化市场列表（仅包含基本信息）
+        
+        Args:
+            limit: 限制返回的市场数量（None表示获取所有）
+            priority: 上游调用优先级（后台任务使用PRIORITY_BACKGROUND）
+            max_age: 可直接复用的快照最大年龄（秒，None表示总是请求上游）
             
-            # 如果指定了限制，则截取前N个市场
-            if limit and len(markets) > limit:
-                markets = markets[:limit]
-                self.logger.info(f"限制显示前 {limit} 个市场")
+        Returns:
+            市场数据列表
             
-            return markets
+        Raises:
+            UpstreamUnavailableError: 上游不可用且没有缓存快照
+        """
+        return self._fetch_market_list(
+            "simplified-markets", limit=limit, priority=priority, max_age=max_age
+        )
+    
+    def extract_markets_info(self, markets: List[Dict], workers: int = None) -> List[Dict]:
+        """
+        批量提取市场信息
+        
+        数量达到 parallel_threshold 且有多个worker时，分块交给进程池并行提取，
+        否则（或进程池不可用时）在当前进程中串行提取。
+        
+        Args:
+            markets: 原始市场数据列表
+            workers: 并行进程数（None表示使用 extract_workers，1表示强制串行）
             
+        Returns:
+            提取后的市场信息列表（顺序与输入一致）
+        """
+        workers = self.extract_workers if workers is None else workers
+        with metrics.EXTRACT_BATCH_SECONDS.time(), profiling.stage("extract"):
+            markets_info = None
+            if workers > 1 and len(markets) >= self.parallel_threshold:
+                markets_info = self._extract_parallel(markets, workers)
+            if markets_info is None:
+                markets_info = [self.extract_market_info(market) for market in markets]
+        metrics.EXTRACT_MARKETS.inc(amount=len(markets_info))
+        return markets_info
+    
+    def _extract_parallel(self, markets: List[Dict], workers: int) -> Optional[List[Dict]]:
+        """
+        多进程分块提取，按原顺序合并结果
+        
+        Returns:
+            提取结果，进程池不可用时返回None（由调用方回退到串行）
+        """
+        # 每个worker分到多个块，避免单个慢块拖住整体
+        chunk_size = max(1000, len(markets) // (workers * 4) + 1)
+        chunks = [
+            [{key: market[key] for key in EXTRACT_FIELDS if key in market}
+             for market in markets[start:start + chunk_size]]
+            for start in range(0, len(markets), chunk_size)
+        ]
+        try:
+            pool = _get_extract_pool(workers)
+            results = list(pool.map(_extract_chunk, chunks))
         except Exception as e:
-            self.logger.error(f"获取市场数据失败: {e}")
-            return []
+            self.logger.warning(f"并行提取失败，回退到串行提取: {e}")
+            return None
+        
+        markets_info = [market_info for result in results for market_info in result]
+        # 子进程中没有成交记录，成交量字段在父进程中补上
+        has_volume = bool(self.trade_tape.markets or self.trade_tape.liquidity)
+        now = time.time()
+        for market, market_info in zip(markets, markets_info):
+            if "description" in market_info:
+                market_info["description"] = market.get("description", "无描述")
+            if has_volume and "condition_id" in market_info:
+                market_info.update(self.trade_tape.volume_fields(market_info["condition_id"], now))
+        return markets_info
     
     def extract_market_info(self, market: Dict) -> Dict:
         """
@@ -155,8 +667,8 @@ class PolymarketMarketFetcher:
                 "market_id": market.get("question_id", market.get("condition_id", "未知ID")),
                 "condition_id": market.get("condition_id", "未知条件ID"),
                 "category": self._extract_category(market),
-                "volume": 0,  # 完整API响应中没有成交量数据
-                "liquidity": 0,  # 完整API响应中没有流动性数据
+                # 市场列表不含成交量和流动性，取自成交记录和订单簿（未拉取过的市场为0）
+                **self.trade_tape.volume_fields(market.get("condition_id")),
                 "end_date": market.get("end_date_iso"),
                 "game_start_time": market.get("game_start_time"),
                 "active": market.get("active", False),
@@ -165,6 +677,7 @@ class PolymarketMarketFetcher:
                 "minimum_order_size": market.get("minimum_order_size", 0),
                 "minimum_tick_size": market.get("minimum_tick_size", 0),
                 "neg_risk": market.get("neg_risk", False),
+                "event_id": event_id_of(market),
                 "tags": market.get("tags", [])
             }
             
@@ -206,6 +719,7 @@ class PolymarketMarketFetcher:
                 else:
                     market_info["price_range"] = "无数据"
                 market_info["total_tokens"] = len(tokens)
+                market_info["token_ids"] = [token.get("token_id") for token in tokens if token.get("token_id")]
                 
                 # 如果有赢家，显示获胜结果
                 winners = [token for token in tokens if token.get("winner", False)]
@@ -220,25 +734,18 @@ class PolymarketMarketFetcher:
                 market_info["winner"] = False
                 market_info["price_range"] = "无数据"
                 market_info["total_tokens"] = 0
+                market_info["token_ids"] = []
                 market_info["winning_outcome"] = "无数据"
             
-            # 格式化日期
+            # 格式化日期（大量市场共用同一到期时间，格式化结果缓存复用）
             if market_info["end_date"]:
-                try:
-                    end_date = datetime.fromisoformat(market_info["end_date"].replace('Z', '+00:00'))
-                    market_info["end_date_formatted"] = end_date.strftime("%Y-%m-%d %H:%M:%S")
-                except:
-                    market_info["end_date_formatted"] = market_info["end_date"]
+                market_info["end_date_formatted"] = _format_time(market_info["end_date"])
             else:
                 market_info["end_date_formatted"] = "无到期时间"
             
             # 格式化游戏开始时间
             if market_info["game_start_time"]:
-                try:
-                    start_time = datetime.fromisoformat(market_info["game_start_time"].replace('Z', '+00:00'))
-                    market_info["game_start_formatted"] = start_time.strftime("%Y-%m-%d %H:%M:%S")
-                except:
-                    market_info["game_start_formatted"] = market_info["game_start_time"]
+                market_info["game_start_formatted"] = _format_time(market_info["game_start_time"])
             else:
                 market_info["game_start_formatted"] = "无开始时间"
             
@@ -286,78 +793,82 @@ class PolymarketMarketFetcher:
         else:
             return "other"
     
-    def display_markets_table(self, markets_info: List[Dict], show_all: bool = False):
+    def display_markets_table(self, markets_info: Iterable[Dict], show_all: bool = False,
+                              table_format: str = "grid", show_volume: bool = False) -> MarketStats:
         """
         以表格形式显示市场信息
         
+        逐行输出，不等待全部市场提取完成；统计信息在同一遍遍历中累计。
+        
         Args:
-            markets_info: 市场信息列表
+            markets_info: 市场信息列表或迭代器（可以是边提取边产出的生成器）
             show_all: 是否显示所有字段
+            table_format: "grid"（带边框）或 "plain"（无边框，适合分页器和管道）
+            show_volume: 是否显示24小时成交额和流动性列
+            
+        Returns:
+            已显示市场的统计信息
         """
-        if not markets_info:
+        stats = MarketStats()
+        iterator = iter(markets_info)
+        first = next(iterator, None)
+        if first is None:
             print("没有可显示的市场数据")
-            return
-        
-        # 准备表格数据
-        table_data = []
-        for i, market in enumerate(markets_info, 1):
-            # 截断标题以适应表格
-            title = market["title"]
-            if len(title) > 60:
-                title = title[:57] + "..."
-            
-            # 状态显示
-            status = "活跃" if market.get("active", False) else "已关闭"
-            if market.get("closed", False):
-                status = "已结算"
-            
-            row = [
-                i,
-                title,
-                f"${market['current_price']:.4f}",
-                market["price_range"],
-                market["category"],
-                market["end_date_formatted"],
-                status,
-                market["total_tokens"]
-            ]
-            table_data.append(row)
+            return stats
         
         # 表格标题
         headers = ["序号", "标题", "当前价格", "价格区间", "分类", "到期时间", "状态", "选项数"]
+        widths = [6, None, 10, 15, None, 19, 6, 6]
+        max_widths = [None, 60, None, None, 12, None, None, None]
+        if show_volume:
+            headers[4:4] = ["24h成交额", "流动性"]
+            widths[4:4] = [14, 14]
+            max_widths[4:4] = [None, None]
+        table = StreamingTable(headers, widths=widths, max_widths=max_widths, table_format=table_format)
         
         # 显示表格
+        total = f" (共 {len(markets_info)} 个市场)" if hasattr(markets_info, "__len__") else ""
         print(f"\n{'='*140}")
-        print(f"Polymarket 预测市场列表 (共 {len(markets_info)} 个市场)")
+        print(f"Polymarket 预测市场列表{total}")
         print(f"更新时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"{'='*140}")
         
-        print(tabulate(table_data, headers=headers, tablefmt="grid", stralign="left"))
-        
-        # 显示统计信息
-        active_markets = sum(1 for market in markets_info if market.get("active", False))
-        closed_markets = sum(1 for market in markets_info if market.get("closed", False))
-        accepting_orders = sum(1 for market in markets_info if market.get("accepting_orders", False))
-        
-        # 分类统计
-        categories = {}
-        for market in markets_info:
-            category = market["category"]
-            categories[category] = categories.get(category, 0) + 1
+        details = []
+        for i, market in enumerate(itertools.chain([first], iterator), 1):
+            row = [
+                i,
+                market["title"],
+                f"${market['current_price']:.4f}",
+                market["price_range"],
+                market["category"],
+                market["end_date_formatted"],
+                market_status(market),
+                market["total_tokens"]
+            ]
+            if show_volume:
+                row[4:4] = [f"${market.get('volume_24h', 0):,.2f}", f"${market.get('liquidity', 0):,.2f}"]
+            table.add_row(row)
+            stats.add(market)
+            if show_all and len(details) < 3:
+                details.append(market)
+        table.close()
         
         print(f"\n统计信息:")
-        print(f"  - 活跃市场: {active_markets}/{len(markets_info)}")
-        print(f"  - 已结算市场: {closed_markets}/{len(markets_info)}")
-        print(f"  - 接受订单: {accepting_orders}/{len(markets_info)}")
+        print(f"  - 市场总数: {stats.total}")
+        print(f"  - 活跃市场: {stats.active}/{stats.total}")
+        print(f"  - 已结算市场: {stats.closed}/{stats.total}")
+        print(f"  - 接受订单: {stats.accepting_orders}/{stats.total}")
+        if show_volume:
+            print(f"  - 24h成交额: ${stats.volume_24h:,.2f}")
         
         print(f"\n分类分布:")
-        for category, count in sorted(categories.items(), key=lambda x: x[1], reverse=True):
+        for category, count in stats.categories.most_common():
             print(f"  - {category}: {count} 个市场")
         
         # 显示前几个市场的详细信息（可选）
-        if show_all and len(markets_info) > 0:
+        if details:
             print(f"\n前3个市场详细信息:")
-            for i, market in enumerate(markets_info[:3], 1):
+            for i, market in enumerate(details, 1):
                 print(f"\n市场 {i}: {market['title']}")
                 print(f"  描述: {market['description'][:100]}{'...' if len(market['description']) > 100 else ''}")
                 print(f"  市场ID: {market['market_id']}")
@@ -367,6 +878,8 @@ class PolymarketMarketFetcher:
                 print(f"  最小价格变动: ${market['minimum_tick_size']}")
                 print(f"  风险类型: {'负风险' if market['neg_risk'] else '标准'}")
                 print(f"  标签: {', '.join(market['tags'])}")
+        
+        return stats
     
     def export_to_json(self, markets_info: List[Dict], filename: str = "polymarket_markets.json"):
         """导出市场数据到JSON文件"""
@@ -382,16 +895,17 @@ class PolymarketMarketFetcher:
         self.logger.info("开始获取Polymarket市场数据...")
         
         # 获取市场数据
-        markets = self.get_markets(limit)
+        try:
+            markets = self.get_markets(limit)
+        except UpstreamUnavailableError as e:
+            self.logger.error(f"未能获取到市场数据: {e}")
+            return
         if not markets:
             self.logger.error("未能获取到市场数据")
             return
         
         # 提取关键信息
-        markets_info = []
-        for market in markets:
-            market_info = self.extract_market_info(market)
-            markets_info.append(market_info)
+        markets_info = self.extract_markets_info(markets)
         
         # 显示结果
         self.display_markets_table(markets_info)
@@ -403,6 +917,8 @@ class PolymarketMarketFetcher:
 
 def main():
     """主函数"""
+    from dotenv import load_dotenv
+    
     # 加载环境变量
     load_dotenv()
     
@@ -0,0 +1,200 @@
+"""
+实时价格补充
+市场列表中的 tokens[].price 可能滞后；本模块收集活跃市场的全部代币ID，
+通过CLOB批量端点（/midpoints、/spreads、/prices）按批次并发获取实时报价，
+按代币缓存一小段时间，并合并到提取后的市场信息中
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from config import config
+from rate_limit import PRIORITY_INTERACTIVE
+import metrics
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenQuoteCache:
+    """按代币ID缓存报价（短TTL）"""
+
+    def __init__(self, ttl: float = 10):
+        self.ttl = ttl
+        self._quotes: Dict[str, Tuple[float, Dict]] = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, token_ids: Iterable[str]) -> Tuple[Dict[str, Dict], List[str]]:
+        """
+        Returns:
+            (命中的报价, 需要重新获取的代币ID列表)
+        """
+        now = time.time()
+        hits = {}
+        missing = []
+        with self._lock:
+            for token_id in token_ids:
+                cached = self._quotes.get(token_id)
+                if cached is not None and now - cached[0] <= self.ttl:
+                    hits[token_id] = cached[1]
+                else:
+                    missing.append(token_id)
+        return hits, missing
+
+    def put_many(self, quotes: Dict[str, Dict]):
+        now = time.time()
+        with self._lock:
+            for token_id, quote in quotes.items():
+                self._quotes[token_id] = (now, quote)
+            # 顺带清理过期条目，避免缓存随已下线的代币无限增长
+            if len(self._quotes) > 4 * max(len(quotes), 1000):
+                for token_id in [k for k, (at, _) in self._quotes.items() if now - at > self.ttl]:
+                    del self._quotes[token_id]
+
+    def __len__(self) -> int:
+        return len(self._quotes)
+
+
+class PriceEnricher:
+    """
+    批量实时报价
+
+    每个批次对 /midpoints、/spreads、/prices 各发一次请求（经由获取器的调度器、熔断器和重试），
+    批次之间以有限并发执行。获取失败时保留市场列表中的价格。
+    """
+
+    def __init__(self, fetcher, batch_size: int = None, concurrency: int = None, ttl: float = None):
+        """
+        Args:
+            fetcher: PolymarketMarketFetcher实例
+            batch_size: 每个批量请求的最大代币数（None表示使用配置）
+            concurrency: 同时进行的批次数（None表示使用配置）
+            ttl: 报价缓存时间（秒，None表示使用配置）
+        """
+        self.fetcher = fetcher
+        self.batch_size = batch_size or config.get("price_batch_size", 500)
+        self.concurrency = concurrency or config.get("price_concurrency", 4)
+        self.cache = TokenQuoteCache(ttl if ttl is not None else config.get("price_cache_ttl", 10))
+
+    def _fetch_batch(self, token_ids: List[str], priority: int) -> Dict[str, Dict]:
+        """获取一批代币的中间价、价差和买卖价"""
+        from py_clob_client.clob_types import BookParams
+
+        client = self.fetcher.client
+        call = self.fetcher._call_upstream
+        params = [BookParams(token_id=token_id) for token_id in token_ids]
+        side_params = [BookParams(token_id=token_id, side=side) for token_id in token_ids for side in ("BUY", "SELL")]
+
+        midpoints = call("midpoints", client.get_midpoints, params, priority=priority) or {}
+        spreads = call("spreads", client.get_spreads, params, priority=priority) or {}
+        prices = call("prices", client.get_prices, side_params, priority=priority) or {}
+
+        fetched_at = datetime.utcnow().isoformat()
+        quotes = {}
+        for token_id in token_ids:
+            midpoint = _to_float(midpoints.get(token_id))
+            if midpoint is None:
+                continue
+            sides = prices.get(token_id) or {}
+            quotes[token_id] = {
+                "midpoint": midpoint,
+                "spread": _to_float(spreads.get(token_id)),
+                "buy_price": _to_float(sides.get("BUY")),
+                "sell_price": _to_float(sides.get("SELL")),
+                "updated_at": fetched_at
+            }
+        return quotes
+
+    def fetch_quotes(self, token_ids: Iterable[str], priority: int = PRIORITY_INTERACTIVE) -> Dict[str, Dict]:
+        """
+        获取代币报价（缓存未命中的部分按批次并发请求上游）
+
+        Returns:
+            {代币ID: 报价}，获取失败的代币不在结果中
+        """
+        quotes, missing = self.cache.get_many(dict.fromkeys(token_ids))
+        metrics.PRICE_CACHE_REQUESTS.inc("hit", amount=len(quotes))
+        metrics.PRICE_CACHE_REQUESTS.inc("miss", amount=len(missing))
+        if not missing:
+            return quotes
+
+        if not self.fetcher.client and not self.fetcher.initialize_client():
+            return quotes
+
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches)),
+                                thread_name_prefix="price-batch") as executor:
+            futures = [executor.submit(self._fetch_batch, batch, priority) for batch in batches]
+            for future in futures:
+                try:
+                    fetched = future.result()
+                except Exception as e:
+                    self.fetcher.logger.warning(f"批量获取实时价格失败，使用市场列表价格: {e}")
+                    continue
+                self.cache.put_many(fetched)
+                quotes.update(fetched)
+        return quotes
+
+    def enrich(self, markets_info: List[Dict], priority: int = PRIORITY_INTERACTIVE) -> List[Dict]:
+        """
+        将实时报价合并到市场信息中（只处理活跃且未结算的市场）
+
+        Returns:
+            新的市场信息列表（不修改输入）；有实时报价的市场 price_source 为 "live"
+        """
+        token_ids = [
+            token_id
+            for market in markets_info
+            if market.get("active") and not market.get("closed")
+            for token_id in market.get("token_ids") or ()
+        ]
+        quotes = self.fetch_quotes(token_ids, priority=priority) if token_ids else {}
+
+        enriched = []
+        for market in markets_info:
+            market_quotes = [quotes.get(token_id) for token_id in market.get("token_ids") or ()]
+            first = market_quotes[0] if market_quotes else None
+            if first is None:
+                enriched.append({**market, "price_source": "listing"})
+                continue
+
+            midpoints = [quote["midpoint"] for quote in market_quotes if quote is not None]
+            enriched.append({
+                **market,
+                "current_price": first["midpoint"],
+                "price_range": f"{min(midpoints):.4f} - {max(midpoints):.4f}",
+                "spread": first["spread"],
+                "buy_price": first["buy_price"],
+                "sell_price": first["sell_price"],
+                "price_source": "live",
+                "price_updated_at": first["updated_at"]
+            })
+        return enriched
+
+    def enrich_stream(self, markets_info: Iterable[Dict], chunk_size: int = None,
+                      priority: int = PRIORITY_INTERACTIVE) -> Iterator[Dict]:
+        """按块补充实时价格，适用于逐行输出的CLI表格"""
+        chunk_size = chunk_size or self.batch_size
+        chunk = []
+        for market in markets_info:
+            chunk.append(market)
+            if len(chunk) >= chunk_size:
+                yield from self.enrich(chunk, priority=priority)
+                chunk = []
+        if chunk:
+            yield from self.enrich(chunk, priority=priority)
+
+    def stats(self) -> Dict:
+        return {
+            "batch_size": self.batch_size,
+            "concurrency": self.concurrency,
+            "cache_ttl": self.cache.ttl,
+            "cached_tokens": len(self.cache)
+        }
@@ -0,0 +1,204 @@
+"""
+请求性能剖析模块
+按比例抽样请求，记录各阶段耗时（fetch/extract/filter/paginate/serialize）并采样调用栈，
+结果保存在环形缓冲区中，可导出为火焰图工具（flamegraph.pl / speedscope）使用的折叠栈格式
+"""
+
+import os
+import sys
+import time
+import random
+import threading
+import contextvars
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import config
+
+
+_current_trace = contextvars.ContextVar("profiling_trace", default=None)
+
+
+class RequestTrace:
+    """一次被抽样请求的剖析记录"""
+
+    def __init__(self, route: str, method: str = "GET"):
+        self.route = route
+        self.method = method
+        self.started_at = time.time()
+        self.status = None
+        self.duration = None
+        self.stages: Dict[str, float] = {}
+        self.stacks = Counter()
+        self._started = time.perf_counter()
+
+    def add_stage(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def to_dict(self) -> Dict:
+        return {
+            "route": self.route,
+            "method": self.method,
+            "status": self.status,
+            "started_at": datetime.utcfromtimestamp(self.started_at).isoformat(),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+            "stack_samples": sum(self.stacks.values())
+        }
+
+
+def _collapse_stack(frame) -> str:
+    """将调用栈折叠为 "文件:函数;文件:函数;..."（根在前）"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """
+    低开销调用栈采样器
+
+    只在存在被抽样请求时运行一个后台线程，按固定间隔读取目标线程的当前栈帧。
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._targets: Dict[int, RequestTrace] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, thread_id: int, trace: RequestTrace):
+        with self._lock:
+            self._targets[thread_id] = trace
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+
+    def remove(self, thread_id: int):
+        with self._lock:
+            self._targets.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._targets:
+                    self._thread = None
+                    return
+                targets = list(self._targets.items())
+
+            frames = sys._current_frames()
+            for thread_id, trace in targets:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    trace.stacks[_collapse_stack(frame)] += 1
+            del frames
+
+            time.sleep(self.interval)
+
+
+class Profiler:
+    """请求剖析器"""
+
+    def __init__(self, sample_rate: float = 0.0, buffer_size: int = 200, stack_interval: float = 0.005):
+        """
+        Args:
+            sample_rate: 抽样比例（0表示关闭，1表示剖析所有请求）
+            buffer_size: 环形缓冲区保存的最近剖析记录数
+            stack_interval: 调用栈采样间隔（秒，0表示只记录阶段耗时）
+        """
+        self.sample_rate = sample_rate
+        self.stack_interval = stack_interval
+        self.traces = deque(maxlen=buffer_size)
+        self.sampler = StackSampler(stack_interval) if stack_interval > 0 else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def configure(self, sample_rate: float = None, buffer_size: int = None, stack_interval: float = None):
+        """运行时调整剖析参数"""
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if buffer_size is not None and buffer_size != self.traces.maxlen:
+            self.traces = deque(self.traces, maxlen=buffer_size)
+        if stack_interval is not None:
+            self.stack_interval = stack_interval
+            self.sampler = StackSampler(stack_interval) if stack_interval > 0 else None
+
+    def begin(self, route: str, method: str = "GET") -> Optional[RequestTrace]:
+        """按抽样比例开始剖析一个请求，未被抽中时返回None"""
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+
+        trace = RequestTrace(route, method)
+        trace._token = _current_trace.set(trace)
+        trace._sampler = self.sampler
+        if trace._sampler is not None:
+            trace._sampler.add(threading.get_ident(), trace)
+        return trace
+
+    def finish(self, trace: RequestTrace, status: int = None):
+        """结束剖析并写入环形缓冲区"""
+        trace.duration = time.perf_counter() - trace._started
+        trace.status = status
+        if trace._sampler is not None:
+            trace._sampler.remove(threading.get_ident())
+        _current_trace.reset(trace._token)
+        self.traces.append(trace)
+
+    def slowest(self, n: int = 10) -> List[Dict]:
+        """缓冲区中最慢的N个请求"""
+        traces = sorted(list(self.traces), key=lambda t: t.duration or 0, reverse=True)
+        return [trace.to_dict() for trace in traces[:n]]
+
+    def collapsed_stacks(self, route: str = None) -> str:
+        """汇总缓冲区内的调用栈样本，输出折叠栈格式（每行 "栈 次数"）"""
+        stacks = Counter()
+        for trace in list(self.traces):
+            if route is None or trace.route == route:
+                stacks.update(trace.stacks)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "buffer_size": self.traces.maxlen,
+            "buffered_traces": len(self.traces),
+            "stack_interval": self.stack_interval
+        }
+
+
+def record_stage(name: str, seconds: float):
+    """向当前请求的剖析记录追加一段阶段耗时（未被抽样时无操作）"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_stage(name, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """记录代码块作为当前请求的一个阶段（未被抽样时几乎无开销）"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_stage(name, time.perf_counter() - started)
+
+
+# 全局剖析器（通过配置开启，或运行时通过管理接口调整）
+profiler = Profiler(
+    sample_rate=config.get("profiling_sample_rate", 0),
+    buffer_size=config.get("profiling_buffer_size", 200),
+    stack_interval=config.get("profiling_stack_interval", 0.005)
+)
@@ -0,0 +1,195 @@
+"""
+限流模块
+提供协调所有上游CLOB调用的跨进程令牌桶调度器
+（入站限流的 file:// 存储后端见 limiter_storage.py）
+"""
+
+import os
+import json
+import time
+import fcntl
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+from config import config
+
+
+# 上游调用优先级（数值越小越优先）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class UpstreamRateLimitError(Exception):
+    """在允许的等待时间内未能获得上游调用配额"""
+
+
+@contextmanager
+def _locked_json_file(path: str):
+    """
+    以独占文件锁打开JSON状态文件，退出时原子写回
+
+    Args:
+        path: 状态文件路径（锁文件为 path + ".lock"）
+
+    Yields:
+        可修改的状态字典
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path + ".lock", "a+") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except (FileNotFoundError, ValueError):
+                state = {}
+
+            yield state
+
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class TokenBucket:
+    """
+    令牌桶
+
+    指定 path 时桶状态保存在共享文件中，同一主机上的所有worker共用一个配额；
+    否则仅在当前进程内生效。
+    """
+
+    def __init__(self, rate: float, capacity: int, path: str = None):
+        """
+        Args:
+            rate: 每秒补充的令牌数
+            capacity: 桶容量（允许的突发请求数）
+            path: 共享状态文件路径（None表示进程内桶）
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = {"tokens": float(capacity), "updated": time.time()}
+
+    def _refill_and_take(self, state: Dict, tokens: int) -> float:
+        """补充令牌并尝试取出，返回需等待的秒数（0表示已取得）"""
+        now = time.time()
+        available = state.get("tokens", float(self.capacity))
+        elapsed = max(0.0, now - state.get("updated", now))
+        available = min(float(self.capacity), available + elapsed * self.rate)
+        state["updated"] = now
+
+        if available >= tokens:
+            state["tokens"] = available - tokens
+            return 0.0
+
+        state["tokens"] = available
+        return (tokens - available) / self.rate
+
+    def try_acquire(self, tokens: int = 1) -> float:
+        """
+        尝试取出令牌
+
+        Returns:
+            0表示成功，否则为距离令牌足够所需等待的秒数
+        """
+        if self.path:
+            with _locked_json_file(self.path) as state:
+                return self._refill_and_take(state, tokens)
+
+        with self._lock:
+            return self._refill_and_take(self._state, tokens)
+
+
+class UpstreamScheduler:
+    """
+    上游调用调度器
+
+    所有上游请求先在进程内按优先级排队，队首请求再从令牌桶取令牌，
+    保证交互式请求（网页/CLI）总是先于后台刷新获得配额。
+    """
+
+    def __init__(self, bucket: TokenBucket, max_queue: int = 100):
+        """
+        Args:
+            bucket: 令牌桶
+            max_queue: 最大排队请求数，超过后直接拒绝
+        """
+        self.bucket = bucket
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+
+    @property
+    def queue_depth(self) -> int:
+        """当前排队中的请求数"""
+        return len(self._waiters)
+
+    def acquire(self, priority: int = PRIORITY_INTERACTIVE, timeout: float = None) -> bool:
+        """
+        等待获取一次上游调用配额
+
+        Args:
+            priority: 请求优先级（PRIORITY_INTERACTIVE / PRIORITY_BACKGROUND）
+            timeout: 最长等待秒数（None表示一直等待）
+
+        Returns:
+            是否在超时前获得配额
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._cond:
+            if len(self._waiters) >= self.max_queue:
+                return False
+
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    wait = None
+                    if self._waiters[0] == entry:
+                        wait = self.bucket.try_acquire()
+                        if wait <= 0:
+                            return True
+
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False
+                        wait = remaining if wait is None else min(wait, remaining)
+
+                    self._cond.wait(wait)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+
+# 全局上游调度器实例
+_upstream_scheduler = None
+_upstream_scheduler_lock = threading.Lock()
+
+
+def get_upstream_scheduler() -> UpstreamScheduler:
+    """获取（按配置创建）进程内共享的上游调度器"""
+    global _upstream_scheduler
+    with _upstream_scheduler_lock:
+        if _upstream_scheduler is None:
+            bucket = TokenBucket(
+                rate=config.get("upstream_rate", 10),
+                capacity=config.get("upstream_burst", 20),
+                path=config.get("upstream_bucket_path") or None
+            )
+            _upstream_scheduler = UpstreamScheduler(bucket, max_queue=config.get("upstream_max_queue", 100))
+        return _upstream_scheduler
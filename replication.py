@@ -0,0 +1,320 @@
+"""
+快照复制
+多个API节点部署时只由主节点刷新市场快照，每个版本与上一版本的差异（变化的市场和顺序变化）
+通过HTTP长轮询发布给副本节点；副本把差异应用到内存快照后直接服务读请求，不再访问上游拉取市场列表。
+副本落后太多（所需差异已不在历史中）或主节点重启时，改为传输完整快照。
+"""
+
+import gzip
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import requests
+
+from snapshot import MarketSnapshot
+
+
+logger = logging.getLogger(__name__)
+
+
+REPLICATION_ROLES = ("standalone", "primary", "replica")
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.utcfromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+class SnapshotPublisher:
+    """
+    主节点的快照发布器（注册到获取器的 snapshot_listeners）
+
+    每次快照更新生成一个新版本，保留最近 history 个版本的差异；
+    副本带上自己的版本号长轮询 changes_since，收到从该版本到最新版本的差异。
+    """
+
+    def __init__(self, history: int = 20):
+        # 每个进程一个纪元，主节点重启后版本号从头开始，副本据此改为完整同步
+        self.epoch = uuid.uuid4().hex[:12]
+        self.version = 0
+        self.published_at = None
+        self._deltas = deque(maxlen=history)
+        self._snapshot: Optional[MarketSnapshot] = None
+        self._ids: List[str] = []
+        self._by_id: Dict[str, Dict] = {}
+        self._full_body = None
+        self._replicas: Dict[str, Dict] = {}
+        self._condition = threading.Condition()
+
+    def on_snapshot(self, endpoint: str, snapshot: MarketSnapshot):
+        """快照更新回调：计算与上一版本的差异并唤醒等待中的副本"""
+        if endpoint != "markets":
+            return
+        partial = snapshot.changes is not None
+        ids = None if partial else [market.get("condition_id") for market in snapshot.markets]
+        with self._condition:
+            if partial and self._snapshot is not None:
+                # 分层刷新只替换部分市场（位置不变），只比较被替换的市场
+                upserts = [market for cid, market in snapshot.changes.items() if self._by_id.get(cid) != market]
+                ids = self._ids
+                self._by_id.update(snapshot.changes)
+            else:
+                if ids is None:
+                    ids = [market.get("condition_id") for market in snapshot.markets]
+                upserts = [
+                    market for cid, market in zip(ids, snapshot.markets)
+                    if (previous := self._by_id.get(cid)) is not market and previous != market
+                ]
+                self._by_id = dict(zip(ids, snapshot.markets))
+            self.version += 1
+            self.published_at = time.time()
+            # 第一个版本的差异就是完整快照，副本总是通过完整同步获得，不必保留
+            if self._snapshot is not None:
+                self._deltas.append({
+                    "version": self.version,
+                    "fetched_at": snapshot.fetched_at,
+                    "updated_at": snapshot.updated_at,
+                    "published_at": self.published_at,
+                    "complete": snapshot.complete,
+                    "upserts": upserts,
+                    # 市场集合或顺序不变时省略
+                    "order": ids if ids != self._ids else None
+                })
+            self._snapshot = snapshot
+            self._ids = ids
+            self._full_body = None
+            self._condition.notify_all()
+
+    def changes_since(self, since: int, epoch: str = None, wait: float = 0) -> Dict:
+        """
+        从副本的版本到最新版本的变化（没有新版本时最多等待 wait 秒）
+
+        Returns:
+            {"epoch", "version", "published_at", "full": 是否完整快照,
+             "deltas": [差异, ...]（增量时）或 "snapshot": {...}（完整时）}；
+            等待超时仍没有新版本时 deltas 为空列表
+        """
+        with self._condition:
+            if wait > 0:
+                self._condition.wait_for(
+                    lambda: self._snapshot is not None and (epoch != self.epoch or self.version > since),
+                    timeout=wait
+                )
+            result = {"epoch": self.epoch, "version": self.version, "published_at": self.published_at}
+            if self._snapshot is None:
+                return {**result, "full": False, "deltas": []}
+            oldest = self._deltas[0]["version"] if self._deltas else self.version + 1
+            if epoch == self.epoch and oldest - 1 <= since <= self.version:
+                return {**result, "full": False, "deltas": [d for d in self._deltas if d["version"] > since]}
+            snapshot = self._snapshot
+        return {**result, "full": True, "snapshot": {
+            "fetched_at": snapshot.fetched_at, "updated_at": snapshot.updated_at, "complete": snapshot.complete,
+            "markets": snapshot.markets
+        }}
+
+    def full_body(self, changes: Dict, envelope: Dict) -> bytes:
+        """
+        完整快照响应的gzip压缩JSON
+
+        data 部分（changes_since 的完整快照结果）每个版本只序列化和压缩一次，多个副本同时完整同步时复用；
+        标准响应结构的其余字段（时间戳、消息）每个请求单独压缩，作为独立的gzip成员拼接在前后。
+
+        Args:
+            changes: changes_since 的完整快照结果
+            envelope: 标准响应结构（data 字段被 changes 替代）
+        """
+        cached = self._full_body
+        if cached is None or cached[0] != changes["version"]:
+            cached = self._full_body = (changes["version"], gzip.compress(
+                json.dumps(changes, ensure_ascii=False).encode("utf-8"), compresslevel=1))
+        head = json.dumps({key: value for key, value in envelope.items() if key != "data"}, ensure_ascii=False)
+        return (gzip.compress(f'{head[:-1]}, "data": '.encode("utf-8"), compresslevel=1) + cached[1]
+                + gzip.compress(b"}", compresslevel=1))
+
+    def note_replica(self, replica_id: str, version: int):
+        """记录副本最近一次轮询时的版本（用于在主节点查看各副本进度）"""
+        if replica_id:
+            self._replicas[replica_id] = {"version": version, "last_seen": time.time()}
+
+    def stats(self) -> Dict:
+        now = time.time()
+        return {
+            "role": "primary",
+            "epoch": self.epoch,
+            "version": self.version,
+            "published_at": _iso(self.published_at),
+            "history": len(self._deltas),
+            "replicas": {
+                replica_id: {
+                    "version": info["version"],
+                    "versions_behind": max(0, self.version - info["version"]),
+                    "seconds_since_poll": round(now - info["last_seen"], 3)
+                }
+                for replica_id, info in list(self._replicas.items())
+            }
+        }
+
+
+class SnapshotReplica:
+    """
+    副本节点的同步器
+
+    后台线程带上当前版本长轮询主节点，把收到的差异或完整快照应用为获取器的新快照；
+    请求失败时按 retry_interval 重试，期间继续使用已有快照。
+    """
+
+    def __init__(self, fetcher, primary_url: str, wait: float = 25, retry_interval: float = 5,
+                 replica_id: str = None, timeout: float = 30, token: str = None):
+        """
+        Args:
+            fetcher: 副本节点的 PolymarketMarketFetcher（只读取本同步器安装的快照）
+            primary_url: 主节点API根地址（含 /api/v1）
+            wait: 每次长轮询在主节点等待新版本的最长时间（秒）
+            retry_interval: 请求失败后的重试间隔（秒）
+            replica_id: 在主节点状态中显示的副本标识（None表示随机生成）
+            timeout: 除长轮询等待以外的请求超时时间（秒）
+            token: 主节点的复制令牌（作为 X-Replication-Token 请求头发送，None表示不发送）
+        """
+        self.fetcher = fetcher
+        self.primary_url = primary_url.rstrip("/")
+        self.wait = wait
+        self.retry_interval = retry_interval
+        self.replica_id = replica_id or uuid.uuid4().hex[:8]
+        self.timeout = timeout
+        self.session = requests.Session()
+        if token:
+            self.session.headers["X-Replication-Token"] = token
+
+        self.epoch = None
+        self.version = 0
+        self.primary_version = None
+        self.published_at = None
+        self.applied_at = None
+        self.last_contact_at = None
+        self.full_syncs = 0
+        self.deltas_applied = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.state = "stopped"
+        self._markets: List[Dict] = []
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动后台同步线程（重复调用无副作用）"""
+        if self.running:
+            return
+        self._stop_event.clear()
+        self.state = "syncing"
+        self._thread = threading.Thread(target=self._run, name="snapshot-replica", daemon=True)
+        self._thread.start()
+        logger.info(f"快照副本已启动，主节点 {self.primary_url}")
+
+    def stop(self, timeout: float = None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.state = "stopped"
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            if not self.poll_once(wait=self.wait):
+                self._stop_event.wait(self.retry_interval)
+
+    def poll_once(self, wait: float = 0) -> bool:
+        """请求一次主节点并应用收到的变化，返回是否成功"""
+        try:
+            response = self.session.get(
+                f"{self.primary_url}/replication/changes",
+                params={"since": self.version, "epoch": self.epoch or "", "wait": wait, "replica": self.replica_id},
+                timeout=self.timeout + wait
+            )
+            payload = response.json()
+            if response.status_code != 200 or not payload.get("success"):
+                raise RuntimeError((payload.get("error") or {}).get("message") or f"HTTP {response.status_code}")
+            self.apply(payload["data"])
+        except Exception as e:
+            self.consecutive_failures += 1
+            self.last_error = str(e)
+            self.state = "disconnected"
+            logger.warning(f"从主节点同步快照失败（连续 {self.consecutive_failures} 次）: {e}")
+            return False
+
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.last_contact_at = time.time()
+        self.state = "streaming"
+        return True
+
+    def apply(self, changes: Dict):
+        """应用 changes_since 的结果（完整快照或按版本顺序的差异）"""
+        self.primary_version = changes["version"]
+        if changes["full"]:
+            snapshot = changes["snapshot"]
+            self._install(snapshot["markets"], changes["version"], snapshot["fetched_at"],
+                          changes["published_at"], snapshot["complete"], updated_at=snapshot.get("updated_at"))
+            self.epoch = changes["epoch"]
+            self.full_syncs += 1
+            return
+
+        for delta in changes["deltas"]:
+            by_id = {market.get("condition_id"): market for market in self._markets}
+            by_id.update((market.get("condition_id"), market) for market in delta["upserts"])
+            order = delta["order"] if delta["order"] is not None else [m.get("condition_id") for m in self._markets]
+            # 顺序不变时只有 upserts 中的市场被替换，快照回调可以只处理这些市场
+            changes = ({market.get("condition_id"): market for market in delta["upserts"]}
+                       if delta["order"] is None else None)
+            self._install([by_id[cid] for cid in order], delta["version"], delta["fetched_at"],
+                          delta["published_at"], delta["complete"], updated_at=delta.get("updated_at"),
+                          changes=changes)
+            self.deltas_applied += 1
+
+    def _install(self, markets: List[Dict], version: int, fetched_at: float, published_at: float,
+                 complete: bool, updated_at: float = None, changes: Dict[str, Dict] = None):
+        self._markets = markets
+        self.fetcher.install_snapshot("markets", MarketSnapshot(markets, fetched_at=fetched_at, complete=complete,
+                                                                updated_at=updated_at, changes=changes))
+        self.version = version
+        self.published_at = published_at
+        self.applied_at = time.time()
+
+    @property
+    def lag_seconds(self) -> Optional[float]:
+        """
+        复制延迟：最近应用的版本从主节点发布到在副本应用的时间；
+        与主节点失联时为距上次成功联系的时间（取较大者）
+        """
+        if self.applied_at is None:
+            return None
+        lag = max(0.0, self.applied_at - (self.published_at or self.applied_at))
+        if self.consecutive_failures and self.last_contact_at:
+            lag = max(lag, time.time() - self.last_contact_at)
+        return round(lag, 3)
+
+    def stats(self) -> Dict:
+        return {
+            "role": "replica",
+            "replica_id": self.replica_id,
+            "primary_url": self.primary_url,
+            "state": self.state,
+            "epoch": self.epoch,
+            "version": self.version,
+            "primary_version": self.primary_version,
+            "versions_behind": max(0, (self.primary_version or 0) - self.version),
+            "lag_seconds": self.lag_seconds,
+            "last_applied_at": _iso(self.applied_at),
+            "last_contact_at": _iso(self.last_contact_at),
+            "full_syncs": self.full_syncs,
+            "deltas_applied": self.deltas_applied,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error
+        }
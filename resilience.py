@@ -0,0 +1,240 @@
+"""
+上游调用容错模块
+提供指数退避重试、单次调用超时、对冲请求以及熔断器
+"""
+
+import random
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterator, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# 熔断器状态
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class UpstreamUnavailableError(Exception):
+    """上游不可用且没有可用的缓存数据"""
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，拒绝调用上游"""
+
+
+class UpstreamBusyError(Exception):
+    """上游线程池已被未结束的调用占满，不排队等待"""
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    连续失败达到阈值后打开，冷却时间过后进入半开状态放行一次试探调用，
+    试探成功则关闭，失败则重新打开。每次状态转换都会计数。
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold: 触发熔断的连续失败次数
+            reset_timeout: 打开后进入半开状态前的冷却时间（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.transitions = Counter()
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _transition(self, new_state: str):
+        """切换状态并记录转换次数"""
+        if new_state == self.state:
+            return
+        self.transitions[f"{self.state}->{new_state}"] += 1
+        logger.warning(f"上游熔断器状态变化: {self.state} -> {new_state}")
+        self.state = new_state
+        if new_state == STATE_OPEN:
+            self.opened_at = time.monotonic()
+
+    def allow_request(self) -> bool:
+        """当前是否允许调用上游"""
+        with self._lock:
+            if self.state == STATE_OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self._transition(STATE_HALF_OPEN)
+
+            if self.state == STATE_HALF_OPEN:
+                # 半开状态只放行一个试探调用
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+
+            return True
+
+    def record_success(self):
+        """记录一次成功调用"""
+        with self._lock:
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+            self._transition(STATE_CLOSED)
+
+    def record_failure(self):
+        """记录一次失败调用"""
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == STATE_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self._transition(STATE_OPEN)
+
+    def release(self):
+        """放弃本次调用（未实际请求上游），不影响熔断状态"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict:
+        """熔断器状态和转换计数"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+                "transitions": dict(self.transitions)
+            }
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    判断错误是否值得重试
+
+    4xx客户端错误（429除外）重试也不会成功，其余错误（超时、连接失败、5xx）均重试。
+    """
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int) and 400 <= status_code < 500 and status_code != 429:
+        return False
+    return True
+
+
+def backoff_delays(max_retries: int, base: float = 0.5, cap: float = 10.0) -> Iterator[float]:
+    """
+    生成指数退避等待时间（带全抖动）
+
+    Args:
+        max_retries: 重试次数
+        base: 首次重试的基准等待时间（秒）
+        cap: 单次等待上限（秒）
+    """
+    for attempt in range(max_retries):
+        yield random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+# 执行上游调用的共享线程池（用于超时控制和对冲请求）
+UPSTREAM_WORKERS = 16
+_executor = None
+_executor_lock = threading.Lock()
+# 已提交但尚未结束的调用数（超时放弃的调用在网络层结束前仍占用线程）
+_in_flight = 0
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=UPSTREAM_WORKERS, thread_name_prefix="upstream")
+        return _executor
+
+
+def _release_worker(_future: Future):
+    global _in_flight
+    with _executor_lock:
+        _in_flight -= 1
+
+
+def _try_submit(func: Callable) -> Optional[Future]:
+    """线程池有空闲线程时提交调用，否则返回None（不在线程池队列中排队，排队时间会吃掉调用方的超时）"""
+    global _in_flight
+    executor = _get_executor()
+    with _executor_lock:
+        if _in_flight >= UPSTREAM_WORKERS:
+            return None
+        _in_flight += 1
+    future = executor.submit(func)
+    future.add_done_callback(_release_worker)
+    return future
+
+
+def in_flight_calls() -> int:
+    """共享线程池中尚未结束的上游调用数"""
+    return _in_flight
+
+
+def run_with_timeout(func: Callable, timeout: float, hedge_delay: float = 0,
+                     can_hedge: Callable[[], bool] = None, stats: Counter = None):
+    """
+    在限定时间内执行调用，可选对冲请求
+
+    若首次调用在 hedge_delay 秒内未返回，则并发发起一次相同调用，取先成功者。
+    线程池已被未结束的调用占满时立即失败（抛出 UpstreamBusyError），也不再发起对冲。
+
+    Args:
+        func: 无参调用
+        timeout: 总超时时间（秒）
+        hedge_delay: 发起对冲请求前的等待时间（0表示不对冲）
+        can_hedge: 发起对冲前的检查（如是否还有上游配额）
+        stats: 可选计数器，记录超时和对冲次数
+
+    Returns:
+        调用结果
+
+    Raises:
+        UpstreamBusyError: 线程池已满
+        TimeoutError: 超时
+    """
+    stats = stats if stats is not None else Counter()
+    deadline = time.monotonic() + timeout
+    primary = _try_submit(func)
+    if primary is None:
+        stats["pool_rejected"] += 1
+        raise UpstreamBusyError(f"上游线程池已满（{UPSTREAM_WORKERS} 个调用未结束）")
+    pending = {primary}
+    hedged = not hedge_delay or hedge_delay >= timeout
+    last_error = None
+
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+
+        wait_time = remaining if hedged else min(hedge_delay, remaining)
+        done, pending = wait(pending, timeout=wait_time, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            if future.exception() is None:
+                if future is not primary:
+                    stats["hedge_wins"] += 1
+                return future.result()
+            last_error = future.exception()
+
+        if not hedged and not done:
+            hedged = True
+            if in_flight_calls() < UPSTREAM_WORKERS and (can_hedge is None or can_hedge()):
+                hedge = _try_submit(func)
+                if hedge is not None:
+                    stats["hedges_launched"] += 1
+                    pending.add(hedge)
+
+    if not pending and last_error is not None:
+        raise last_error
+
+    stats["timeouts"] += 1
+    raise TimeoutError(f"上游调用超时（{timeout}秒）")
@@ -0,0 +1,164 @@
+"""
+跨市场定价异常扫描
+在内存快照上用向量化计算查找两类异常：
+- 互补：二元市场两个代币价格之和明显偏离1
+- 负风险：同一负风险事件中各结果 "Yes" 价格之和明显偏离1
+结果按偏离幅度排序，每次快照刷新后重新扫描
+"""
+
+import time
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import config
+from events import event_id_of, outcome_token
+
+
+SCAN_KINDS = ("complement", "neg_risk")
+
+
+def _price(token: Dict) -> float:
+    try:
+        return float(token.get("price"))
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _direction(deviation: float) -> str:
+    return "over" if deviation > 0 else "under"
+
+
+def scan_markets(markets: List[Dict], tolerance: float = 0.02, max_results: int = 500) -> List[Dict]:
+    """
+    扫描全部市场（只考虑活跃且未结算的市场；负风险事件有任一结果不可交易或没有价格时整个跳过）
+
+    Args:
+        markets: 原始市场数据列表
+        tolerance: 价格之和与1的偏差达到该值才视为异常
+        max_results: 返回的异常数量上限
+
+    Returns:
+        按偏离幅度从大到小排序的异常列表
+    """
+    open_markets = [m for m in markets if m.get("active") and not m.get("closed")]
+
+    # 互补：二元市场的两个代币价格排成 (N, 2) 数组后按行求和
+    binary = [m for m in open_markets if len(m.get("tokens") or ()) == 2]
+    pairs = np.fromiter((_price(t) for m in binary for t in m["tokens"]), dtype=float,
+                        count=2 * len(binary)).reshape(-1, 2)
+    pair_deviation = pairs.sum(axis=1) - 1
+    pair_hits = np.flatnonzero(np.abs(pair_deviation) >= tolerance)
+
+    # 负风险：按事件编号对 "Yes" 价格分组求和（np.bincount），只看至少两个结果的事件。
+    # 已结算、非活跃或没有价格的结果记为NaN，NaN会传播到整个事件的和，这样的事件不参与比较
+    codes: Dict[str, int] = {}
+    group_codes = []
+    group_prices = []
+    group_first = []
+    for market in markets:
+        event_id = event_id_of(market)
+        token = outcome_token(market) if event_id else None
+        if token is None:
+            continue
+        code = codes.setdefault(event_id, len(codes))
+        if code == len(group_first):
+            group_first.append(market)
+        group_codes.append(code)
+        tradable = market.get("active") and not market.get("closed")
+        group_prices.append(_price(token) if tradable else np.nan)
+    group_codes = np.asarray(group_codes, dtype=np.intp)
+    group_sums = np.bincount(group_codes, weights=np.asarray(group_prices, dtype=float), minlength=len(codes))
+    group_sizes = np.bincount(group_codes, minlength=len(codes))
+    group_deviation = group_sums - 1
+    group_hits = np.flatnonzero((group_sizes >= 2) & (np.abs(group_deviation) >= tolerance))
+
+    # 两类异常合并后按幅度排序，只物化前 max_results 个
+    magnitude = np.concatenate([np.abs(pair_deviation[pair_hits]), np.abs(group_deviation[group_hits])])
+    order = np.argsort(-magnitude, kind="stable")[:max_results]
+
+    anomalies = []
+    for position in order:
+        if position < len(pair_hits):
+            i = pair_hits[position]
+            market = binary[i]
+            deviation = float(pair_deviation[i])
+            anomalies.append({
+                "kind": "complement",
+                "id": market.get("condition_id"),
+                "title": market.get("question"),
+                "price_sum": round(deviation + 1, 6),
+                "deviation": round(deviation, 6),
+                "magnitude": round(abs(deviation), 6),
+                "direction": _direction(deviation),
+                "outcomes": 2,
+                "prices": [float(p) for p in pairs[i]],
+                "token_ids": [token.get("token_id") for token in market["tokens"]]
+            })
+        else:
+            code = group_hits[position - len(pair_hits)]
+            market = group_first[code]
+            deviation = float(group_deviation[code])
+            anomalies.append({
+                "kind": "neg_risk",
+                "id": event_id_of(market),
+                "title": market.get("question"),
+                "price_sum": round(deviation + 1, 6),
+                "deviation": round(deviation, 6),
+                "magnitude": round(abs(deviation), 6),
+                "direction": _direction(deviation),
+                "outcomes": int(group_sizes[code])
+            })
+    return anomalies
+
+
+class MarketScanner:
+    """
+    扫描结果缓存
+
+    注册为快照更新回调后每次刷新扫描一次；请求路径按市场列表对象复用最近一次结果。
+    """
+
+    def __init__(self, tolerance: float = None, max_results: int = None):
+        """
+        Args:
+            tolerance: 异常阈值（价格之和与1的偏差）
+            max_results: 保留的异常数量上限
+        """
+        self.tolerance = tolerance if tolerance is not None else config.get("scanner_tolerance", 0.02)
+        self.max_results = max_results or config.get("scanner_max_results", 500)
+        self.scan_count = 0
+        self._markets = None
+        self._result: Optional[Dict] = None
+        self._lock = threading.Lock()
+
+    def on_snapshot(self, endpoint: str, snapshot):
+        """快照刷新回调（注册到获取器的 snapshot_listeners；分层刷新的部分更新不在回调中重扫，请求时按新列表扫描）"""
+        if endpoint == "markets" and snapshot.changes is None:
+            self.scan(snapshot.markets)
+
+    def scan(self, markets: List[Dict]) -> Dict:
+        """
+        扫描市场列表（同一个列表对象只扫描一次）
+
+        Returns:
+            {"anomalies", "scanned_markets", "duration_ms", "scanned_at", "tolerance"}
+        """
+        with self._lock:
+            if self._markets is markets and self._result is not None:
+                return self._result
+
+            started = time.perf_counter()
+            anomalies = scan_markets(markets, self.tolerance, self.max_results)
+            self._result = {
+                "anomalies": anomalies,
+                "scanned_markets": len(markets),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                "scanned_at": datetime.utcnow().isoformat(),
+                "tolerance": self.tolerance
+            }
+            self._markets = markets
+            self.scan_count += 1
+            return self._result
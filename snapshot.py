@@ -0,0 +1,194 @@
+"""
+市场数据快照
+保存最近一次成功从上游拉取的市场列表，并由后台刷新器定期更新；
+快照可以持久化到本地文件，供CLI离线读取
+"""
+
+import os
+import json
+import time
+import logging
+import itertools
+import threading
+from datetime import datetime
+from typing import Dict, List
+
+from rate_limit import PRIORITY_BACKGROUND
+
+
+logger = logging.getLogger(__name__)
+
+
+_version_counter = itertools.count(1)
+
+# 快照文件格式版本（文件结构变化时递增）
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+class MarketSnapshot:
+    """市场数据快照（只读）"""
+
+    def __init__(self, markets: List[Dict], fetched_at: float = None, version: int = None,
+                 complete: bool = True, updated_at: float = None, changes: Dict[str, Dict] = None):
+        """
+        Args:
+            markets: 原始市场数据列表
+            fetched_at: 拉取时间（Unix时间戳，None表示当前时间）
+            version: 快照版本号（None表示自动递增）
+            complete: 是否包含上游全部分页（按数量提前停止翻页时为False）
+            updated_at: 内容最近一次变化的时间（分层刷新合并部分市场时为合并时间，None表示与 fetched_at 相同）
+            changes: 相对上一版本被替换的市场 {condition_id: 原始市场数据}（只替换部分市场时），
+                None表示整份列表都可能变化
+        """
+        self.markets = markets
+        self.complete = complete
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        self.updated_at = updated_at if updated_at is not None else self.fetched_at
+        self.changes = changes
+        self.version = version if version is not None else next(_version_counter)
+
+    @property
+    def age(self) -> float:
+        """快照年龄（秒）"""
+        return max(0.0, time.time() - self.fetched_at)
+
+    def __len__(self) -> int:
+        return len(self.markets)
+
+    def save(self, path: str):
+        """
+        保存快照到本地JSON文件
+
+        先写入临时文件再原子替换，读取方不会看到写了一半的文件。
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "format_version": SNAPSHOT_FORMAT_VERSION,
+                "fetched_at": self.fetched_at,
+                "updated_at": self.updated_at,
+                "complete": self.complete,
+                "count": len(self.markets),
+                "markets": self.markets
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "MarketSnapshot":
+        """
+        从本地JSON文件加载快照（保留原始拉取时间，版本号重新分配）
+
+        Raises:
+            OSError: 文件不存在或无法读取
+            ValueError: 文件格式不正确
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        if not isinstance(data, dict) or data.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"不支持的快照文件格式: {path}")
+
+        return cls(data["markets"], fetched_at=data["fetched_at"], complete=data.get("complete", True),
+                   updated_at=data.get("updated_at"))
+
+
+class SnapshotRefresher:
+    """
+    后台快照刷新器
+
+    以后台优先级定期刷新市场快照，请求路径只读取内存中的快照，
+    不再为每个请求单独访问上游。
+    """
+
+    def __init__(self, fetcher, interval: float = 30, path: str = None):
+        """
+        Args:
+            fetcher: PolymarketMarketFetcher实例
+            interval: 刷新间隔（秒）
+            path: 每次刷新成功后写入快照的本地文件路径（None表示不持久化）
+        """
+        self.fetcher = fetcher
+        self.interval = interval
+        self.path = path
+        self.state = "stopped"
+        self.refresh_count = 0
+        self.consecutive_failures = 0
+        self.last_success_at = None
+        self.last_error = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动后台刷新线程（重复调用无副作用）"""
+        with self._lock:
+            if self.running:
+                return
+            self._stop_event.clear()
+            self.state = "idle"
+            self._thread = threading.Thread(target=self._run, name="snapshot-refresher", daemon=True)
+            self._thread.start()
+            logger.info(f"快照刷新器已启动，刷新间隔 {self.interval} 秒")
+
+    def stop(self, timeout: float = None):
+        """停止后台刷新线程"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.state = "stopped"
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.refresh_once()
+            self._stop_event.wait(self.interval)
+
+    def refresh_once(self) -> bool:
+        """执行一次刷新，返回是否成功"""
+        self.state = "refreshing"
+        try:
+            snapshot = self.fetcher.refresh_snapshot(priority=PRIORITY_BACKGROUND)
+            self.refresh_count += 1
+            self.consecutive_failures = 0
+            self.last_success_at = time.time()
+            self.last_error = None
+            if self.path:
+                self._persist(snapshot)
+            return True
+        except Exception as e:
+            self.consecutive_failures += 1
+            self.last_error = str(e)
+            logger.error(f"快照刷新失败（连续 {self.consecutive_failures} 次）: {e}")
+            return False
+        finally:
+            self.state = "stopped" if self._stop_event.is_set() else "idle"
+
+    def _persist(self, snapshot: MarketSnapshot):
+        """写入本地快照文件（写入失败不影响内存快照，只记录警告）"""
+        try:
+            snapshot.save(self.path)
+        except OSError as e:
+            logger.warning(f"快照写入本地文件失败: {e}")
+
+    def stats(self) -> Dict:
+        """刷新器状态（仅读取内存）"""
+        return {
+            "state": self.state,
+            "running": self.running,
+            "interval": self.interval,
+            "path": self.path,
+            "refresh_count": self.refresh_count,
+            "consecutive_failures": self.consecutive_failures,
+            "last_success_at": (
+                datetime.utcfromtimestamp(self.last_success_at).isoformat()
+                if self.last_success_at else None
+            ),
+            "last_error": self.last_error
+        }
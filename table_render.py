@@ -0,0 +1,150 @@
+"""
+流式表格渲染
+逐行输出表格而不必先收集全部行：列宽取自固定宽度或前若干行的采样，
+超出列宽的内容截断；同时在同一遍遍历中累计统计信息
+"""
+
+import sys
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, TextIO
+
+
+TABLE_FORMATS = ("grid", "plain")
+
+
+def display_width(text: str) -> int:
+    """终端显示宽度（中文等全角字符占两列）"""
+    if text.isascii():
+        return len(text)
+    return sum(2 if unicodedata.east_asian_width(ch) in ("W", "F") else 1 for ch in text)
+
+
+def truncate(text: str, width: int) -> str:
+    """按显示宽度截断，超出时以 "..." 结尾"""
+    if display_width(text) <= width:
+        return text
+    result = []
+    used = 0
+    for ch in text:
+        ch_width = display_width(ch)
+        if used + ch_width > width - 3:
+            break
+        result.append(ch)
+        used += ch_width
+    return "".join(result) + "..."
+
+
+def pad(text: str, width: int) -> str:
+    """按显示宽度左对齐补齐"""
+    return text + " " * (width - display_width(text))
+
+
+class StreamingTable:
+    """
+    流式表格
+
+    grid 格式与 tabulate 的 grid 样式一致；plain 格式只有表头下划线，没有边框，
+    适合通过管道交给 less / grep 等工具。
+    """
+
+    def __init__(self, headers: Sequence[str], widths: Sequence[Optional[int]] = None,
+                 max_widths: Sequence[Optional[int]] = None, table_format: str = "grid",
+                 sample_size: int = 100, out: TextIO = None):
+        """
+        Args:
+            headers: 列标题
+            widths: 固定列宽（None表示该列宽度由采样决定）
+            max_widths: 采样列宽的上限（None表示不限制）
+            table_format: "grid" 或 "plain"
+            sample_size: 用于确定列宽的采样行数（采样行缓存后与表头一起输出）
+            out: 输出流（默认标准输出）
+        """
+        if table_format not in TABLE_FORMATS:
+            raise ValueError(f"不支持的表格格式: {table_format}")
+        self.headers = list(headers)
+        self.widths = list(widths) if widths else [None] * len(self.headers)
+        self.max_widths = list(max_widths) if max_widths else [None] * len(self.headers)
+        self.table_format = table_format
+        self.sample_size = sample_size
+        self.out = out or sys.stdout
+        self.row_count = 0
+        self._pending: List[List[str]] = []
+        self._started = False
+
+    def add_row(self, row: Sequence):
+        """添加一行（采样完成前先缓存，之后直接输出）"""
+        cells = ["" if value is None else str(value) for value in row]
+        self.row_count += 1
+        if self._started:
+            self._write_row(cells)
+            return
+        self._pending.append(cells)
+        if len(self._pending) >= self.sample_size:
+            self._start()
+
+    def close(self):
+        """结束表格（行数不足采样数量时在此输出表头和缓存行）"""
+        if not self._started:
+            self._start()
+
+    def _start(self):
+        """根据采样行确定列宽并输出表头"""
+        for i, header in enumerate(self.headers):
+            if self.widths[i] is None:
+                sampled = max([display_width(header)] + [display_width(row[i]) for row in self._pending])
+                limit = self.max_widths[i]
+                self.widths[i] = min(sampled, limit) if limit else sampled
+            self.widths[i] = max(self.widths[i], display_width(header), 4)
+
+        if self.table_format == "grid":
+            self.out.write(self._rule("-") + "\n")
+            self.out.write(self._line(self.headers) + "\n")
+            self.out.write(self._rule("=") + "\n")
+        else:
+            self.out.write(self._line(self.headers).rstrip() + "\n")
+            self.out.write("  ".join("-" * width for width in self.widths) + "\n")
+
+        self._started = True
+        pending, self._pending = self._pending, []
+        for cells in pending:
+            self._write_row(cells)
+
+    def _rule(self, char: str) -> str:
+        return "+" + "+".join(char * (width + 2) for width in self.widths) + "+"
+
+    def _line(self, cells: Sequence[str]) -> str:
+        padded = [pad(truncate(cell, width), width) for cell, width in zip(cells, self.widths)]
+        if self.table_format == "grid":
+            return "| " + " | ".join(padded) + " |"
+        return "  ".join(padded)
+
+    def _write_row(self, cells: List[str]):
+        if self.table_format == "grid":
+            self.out.write(self._line(cells) + "\n" + self._rule("-") + "\n")
+        else:
+            self.out.write(self._line(cells).rstrip() + "\n")
+
+
+class MarketStats:
+    """在渲染表格的同一遍遍历中累计市场统计"""
+
+    def __init__(self):
+        self.total = 0
+        self.active = 0
+        self.closed = 0
+        self.accepting_orders = 0
+        self.volume_24h = 0.0
+        self.categories = Counter()
+
+    def add(self, market_info: Dict):
+        self.total += 1
+        self.active += bool(market_info.get("active", False))
+        self.closed += bool(market_info.get("closed", False))
+        self.accepting_orders += bool(market_info.get("accepting_orders", False))
+        self.volume_24h += market_info.get("volume_24h") or 0
+        self.categories[market_info.get("category", "other")] += 1
+
+    def update(self, markets_info: Iterable[Dict]):
+        for market_info in markets_info:
+            self.add(market_info)
@@ -11,6 +11,23 @@ import json
 import time
 from datetime import datetime
 
+def reset_api_services():
+    """停止Web层已启动的后台线程并清空 api.routes 中的全局实例（测试之间互不影响）"""
+    import api.routes as routes
+
+    for service in (routes.snapshot_refresher, routes.trade_ingester, routes.tiered_refresher,
+                    routes.snapshot_replica):
+        if service is not None and service.running:
+            service.stop(timeout=5)
+    routes.market_fetcher = None
+    routes.snapshot_refresher = None
+    routes.snapshot_publisher = None
+    routes.snapshot_replica = None
+    routes.alert_engine = None
+    routes.trade_ingester = None
+    routes.tiered_refresher = None
+
+
 def test_flask_app():
     """测试Flask应用的基本功能"""
     print("🧪 开始Phase 1基本功能测试...")
@@ -35,6 +52,7 @@ def test_flask_app():
 
             expected_routes = [
                 '/api/v1/health',
+                '/api/v1/ready',
                 '/api/v1/status',
                 '/api/v1/config',
                 '/api/v1/markets',
@@ -203,6 +221,1260 @@ def test_file_structure():
 
     return True
 
+def test_rate_limit():
+    """测试共享限流存储和上游令牌桶"""
+    print("\n📋 测试: 限流模块")
+    import tempfile
+    from limiter_storage import FileStorage
+    from rate_limit import TokenBucket, UpstreamScheduler, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 两个存储实例共享同一文件，模拟多个worker
+        uri = f"file://{tmp_dir}/limits.json"
+        worker_a, worker_b = FileStorage(uri), FileStorage(uri)
+        worker_a.incr("client", 60)
+        assert worker_b.incr("client", 60) == 2
+        assert worker_a.get("client") == 2
+        print("✅ file:// 限流存储在实例间共享计数")
+
+        bucket_path = f"{tmp_dir}/bucket.json"
+        bucket_a = TokenBucket(rate=1, capacity=2, path=bucket_path)
+        bucket_b = TokenBucket(rate=1, capacity=2, path=bucket_path)
+        assert bucket_a.try_acquire() == 0
+        assert bucket_b.try_acquire() == 0
+        assert bucket_a.try_acquire() > 0
+        print("✅ 上游令牌桶在实例间共享配额")
+
+        scheduler = UpstreamScheduler(TokenBucket(rate=1000, capacity=1))
+        assert scheduler.acquire(timeout=1)
+        assert scheduler.acquire(priority=PRIORITY_BACKGROUND, timeout=1)
+        assert scheduler.queue_depth == 0
+        print("✅ 上游调度器按配额放行请求")
+
+        # 配额用完后，后到的交互请求先于更早排队的后台请求获得下一个令牌
+        import threading
+        scheduler = UpstreamScheduler(TokenBucket(rate=10, capacity=1))
+        assert scheduler.acquire(timeout=1)
+        order = []
+
+        def waiter(name, priority):
+            assert scheduler.acquire(priority=priority, timeout=2)
+            order.append(name)
+
+        background = threading.Thread(target=waiter, args=("background", PRIORITY_BACKGROUND))
+        background.start()
+        while scheduler.queue_depth < 1:
+            time.sleep(0.001)
+        interactive = threading.Thread(target=waiter, args=("interactive", PRIORITY_INTERACTIVE))
+        interactive.start()
+        background.join()
+        interactive.join()
+        assert order == ["interactive", "background"]
+        print("✅ 排队中的高优先级请求先获得配额")
+
+
+def test_upstream_resilience():
+    """测试上游重试、熔断和缓存快照回退"""
+    print("\n📋 测试: 上游容错")
+    from polymarket_markets import PolymarketMarketFetcher
+    from rate_limit import TokenBucket, UpstreamScheduler
+    from resilience import CircuitBreaker, UpstreamUnavailableError
+
+    class FlakyClient:
+        def __init__(self):
+            self.calls = 0
+            self.healthy = True
+
+        def get_markets(self, next_cursor="MA=="):
+            self.calls += 1
+            if not self.healthy:
+                raise ConnectionError("upstream down")
+            return {"data": [{"question": "测试市场", "condition_id": "c1"}], "next_cursor": "LTE="}
+
+    fetcher = PolymarketMarketFetcher(
+        timeout=5,
+        max_retries=2,
+        scheduler=UpstreamScheduler(TokenBucket(rate=1000, capacity=100)),
+        breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    )
+    fetcher.retry_backoff = 0
+    fetcher.client = FlakyClient()
+
+    assert len(fetcher.get_markets()) == 1
+    fetcher.client.healthy = False
+
+    # 重试耗尽后回退到缓存快照
+    assert len(fetcher.get_markets()) == 1
+    assert fetcher.client.calls == 1 + 3
+    assert fetcher.upstream_stats["stale_served"] == 1
+    print("✅ 重试次数遵循max_retries，失败后返回缓存快照")
+
+    fetcher.get_markets()
+    assert fetcher.breaker.state == "open"
+    calls = fetcher.client.calls
+    assert len(fetcher.get_markets()) == 1
+    assert fetcher.client.calls == calls
+    print("✅ 熔断打开后不再调用上游")
+
+    fetcher.snapshots.clear()
+    try:
+        fetcher.get_markets()
+        assert False, "无缓存时应抛出UpstreamUnavailableError"
+    except UpstreamUnavailableError:
+        print("✅ 无缓存时报告上游不可用而非空列表")
+
+    # 超时放弃的调用占满线程池后，新调用立即失败而不是在线程池队列中排队
+    import threading
+    from py_clob_client.http_helpers import helpers
+    from resilience import UPSTREAM_WORKERS, UpstreamBusyError, in_flight_calls, run_with_timeout
+
+    assert fetcher.initialize_client() and helpers._http_client.timeout.read == fetcher.timeout
+    stalled = threading.Event()
+    try:
+        for _ in range(UPSTREAM_WORKERS):
+            try:
+                run_with_timeout(stalled.wait, 0.01)
+                assert False, "应超时"
+            except TimeoutError:
+                pass
+        assert in_flight_calls() == UPSTREAM_WORKERS
+        started = time.monotonic()
+        try:
+            run_with_timeout(lambda: "ok", 5)
+            assert False, "线程池已满时应立即失败"
+        except UpstreamBusyError:
+            assert time.monotonic() - started < 0.5
+    finally:
+        stalled.set()
+    deadline = time.time() + 2
+    while in_flight_calls() and time.time() < deadline:
+        time.sleep(0.01)
+    assert run_with_timeout(lambda: "ok", 5) == "ok"
+    print("✅ HTTP层使用单次调用超时，线程池占满时快速失败")
+
+
+def test_metrics_exposition():
+    """测试Prometheus文本格式导出"""
+    print("\n📋 测试: 运行指标")
+    from metrics import Counter, Histogram, Registry
+
+    registry = Registry()
+    requests_total = Counter("demo_requests_total", "请求数", ("route",), registry=registry)
+    latency = Histogram("demo_latency_seconds", "耗时", ("route",), buckets=(0.1, 1.0), registry=registry)
+
+    requests_total.inc("/markets")
+    requests_total.inc("/markets")
+    latency.observe(0.05, "/markets")
+    latency.observe(0.5, "/markets")
+    latency.observe(5, "/markets")
+
+    text = registry.render()
+    assert 'demo_requests_total{route="/markets"} 2' in text
+    assert 'demo_latency_seconds_bucket{route="/markets",le="0.1"} 1' in text
+    assert 'demo_latency_seconds_bucket{route="/markets",le="1"} 2' in text
+    assert 'demo_latency_seconds_bucket{route="/markets",le="+Inf"} 3' in text
+    assert 'demo_latency_seconds_count{route="/markets"} 3' in text
+
+    # /metrics 使用Prometheus文本格式且不受限流影响
+    from config import config as app_config
+    from app import create_app
+    saved = app_config.get("ratelimit_default")
+    app_config.set("ratelimit_default", "2 per minute")
+    try:
+        client = create_app().test_client()
+        for _ in range(5):
+            response = client.get("/metrics")
+            assert response.status_code == 200
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        assert [client.get("/about").status_code for _ in range(3)] == [200, 200, 429]
+    finally:
+        app_config.set("ratelimit_default", saved)
+    print("✅ 计数器和直方图导出格式正确，/metrics 不受限流影响")
+
+
+def test_profiling_stages():
+    """测试抽样剖析的阶段耗时和折叠栈输出"""
+    print("\n📋 测试: 性能剖析")
+    from profiling import Profiler, stage
+
+    profiler = Profiler(sample_rate=1, buffer_size=2, stack_interval=0.001)
+    for _ in range(3):
+        trace = profiler.begin("/api/v1/markets")
+        with stage("extract"):
+            time.sleep(0.01)
+        profiler.finish(trace, 200)
+
+    assert len(profiler.traces) == 2
+    slowest = profiler.slowest(1)[0]
+    assert slowest["stages_ms"]["extract"] >= 10
+    assert "test_profiling_stages" in profiler.collapsed_stacks()
+    print("✅ 阶段耗时写入环形缓冲区并可导出折叠栈")
+
+    with stage("noop"):
+        pass
+    assert Profiler(sample_rate=0).begin("/api/v1/markets") is None
+    print("✅ 未抽样的请求不产生剖析记录")
+
+
+def test_admin_access():
+    """测试管理接口权限：未配置令牌时只允许本机访问，配置后需要匹配的令牌"""
+    print("\n📋 测试: 管理接口权限")
+    from config import config as app_config
+    import profiling
+    from app import create_app
+
+    assert profiling.profiler.sample_rate == app_config.get("profiling_sample_rate")
+    saved_token, saved_rate = app_config.get("admin_token"), profiling.profiler.sample_rate
+    client = create_app().test_client()
+    remote = {"REMOTE_ADDR": "10.0.0.5"}
+    try:
+        app_config.set("admin_token", None)
+        response = client.put("/api/v1/admin/profiling", json={"sample_rate": 1.0}, environ_base=remote)
+        assert response.status_code == 403 and response.get_json()["error"]["code"] == "FORBIDDEN"
+        assert profiling.profiler.sample_rate == saved_rate
+        assert client.get("/api/v1/admin/profiling", environ_base=remote).status_code == 403
+        assert client.put("/api/v1/admin/profiling", json={"sample_rate": 0.5}).status_code == 200
+
+        app_config.set("admin_token", "secret")
+        assert client.put("/api/v1/admin/profiling", json={"sample_rate": 0.5}).status_code == 403
+        response = client.put("/api/v1/admin/profiling", json={"sample_rate": 0.25}, environ_base=remote,
+                              headers={"X-Admin-Token": "secret"})
+        assert response.status_code == 200 and profiling.profiler.sample_rate == 0.25
+    finally:
+        app_config.set("admin_token", saved_token)
+        profiling.profiler.configure(sample_rate=saved_rate)
+    print("✅ 未配置令牌时拒绝远程管理请求，配置令牌后按令牌校验")
+
+
+def test_stub_server_pagination():
+    """测试桩服务器分页和抓取器跟随游标获取全集"""
+    print("\n📋 测试: 桩服务器分页")
+    from benchmarks.corpus import generate_markets
+    from benchmarks.stub_server import StubClobServer
+    from polymarket_markets import PolymarketMarketFetcher
+    from rate_limit import TokenBucket, UpstreamScheduler
+
+    markets = generate_markets(250, seed=7)
+    assert generate_markets(250, seed=7)[-1]["condition_id"] == markets[-1]["condition_id"]
+
+    with StubClobServer(markets, page_size=100) as server:
+        fetcher = PolymarketMarketFetcher(
+            api_url=server.url,
+            scheduler=UpstreamScheduler(TokenBucket(rate=1000, capacity=100))
+        )
+        assert len(fetcher.get_markets()) == 250
+        assert server.request_counts["/markets"] == 3
+        assert len(fetcher.get_markets(limit=50, max_age=60)) == 50
+        assert server.request_counts["/markets"] == 3
+
+        # 快照过期后按数量截断的请求只返回给调用方，不替换完整快照、不通知快照回调
+        full = fetcher.snapshot
+        notified = []
+        fetcher.snapshot_listeners.append(lambda endpoint, snapshot: notified.append(snapshot))
+        assert len(fetcher.get_markets(limit=100, max_age=0)) == 100
+        assert server.request_counts["/markets"] == 4
+        assert fetcher.snapshot is full and len(fetcher.snapshot) == 250 and fetcher.snapshot.complete
+        assert not notified
+    print("✅ 按游标拉取全部分页，后续请求命中快照，截断的请求不替换完整快照")
+
+
+def test_snapshot_persistence():
+    """测试快照文件的保存、加载和CLI离线筛选"""
+    print("\n📋 测试: 本地快照")
+    import tempfile
+    from snapshot import MarketSnapshot
+    from polymarket_markets import PolymarketMarketFetcher
+    from main import select_markets
+
+    markets = [
+        {"question": "Will Bitcoin reach $100k?", "condition_id": "c1", "active": True},
+        {"question": "Will Bitcoin close above $90k?", "condition_id": "c2", "active": False},
+        {"question": "Will the Lakers win?", "condition_id": "c3", "active": True},
+        {"question": "Will Ethereum reach $5k?", "condition_id": "c4", "active": True},
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snapshots", "markets.json")
+        MarketSnapshot(markets, fetched_at=time.time() - 120, complete=False).save(path)
+        loaded = MarketSnapshot.load(path)
+
+    assert len(loaded) == 4 and not loaded.complete
+    assert 119 <= loaded.age < 130
+    print("✅ 快照保存后保留拉取时间和完整性标记")
+
+    fetcher = PolymarketMarketFetcher()
+    selected = select_markets(fetcher, loaded.markets, category="crypto", active_only=True, limit=1)
+    assert [m["condition_id"] for m in selected] == ["c1"]
+    selected = select_markets(fetcher, loaded.markets, category="crypto", active_only=True)
+    assert [m["condition_id"] for m in selected] == ["c1", "c4"]
+    print("✅ 离线模式先筛选后截取")
+
+
+def test_watch_incremental_refresh():
+    """测试监控模式只重新提取变化的市场并记录价格变动"""
+    print("\n📋 测试: 监控模式")
+    from polymarket_markets import PolymarketMarketFetcher
+    from watch import MarketWatcher
+
+    markets = [
+        {"question": f"Will Bitcoin reach ${i}k?", "condition_id": f"c{i}", "active": True,
+         "tokens": [{"outcome": "Yes", "price": 0.5}, {"outcome": "No", "price": 0.5}]}
+        for i in range(5)
+    ]
+
+    class StaticFetcher(PolymarketMarketFetcher):
+        def get_markets(self, limit=None, **kwargs):
+            return markets[:limit]
+
+    watcher = MarketWatcher(StaticFetcher(), limit=3)
+    assert watcher.refresh() and watcher.extracted_count == 3
+    assert not watcher.refresh() and watcher.extracted_count == 3
+    print("✅ 数据未变化时不重新提取也不重绘")
+
+    markets[1]["tokens"][0]["price"] = 0.62
+    assert watcher.refresh() and watcher.extracted_count == 4
+    assert abs(watcher.price_changes["c1"] - 0.12) < 1e-9
+    assert watcher.render().row_count == 3
+    print("✅ 只重新提取价格变化的市场并记录变动幅度")
+
+
+def test_streaming_table():
+    """测试流式表格的采样列宽、截断和逐行输出"""
+    print("\n📋 测试: 流式表格")
+    import io
+    from table_render import StreamingTable, MarketStats, display_width
+
+    out = io.StringIO()
+    table = StreamingTable(["序号", "标题", "状态"], widths=[4, None, None], max_widths=[None, 12, None],
+                           sample_size=2, out=out)
+    table.add_row([1, "Short", "活跃"])
+    assert out.getvalue() == ""
+    table.add_row([2, "A much longer market title", "已结算"])
+    assert "A much lo..." in out.getvalue()
+    table.add_row([3, "Streamed row", "活跃"])
+    assert "Streamed row" in out.getvalue()
+    table.close()
+
+    lines = out.getvalue().splitlines()
+    assert len({display_width(line) for line in lines}) == 1
+    print("✅ 采样后逐行输出，中英文混排列宽对齐")
+
+    stats = MarketStats()
+    stats.update([{"active": True, "category": "crypto"}, {"closed": True, "category": "crypto"}])
+    assert (stats.total, stats.active, stats.closed, stats.categories["crypto"]) == (2, 1, 1, 2)
+    print("✅ 统计信息单遍累计")
+
+
+def test_parallel_extraction():
+    """测试多进程提取与串行结果一致，进程池不可用时回退串行"""
+    print("\n📋 测试: 并行提取")
+    import polymarket_markets
+    from benchmarks.corpus import generate_markets
+    from polymarket_markets import PolymarketMarketFetcher
+
+    markets = generate_markets(3000, seed=11)
+    fetcher = PolymarketMarketFetcher()
+    fetcher.parallel_threshold = 0
+    serial = fetcher.extract_markets_info(markets, workers=1)
+    assert fetcher.extract_markets_info(markets, workers=2) == serial
+    print("✅ 分块并行提取后按原顺序合并")
+
+    def unavailable_pool(workers):
+        raise OSError("无法创建子进程")
+
+    original = polymarket_markets._get_extract_pool
+    polymarket_markets._get_extract_pool = unavailable_pool
+    try:
+        assert fetcher.extract_markets_info(markets, workers=2) == serial
+    finally:
+        polymarket_markets._get_extract_pool = original
+    print("✅ 进程池不可用时回退到串行提取")
+
+
+def test_price_enrichment():
+    """测试批量实时报价的分批、缓存和合并"""
+    print("\n📋 测试: 实时价格补充")
+    from benchmarks.corpus import generate_markets
+    from benchmarks.stub_server import StubClobServer
+    from polymarket_markets import PolymarketMarketFetcher
+    from rate_limit import TokenBucket, UpstreamScheduler
+
+    markets = generate_markets(300, seed=5)
+    with StubClobServer(markets) as server:
+        fetcher = PolymarketMarketFetcher(
+            api_url=server.url,
+            scheduler=UpstreamScheduler(TokenBucket(rate=1000, capacity=100))
+        )
+        fetcher.price_enricher.batch_size = 50
+        server.token_prices()
+        for market in markets:
+            for token in market["tokens"]:
+                server._token_prices[token["token_id"]] = 0.4242
+
+        markets_info = fetcher.extract_markets_info(markets)
+        enriched = fetcher.price_enricher.enrich(markets_info)
+        live_tokens = sum(m["total_tokens"] for m in markets_info if m["active"] and not m["closed"])
+        batches = (live_tokens + 49) // 50
+        assert server.request_counts["/midpoints"] == batches
+        assert server.request_counts["/prices"] == batches
+
+        for before, after in zip(markets_info, enriched):
+            if before["active"] and not before["closed"]:
+                assert after["price_source"] == "live" and after["current_price"] == 0.4242
+                assert after["spread"] == 0.02
+            else:
+                assert after["price_source"] == "listing"
+                assert after["current_price"] == before["current_price"]
+        print(f"✅ {live_tokens} 个代币分 {batches} 批获取，已结算市场保留列表价格")
+
+        fetcher.price_enricher.enrich(markets_info)
+        assert server.request_counts["/midpoints"] == batches
+        print("✅ TTL内重复请求命中代币缓存")
+
+
+def test_alert_engine():
+    """测试告警规则索引、基于刷新差异的评估和Webhook推送"""
+    print("\n📋 测试: 价格告警")
+    import json
+    import tempfile
+    import threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from alerts import AlertEngine
+
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def market(condition_id, price, closed=False, category="crypto"):
+        return {"condition_id": condition_id, "question": condition_id, "category": category,
+                "active": True, "closed": closed, "accepting_orders": True,
+                "tokens": [{"token_id": f"{condition_id}-yes", "price": price}]}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rules_path = os.path.join(tmp, "rules.json")
+        engine = AlertEngine(rules_path=rules_path,
+                             webhook_url=f"http://127.0.0.1:{server.server_address[1]}/alerts")
+        engine.add_rule({"id": "cross", "type": "price_cross", "token_id": "m1-yes", "level": 0.6, "direction": "above"})
+        engine.add_rule({"id": "move", "type": "price_move", "token_id": "m2-yes", "percent": 20, "window": 60})
+        engine.add_rule({"id": "status", "type": "status_change", "condition_id": "m3", "field": "closed"})
+        engine.add_rule({"id": "new", "type": "new_market", "category": "crypto"})
+        try:
+            engine.add_rule({"type": "price_cross", "token_id": "m1-yes"})
+            assert False, "缺少level的规则应被拒绝"
+        except ValueError:
+            pass
+
+        assert engine.evaluate([market("m1", 0.5), market("m2", 0.5), market("m3", 0.5)], now=0) == []
+        assert engine.evaluate([market("m1", 0.55), market("m2", 0.55), market("m3", 0.5)], now=10) == []
+        alerts = engine.evaluate([
+            market("m1", 0.65), market("m2", 0.65), market("m3", 0.5, closed=True),
+            market("m4", 0.5), market("m5", 0.5, category="sports")
+        ], now=20)
+        assert sorted(alert["rule_id"] for alert in alerts) == ["cross", "move", "new", "status"]
+        assert engine.changed_markets == 5
+        # 已触发的变动规则在回落到阈值以内之前不重复触发；未变化的市场不评估
+        assert engine.evaluate([market("m1", 0.65), market("m2", 0.66), market("m3", 0.5, closed=True),
+                                market("m4", 0.5), market("m5", 0.5, category="sports")], now=30) == []
+        assert engine.changed_markets == 1
+        print("✅ 只对变化的市场评估命中的规则")
+
+        assert [alert["id"] for alert in engine.alerts_since(2)] == [3, 4]
+        engine.dispatcher.join()
+        assert len(received) == 4 and engine.dispatcher.stats()["sent"] == 4
+        print("✅ 告警写入告警流并推送到Webhook")
+
+        reloaded = AlertEngine(rules_path=rules_path)
+        assert sorted(rule["id"] for rule in reloaded.list_rules()) == ["cross", "move", "new", "status"]
+        assert reloaded.remove_rule("cross") and not reloaded.remove_rule("cross")
+        print("✅ 规则保存在本地文件中")
+    server.shutdown()
+
+
+def test_event_index():
+    """测试负风险事件分组、事件级汇总和按快照缓存索引"""
+    print("\n📋 测试: 多结果事件")
+    from snapshot import MarketSnapshot
+    from polymarket_markets import PolymarketMarketFetcher
+
+    def outcome(condition_id, event_id, price, active=True):
+        return {"condition_id": condition_id, "question": f"Will {condition_id} win the election?",
+                "neg_risk": bool(event_id), "neg_risk_market_id": event_id, "active": active, "closed": False,
+                "tokens": [{"token_id": f"{condition_id}-yes", "outcome": "Yes", "price": price},
+                           {"token_id": f"{condition_id}-no", "outcome": "No", "price": round(1 - price, 4)}]}
+
+    markets = [outcome("a", "e1", 0.55), outcome("b", "e1", 0.3), outcome("c", "e1", 0.2),
+               outcome("d", "", 0.5), outcome("x", "e2", 0.4, active=False), outcome("y", "e2", 0.5, active=False)]
+    fetcher = PolymarketMarketFetcher()
+    fetcher.snapshots["markets"] = MarketSnapshot(markets)
+
+    index = fetcher.get_event_index(max_age=60)
+    assert [event["event_id"] for event in index.events] == ["e1", "e2"]
+    e1 = index.get("e1")
+    assert e1["market_count"] == 3 and e1["category"] == "politics" and e1["active"]
+    assert abs(e1["price_sum"] - 1.05) < 1e-9 and abs(e1["overround"] - 0.05) < 1e-9
+    assert e1["leading_outcome"]["condition_id"] == "a"
+    assert not index.get("e2")["active"]
+    assert fetcher.extract_market_info(markets[0])["event_id"] == "e1"
+    assert fetcher.extract_market_info(markets[3])["event_id"] is None
+    print("✅ 事件分组和汇总正确")
+
+    assert fetcher.get_event_index(max_age=60) is index
+    fetcher.snapshots["markets"] = MarketSnapshot(markets[:3])
+    assert len(fetcher.get_event_index(max_age=60)) == 1
+    print("✅ 同一份快照复用事件索引")
+
+
+def test_pricing_scanner():
+    """测试互补和负风险定价异常扫描及按幅度排序"""
+    print("\n📋 测试: 定价异常扫描")
+    from scanner import MarketScanner
+
+    def market(condition_id, prices, event_id="", active=True):
+        return {"condition_id": condition_id, "question": condition_id, "active": active, "closed": False,
+                "neg_risk": bool(event_id), "neg_risk_market_id": event_id,
+                "tokens": [{"token_id": f"{condition_id}-{i}", "outcome": outcome, "price": price}
+                           for i, (outcome, price) in enumerate(zip(("Yes", "No"), prices))]}
+
+    markets = [
+        market("fair", [0.6, 0.4]),
+        market("rich", [0.6, 0.45]),
+        market("cheap", [0.5, 0.45]),
+        market("stale", [0.9, 0.9], active=False),
+        market("a", [0.5, 0.5], event_id="e1"),
+        market("b", [0.4, 0.6], event_id="e1"),
+        market("c", [0.3, 0.7], event_id="e1"),
+    ]
+    scanner = MarketScanner(tolerance=0.02)
+    result = scanner.scan(markets)
+    anomalies = [(a["kind"], a["id"]) for a in result["anomalies"]]
+    assert anomalies == [("neg_risk", "e1"), ("complement", "rich"), ("complement", "cheap")]
+    top = result["anomalies"][0]
+    assert top["outcomes"] == 3 and abs(top["deviation"] - 0.2) < 1e-9 and top["direction"] == "over"
+    assert result["anomalies"][2]["direction"] == "under"
+    assert scanner.scan(markets) is result and scanner.scan_count == 1
+
+    # 负风险事件中有结果没有价格或已结算时，整个事件不参与比较（不能把缺失价格当作0）
+    unpriced = [market("x", [0.5, 0.5], event_id="e2"), market("y", [0.3, 0.7], event_id="e2"),
+                market("z", [None, None], event_id="e2")]
+    closed = [market("p", [0.6, 0.4], event_id="e3"), market("q", [0.3, 0.7], event_id="e3"),
+              dict(market("r", [0.9, 0.1], event_id="e3"), closed=True)]
+    result = MarketScanner(tolerance=0.02).scan(unpriced + closed)
+    assert result["anomalies"] == []
+    print("✅ 异常按偏离幅度排序，同一快照只扫描一次，缺价或已结算结果的事件被跳过")
+
+
+def test_trade_tape():
+    """测试成交记录增量拉取、滚动成交量窗口和订单簿流动性"""
+    print("\n📋 测试: 成交量与流动性")
+    from benchmarks.corpus import generate_markets
+    from benchmarks.stub_server import StubClobServer
+    from polymarket_markets import PolymarketMarketFetcher
+    from rate_limit import TokenBucket, UpstreamScheduler
+
+    markets = [m for m in generate_markets(200, seed=7) if m["active"] and not m["closed"]][:2]
+    # YES/NO 订单簿互为镜像：YES 0.29 买/0.31 卖 与 NO 0.71 卖/0.69 买是同一批挂单
+    for token, price in zip(markets[0]["tokens"], (0.3, 0.7)):
+        token["price"] = price
+    now = time.time()
+    with StubClobServer(markets) as server:
+        fetcher = PolymarketMarketFetcher(
+            api_url=server.url,
+            scheduler=UpstreamScheduler(TokenBucket(rate=1000, capacity=100))
+        )
+        traded = markets[0]["condition_id"]
+        server.add_trades(traded, [
+            {"id": "t1", "timestamp": str(int(now - 60)), "price": "0.5", "size": "10"},
+            {"id": "t2", "timestamp": str(int(now - 7200)), "price": "0.4", "size": "10"},
+            {"id": "t3", "timestamp": str(int(now - 3 * 86400)), "price": "0.2", "size": "50"},
+        ])
+
+        assert fetcher.trade_tape.ingest(markets) == 3
+        server.add_trades(traded, [{"id": "t4", "timestamp": str(int(now)), "price": "0.5", "size": "2"}])
+        assert fetcher.trade_tape.ingest(markets) == 1
+        assert server.request_counts[f"/live-activity/events/{traded}"] == 2
+        print("✅ 已处理过的成交不重复计入")
+
+        info = fetcher.extract_market_info(markets[0])
+        assert info["volume_1h"] == 6.0 and info["trades_1h"] == 2
+        assert info["volume_24h"] == info["volume"] == 10.0 and info["trades_24h"] == 3
+        assert info["volume_7d"] == 20.0 and info["trades_7d"] == 4
+        assert abs(info["liquidity"] - (0.29 + 0.31) * 100) < 0.01
+        quiet = fetcher.extract_market_info(markets[1])
+        assert quiet["volume"] == 0 and quiet["trades_7d"] == 0 and quiet["liquidity"] > 0
+        print("✅ 1h/24h/7d 成交量窗口和流动性填入市场信息，镜像订单簿只计一次")
+
+
+def test_tiered_refresh():
+    """测试市场分层、按层级间隔单独刷新和状态转换时刻的定时刷新"""
+    print("\n📋 测试: 分层刷新")
+    from datetime import timezone
+    from benchmarks.stub_server import StubClobServer
+    from polymarket_markets import PolymarketMarketFetcher
+    from rate_limit import TokenBucket, UpstreamScheduler
+    from tiering import TieredRefresher, assign_tier
+
+    def iso(ts):
+        return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+    def market(condition_id, price, closed=False, end=None, start=None):
+        return {"condition_id": condition_id, "question": condition_id, "active": True, "closed": closed,
+                "accepting_orders": not closed, "end_date_iso": iso(end) if end else None,
+                "game_start_time": iso(start) if start else None,
+                "tokens": [{"token_id": f"{condition_id}-yes", "price": price}]}
+
+    server = StubClobServer([]).start()
+    fetcher = PolymarketMarketFetcher(
+        api_url=server.url,
+        scheduler=UpstreamScheduler(TokenBucket(rate=1000, capacity=100))
+    )
+    assert fetcher.initialize_client()
+    now = time.time()
+    markets = [
+        market("live", 0.5, start=now - 600),
+        market("hot", 0.5, end=now + 7200),
+        market("warm", 0.5, end=now + 30 * 86400),
+        market("cold", 1.0, closed=True),
+        market("kickoff", 0.5, end=now + 30 * 86400, start=now + 0.5),
+    ]
+    assert [assign_tier(m, now) for m in markets] == ["live", "hot", "warm", "cold", "hot"]
+    assert assign_tier(markets[2], now, volatility=0.05) == "hot"
+    print("✅ 按状态、时间和波动分层")
+
+    server.markets = markets
+    try:
+        refresher = TieredRefresher(fetcher, intervals={"live": 0.2, "hot": 60, "warm": 0, "cold": 0})
+        fetcher.snapshot_listeners.append(refresher.on_snapshot)
+        fetcher.refresh_snapshot()
+        refresher.start()
+        try:
+            server.markets[0]["tokens"][0]["price"] = 0.7
+            deadline = time.time() + 5
+            while time.time() < deadline and not (
+                    fetcher.snapshot.markets[0]["tokens"][0]["price"] == 0.7 and refresher.transition_refreshes):
+                time.sleep(0.05)
+        finally:
+            refresher.stop(timeout=2)
+
+        assert fetcher.snapshot.markets[0]["tokens"][0]["price"] == 0.7
+        assert server.request_counts.get("/markets/live", 0) >= 2
+        assert "/markets/hot" not in server.request_counts and "/markets/cold" not in server.request_counts
+        # 开赛前按hot层（间隔60秒）不刷新，开赛时刻刷新一次后进入live层
+        assert server.request_counts.get("/markets/kickoff", 0) >= 1 and refresher.transition_refreshes == 1
+        tiers = refresher.stats()["tiers"]
+        assert tiers["live"]["markets"] == 2 and tiers["cold"]["markets"] == 1
+        assert tiers["live"]["max_staleness"] < 1
+    finally:
+        server.stop()
+    print("✅ 热层按间隔刷新，冷层不单独刷新，开赛时刻触发刷新并升入live层")
+
+
+def test_tiered_refresh_listeners():
+    """测试分层刷新的部分更新：告警按合并时刻记录价格，快照回调只处理被替换的市场"""
+    print("\n📋 测试: 分层刷新与快照回调")
+    from benchmarks.stub_server import StubClobServer
+    from alerts import AlertEngine
+    from polymarket_markets import PolymarketMarketFetcher
+    from rate_limit import TokenBucket, UpstreamScheduler
+    from replication import SnapshotPublisher
+    from scanner import MarketScanner
+    from tiering import TieredRefresher
+
+    markets = [{"condition_id": cid, "question": cid, "active": True, "closed": False,
+                "tokens": [{"token_id": f"{cid}-yes", "outcome": "Yes", "price": 0.5},
+                           {"token_id": f"{cid}-no", "outcome": "No", "price": 0.5}]}
+               for cid in ("m1", "m2", "m3")]
+    with StubClobServer(markets) as server:
+        fetcher = PolymarketMarketFetcher(
+            api_url=server.url,
+            scheduler=UpstreamScheduler(TokenBucket(rate=1000, capacity=100))
+        )
+        engine = AlertEngine()
+        engine.add_rule({"id": "move", "type": "price_move", "token_id": "m1-yes", "percent": 30, "window": 0.2})
+        publisher = SnapshotPublisher()
+        scanner = MarketScanner()
+        refresher = TieredRefresher(fetcher, intervals={"live": 0, "hot": 0, "warm": 0, "cold": 0})
+        fetcher.snapshot_listeners.extend([engine.on_snapshot, publisher.on_snapshot, scanner.on_snapshot,
+                                           refresher.on_snapshot])
+        fetcher.refresh_snapshot()
+        full_fetched_at = fetcher.snapshot.fetched_at
+        assert scanner.scan_count == 1
+
+        # 两批分层刷新：0.5 -> 0.4（-20%）后超过窗口再到 0.55，相对窗口起点的 0.4 变动 +37.5%
+        server.markets[0]["tokens"][0]["price"] = 0.4
+        assert refresher.refresh_markets({"m1": "tier"}) == 1
+        assert not engine.feed
+        time.sleep(0.3)
+        server.markets[0]["tokens"][0]["price"] = 0.55
+        refresher.refresh_markets({"m1": "tier"})
+        assert [(a["rule_id"], a["previous"], a["current"]) for a in engine.feed] == [("move", 0.4, 0.55)]
+        assert fetcher.snapshot.fetched_at == full_fetched_at < fetcher.snapshot.updated_at
+        assert engine.last_evaluated_at == fetcher.snapshot.updated_at
+        assert fetcher.snapshot.changes == {"m1": fetcher.snapshot.markets[0]}
+
+        # 部分更新只发布被替换的市场，扫描留到请求时，基线保留其余市场
+        changes = publisher.changes_since(1, publisher.epoch)
+        assert [[m["condition_id"] for m in d["upserts"]] for d in changes["deltas"]] == [["m1"], ["m1"]]
+        assert all(d["order"] is None for d in changes["deltas"])
+        assert scanner.scan_count == 1 and engine.changed_markets == 1 and len(engine._baseline) == 3
+    print("✅ 分层刷新按合并时刻评估price_move，快照回调只处理被替换的市场")
+
+
+def test_market_archive():
+    """测试已结算市场移入本地归档、按ID查找和跨内存/归档查询"""
+    print("\n📋 测试: 已结算市场归档")
+    import tempfile
+    from benchmarks.corpus import generate_markets
+    from benchmarks.stub_server import StubClobServer
+    from archive import MarketArchive, is_resolved
+    from polymarket_markets import PolymarketMarketFetcher
+    from rate_limit import TokenBucket, UpstreamScheduler
+
+    markets = generate_markets(300, seed=11)
+    resolved = [m for m in markets if is_resolved(m)]
+    assert resolved and len(resolved) < len(markets)
+
+    server = StubClobServer(markets, page_size=100).start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "archive.bin")
+            fetcher = PolymarketMarketFetcher(
+                api_url=server.url, archive_path=path,
+                scheduler=UpstreamScheduler(TokenBucket(rate=1000, capacity=100))
+            )
+            fetcher.refresh_snapshot()
+            # 首次刷新直接归档，内存中只保留未结算的市场
+            assert len(fetcher.snapshot) == len(markets) - len(resolved)
+            assert len(fetcher.archive) == len(resolved)
+            assert os.path.getsize(path) < len(json.dumps(resolved)) / 2
+            target = resolved[5]
+            assert fetcher.archive.get(target["condition_id"]) == target
+            assert fetcher.archive.get(target["question_id"]) == target
+            assert len(fetcher.get_markets(max_age=60)) == len(fetcher.snapshot)
+            combined = fetcher.get_markets(max_age=60, include_archived=True)
+            assert sorted(m["condition_id"] for m in combined) == sorted(m["condition_id"] for m in markets)
+            category = fetcher._extract_category(target)
+            assert fetcher.archive.ids(category) == [
+                m["condition_id"] for m in resolved if fetcher._extract_category(m) == category
+            ]
+            # 分页查询复用缓存的ID列表，追加记录后重新构建
+            assert fetcher.archive.ids(category.upper()) is fetcher.archive.ids(category)
+            all_ids = fetcher.archive.ids()
+            assert all_ids is fetcher.archive.ids() and len(all_ids) == len(resolved)
+            print("✅ 已结算市场移出内存，可按 condition_id/question_id 读取，查询可跨归档")
+
+            # 新结算的市场在快照中多保留一个周期，下次刷新再归档
+            newly = next(m for m in server.markets[150:] if not m["closed"])
+            newly["closed"] = True
+            newly["tokens"][0]["winner"] = True
+            server._page_cache.clear()  # 桩服务器缓存了分页响应
+            fetcher.refresh_snapshot()
+            assert newly["condition_id"] not in fetcher.archive
+            assert any(m["condition_id"] == newly["condition_id"] for m in fetcher.snapshot.markets)
+            # 不包含该市场的截断请求不影响待归档的市场
+            assert len(fetcher.get_markets(limit=10, max_age=0)) == 10
+            fetcher.refresh_snapshot()
+            assert newly["condition_id"] in fetcher.archive
+            assert fetcher.archive.ids()[-1] == newly["condition_id"] and len(all_ids) == len(resolved)
+            assert all(m["condition_id"] != newly["condition_id"] for m in fetcher.snapshot.markets)
+            print("✅ 新结算的市场保留一个刷新周期后归档")
+
+            # 重启后从记录头重建索引，末尾不完整的记录被截掉
+            size = os.path.getsize(path)
+            with open(path, "ab") as f:
+                f.write(b"\x00\x10\x00\x00")
+            reloaded = MarketArchive(path)
+            assert len(reloaded) == len(resolved) + 1 and os.path.getsize(path) == size
+            assert reloaded.get(target["condition_id"]) == target
+            print("✅ 重新加载归档索引并截掉不完整的记录")
+    finally:
+        server.stop()
+
+
+def test_string_interning():
+    """测试重复字符串驻留和按字典编码的等值筛选"""
+    print("\n📋 测试: 字符串驻留与字典编码")
+    from benchmarks.corpus import generate_markets
+    from interning import MarketColumns, intern_markets
+    from polymarket_markets import PolymarketMarketFetcher
+
+    markets = json.loads(json.dumps(generate_markets(500, seed=5)))
+    assert markets[0]["tokens"][0]["outcome"] is not markets[1]["tokens"][0]["outcome"]
+    intern_markets(markets)
+    assert markets[0]["tokens"][0]["outcome"] is markets[1]["tokens"][0]["outcome"]
+    tagged = [m for m in markets if "Sports" in m["tags"]]
+    assert tagged[0]["tags"][tagged[0]["tags"].index("Sports")] is tagged[1]["tags"][tagged[1]["tags"].index("Sports")]
+    print("✅ 标签、结果名称等重复字符串只保留一份")
+
+    fetcher = PolymarketMarketFetcher()
+    columns = MarketColumns(markets, category_of=fetcher._extract_category)
+    markets_info = fetcher.extract_markets_info(markets, workers=1)
+    for category in ("crypto", "SPORTS", "unknown"):
+        for active_only in (False, True):
+            expected = [i for i, m in enumerate(markets_info)
+                        if m["category"].lower() == category.lower()
+                        and (not active_only or (m["active"] and not m["closed"]))]
+            assert columns.select(category=category, active_only=active_only).tolist() == expected
+    assert columns.select(tag="Sports").tolist() == [i for i, m in enumerate(markets) if "Sports" in m["tags"]]
+    assert columns.select(status="已结算").tolist() == [i for i, m in enumerate(markets) if m["closed"]]
+    assert len(columns.outcomes) < 50 and len(columns.statuses) == 3
+    print("✅ 按分类、状态和标签的编码筛选与逐个比较结果一致")
+
+
+def test_market_facets():
+    """测试分面位图计数与逐个筛选结果一致"""
+    print("\n📋 测试: 分面计数")
+    import numpy as np
+    from benchmarks.corpus import generate_markets
+    from facets import FacetIndex, END_DATE_VALUES, STATUS_VALUES
+    from interning import MarketColumns
+    from polymarket_markets import PolymarketMarketFetcher
+
+    fetcher = PolymarketMarketFetcher()
+    markets = generate_markets(800, seed=9)
+    index = FacetIndex(MarketColumns(markets, category_of=fetcher._extract_category))
+    now = float(np.nanmedian(index.end_times))
+    end_codes = index.end_date_codes(now)
+
+    def values_of(i, market):
+        status = STATUS_VALUES[2 if market["closed"] else 0 if market["active"] else 1]
+        return {"category": {fetcher._extract_category(market)}, "tag": set(market["tags"]),
+                "status": {status}, "end_date": {END_DATE_VALUES[end_codes[i]]}}
+
+    rows = [values_of(i, m) for i, m in enumerate(markets)]
+    assert {END_DATE_VALUES[c] for c in end_codes} >= {"expired", "later"}
+
+    filters = {"tag": ["Sports", "NFL"], "end_date": ["later"]}
+    for active_only in (False, True):
+        result = index.facets(filters, active_only=active_only, now=now)
+
+        def matches(row, exclude=None):
+            if active_only and row["status"] != {"active"}:
+                return False
+            return all(row[d] & set(v) for d, v in filters.items() if d != exclude)
+
+        assert result["total"] == sum(matches(row) for row in rows)
+        for dimension, entries in result["facets"].items():
+            for entry in entries:
+                expected = sum(1 for row in rows if matches(row, dimension) and entry["value"] in row[dimension])
+                assert entry["count"] == expected, (dimension, entry)
+    assert [e["value"] for e in result["facets"]["end_date"]] == list(END_DATE_VALUES)
+    print("✅ 各分面计数应用其他分面的条件，与逐个筛选结果一致")
+
+
+def test_expiry_calendar():
+    """测试到期日历的二分查找结果与逐个比较一致"""
+    print("\n📋 测试: 到期日历")
+    from datetime import timezone
+    from benchmarks.corpus import generate_markets
+    from expiry import ExpiryCalendar, parse_duration
+
+    now = 1_800_000_000.0
+    markets = generate_markets(600, seed=13)
+    for i, market in enumerate(markets):
+        market["end_date_iso"] = datetime.fromtimestamp(now + (i * 37 % 500 - 100) * 600, timezone.utc).isoformat()
+        market["game_start_time"] = None if i % 3 else \
+            datetime.fromtimestamp(now + (i % 50) * 1800, timezone.utc).isoformat()
+    calendar = ExpiryCalendar(markets)
+
+    for field, key in (("end", "end_date_iso"), ("start", "game_start_time")):
+        within = parse_duration("6h")
+        rows = calendar.window(field, within, now)
+        expected = [i for i, m in enumerate(markets) if not m["closed"] and m[key]
+                    and now <= datetime.fromisoformat(m[key]).timestamp() <= now + within]
+        assert sorted(rows.tolist()) == expected and rows.size
+        times = calendar.times[field][rows]
+        assert (times[:-1] <= times[1:]).all()
+        histogram = calendar.histogram(field, within, parse_duration("1h"), now)
+        assert len(histogram) == 6 and sum(entry["count"] for entry in histogram) == len(rows)
+
+    for bad in ("", "abc", "0", "-1h", "3y", "400w", "9" * 400 + "w"):
+        try:
+            parse_duration(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"应拒绝时长: {bad!r}")
+    assert parse_duration("90") == 90 and parse_duration("2d") == 172800
+
+    # 超大时间窗口在访问获取器之前返回400，而不是在计算中溢出为500
+    import api.routes as routes
+    from app import create_app
+    reset_api_services()
+    try:
+        client = create_app().test_client()
+        for path in ("/api/v1/markets/expiring?within=999999999999w", "/api/v1/markets/starting?within=400w"):
+            response = client.get(path)
+            assert response.status_code == 400 and response.get_json()["error"]["code"] == "INVALID_DURATION"
+        assert routes.market_fetcher is None
+    finally:
+        reset_api_services()
+    print("✅ 时间窗口与直方图和逐个比较结果一致，已结算市场不计入，超长时长返回400")
+
+
+def test_wire_formats():
+    """测试响应格式协商以及按列组装的市场与逐个提取的结果一致"""
+    print("\n📋 测试: 二进制响应格式")
+    import numpy as np
+    from werkzeug.datastructures import MIMEAccept
+    from benchmarks.corpus import generate_markets
+    import wire_formats
+    from polymarket_markets import PolymarketMarketFetcher
+
+    assert wire_formats.negotiate(MIMEAccept([("*/*", 1)])) == "json"
+    assert wire_formats.negotiate(MIMEAccept([("application/x-msgpack", 1)])) == "msgpack"
+    assert wire_formats.negotiate(MIMEAccept([("application/json", 0.5),
+                                              ("application/vnd.apache.arrow.stream", 1)])) == "arrow"
+    assert wire_formats.negotiate(MIMEAccept([("application/msgpack", 1)]), "JSON") == "json"
+    try:
+        wire_formats.negotiate(MIMEAccept([]), "xml")
+        raise AssertionError("应拒绝未知格式")
+    except ValueError:
+        pass
+
+    fetcher = PolymarketMarketFetcher()
+    markets = generate_markets(400, seed=17)
+    rows = np.arange(0, 400, 3)
+    archived = [m for m in generate_markets(50, seed=18) if m["closed"]][:5]
+    frame = wire_formats.market_frame(fetcher, markets, rows, archived)
+    expected = fetcher.extract_markets_info([markets[i] for i in rows] + archived)
+    assert wire_formats.frame_length(frame) == len(expected)
+    codes, values = frame["category"]
+    assert [values[c] for c in codes] == [m["category"] for m in expected]
+    assert sorted(set(codes.tolist())) == list(range(len(values)))
+    assert frame["market_id"] == [m["market_id"] for m in expected]
+    assert np.allclose(frame["current_price"], [m["current_price"] for m in expected])
+    assert frame["closed"].tolist() == [m["closed"] for m in expected]
+
+    envelope = {"success": True, "data": {"pagination": {"total": len(expected)}}}
+    if wire_formats.missing_dependency("msgpack") is None:
+        import msgpack
+        decoded = msgpack.unpackb(wire_formats.encode("msgpack", frame, envelope))
+        assert decoded["data"]["pagination"]["total"] == len(expected)
+        assert decoded["data"]["columns"]["title"] == [m["title"] for m in expected]
+    if wire_formats.missing_dependency("arrow") is None:
+        import pyarrow as pa
+        table = pa.ipc.open_stream(wire_formats.encode("arrow", frame, envelope)).read_all()
+        assert table.column("category").to_pylist() == [m["category"] for m in expected]
+        assert json.loads(table.schema.metadata[b"response"])["data"]["pagination"]["total"] == len(expected)
+    print("✅ 格式协商正确，按列组装的市场与逐个提取的结果一致")
+
+
+def test_api_client():
+    """测试API客户端的ETag缓存、自动翻页和错误处理"""
+    print("\n📋 测试: API客户端")
+    import asyncio
+    import threading
+    from werkzeug.serving import make_server
+    from benchmarks.corpus import generate_markets
+    from benchmarks.stub_server import StubClobServer
+    from config import config as app_config
+    from api_client import AsyncPolymarketClient, PolymarketAPIError, PolymarketClient
+    from app import create_app
+
+    keys = ("clob_api_url", "snapshot_refresh_interval", "snapshot_max_age", "trade_ingest_interval")
+    saved = {key: app_config.get(key) for key in keys}
+    markets = generate_markets(230, seed=21)
+    with StubClobServer(markets) as upstream:
+        for key, value in zip(keys, (upstream.url, 0, 3600, 0)):
+            app_config.set(key, value)
+        reset_api_services()
+        server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}/api/v1"
+        try:
+            with PolymarketClient(base_url) as client:
+                first = client.get_market_stats()
+                assert client.get_market_stats() is first
+                assert client.cache.hits == 1 and client.cache.misses == 1
+
+                titles = [m["title"] for m in client.iter_markets(page_size=100, live_prices=False)]
+                assert len(titles) == len(markets) and client.cache.misses == 4
+                assert len(list(client.iter_markets(page_size=100, live_prices=False))) == len(markets)
+                assert client.cache.misses == 4
+
+                try:
+                    client.get_markets(limit=5000)
+                    raise AssertionError("超出范围的limit应返回错误")
+                except PolymarketAPIError as e:
+                    assert e.status == 400 and e.code == "INVALID_LIMIT"
+
+            async def run_async():
+                async with AsyncPolymarketClient(base_url) as client:
+                    active = [m async for m in client.iter_markets(page_size=50, active_only=True,
+                                                                   live_prices=False)]
+                    health = await client.health_check()
+                    return active, health
+
+            active, health = asyncio.run(run_async())
+            assert health["success"] and active and all(m["active"] and not m["closed"] for m in active)
+        finally:
+            server.shutdown()
+            reset_api_services()
+            for key, value in saved.items():
+                app_config.set(key, value)
+    print("✅ 未变化的响应由304复用本地缓存，自动翻页返回全部市场")
+
+
+def test_snapshot_replication():
+    """测试主节点发布快照差异、副本应用差异和落后过多时的完整同步"""
+    print("\n📋 测试: 快照复制")
+    import threading
+    from werkzeug.serving import make_server
+    from benchmarks.corpus import generate_markets
+    from benchmarks.stub_server import StubClobServer
+    from config import config as app_config
+    import api.routes as routes
+    from app import create_app
+    from polymarket_markets import PolymarketMarketFetcher
+    from replication import SnapshotReplica
+
+    keys = ("clob_api_url", "snapshot_refresh_interval", "trade_ingest_interval", "replication_role",
+            "replication_history", "replication_token", "replication_max_polls_per_client")
+    saved = {key: app_config.get(key) for key in keys}
+    markets = generate_markets(300, seed=23)
+    with StubClobServer(markets) as upstream:
+        for key, value in zip(keys, (upstream.url, 0, 0, "primary", 2, None, 1)):
+            app_config.set(key, value)
+        routes.market_fetcher = None
+        server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            primary = routes.get_market_fetcher()
+            primary.refresh_snapshot()
+            replica_fetcher = PolymarketMarketFetcher(api_url=upstream.url)
+            replica_fetcher.replica = True
+            replica = SnapshotReplica(replica_fetcher, f"http://127.0.0.1:{server.server_port}/api/v1",
+                                      replica_id="test")
+
+            def in_sync():
+                return replica_fetcher.snapshot.markets == primary.snapshot.markets
+
+            assert replica.poll_once() and replica.full_syncs == 1 and in_sync()
+
+            markets[3]["tokens"][0]["price"] = 0.4321
+            del markets[7]
+            markets.append(generate_markets(301, seed=24)[-1])
+            upstream._page_cache.clear()
+            primary.refresh_snapshot()
+            assert replica.poll_once() and replica.deltas_applied == 1 and replica.full_syncs == 1 and in_sync()
+
+            # 没有新版本时长轮询等待后返回空差异
+            started = time.time()
+            assert replica.poll_once(wait=0.3) and time.time() - started >= 0.25 and replica.deltas_applied == 1
+
+            # 落后的版本超出差异历史时改为完整同步
+            for price in (0.1, 0.2, 0.3):
+                markets[3]["tokens"][0]["price"] = price
+                upstream._page_cache.clear()
+                primary.refresh_snapshot()
+            assert replica.poll_once() and replica.full_syncs == 2 and in_sync()
+
+            requests_before = dict(upstream.request_counts)
+            assert replica_fetcher.get_markets(max_age=0) == primary.snapshot.markets
+            assert dict(upstream.request_counts) == requests_before
+            stats = replica.stats()
+            assert stats["versions_behind"] == 0 and stats["lag_seconds"] is not None
+            # 主节点记录的是副本最近一次轮询开始时的版本
+            assert routes.replication_stats()["replicas"]["test"]["version"] == 2
+
+            # 同一版本的完整快照复用压缩后的数据，时间戳和消息按请求生成；长轮询响应不计算ETag
+            changes_url = f"http://127.0.0.1:{server.server_port}/api/v1/replication/changes"
+            responses = [requests.get(changes_url, params={"since": since}) for since in (0, 1)]
+            assert all(r.headers.get("Content-Encoding") == "gzip" and "ETag" not in r.headers for r in responses)
+            bodies = [r.json() for r in responses]
+            assert [body["message"] for body in bodies] == ["快照版本 0 -> 5", "快照版本 1 -> 5"]
+            assert bodies[0]["data"] == bodies[1]["data"] and bodies[0]["data"]["full"]
+            assert bodies[0]["data"]["snapshot"]["markets"] == primary.snapshot.markets
+
+            # 复制接口需要权限：未配置令牌时只允许本机，配置后需要匹配的 X-Replication-Token
+            client = create_app().test_client()
+            response = client.get("/api/v1/replication/changes", environ_base={"REMOTE_ADDR": "10.0.0.5"})
+            assert response.status_code == 403 and response.get_json()["error"]["code"] == "FORBIDDEN"
+            app_config.set("replication_token", "s3cret")
+            assert requests.get(changes_url).status_code == 403
+            assert requests.get(changes_url, headers={"X-Replication-Token": "s3cret"}).status_code == 200
+            token_replica = SnapshotReplica(PolymarketMarketFetcher(api_url=upstream.url),
+                                            f"http://127.0.0.1:{server.server_port}/api/v1", token="s3cret")
+            assert token_replica.poll_once() and token_replica.full_syncs == 1
+            app_config.set("replication_token", None)
+
+            # 同一客户端的长轮询数超过上限时返回429，新版本发布后名额释放
+            params = {"since": routes.snapshot_publisher.version, "epoch": routes.snapshot_publisher.epoch, "wait": 5}
+            first = {}
+            poller = threading.Thread(target=lambda: first.update(response=requests.get(changes_url, params=params)))
+            poller.start()
+            deadline = time.time() + 2
+            while not routes.replication_polls and time.time() < deadline:
+                time.sleep(0.01)
+            response = requests.get(changes_url, params={**params, "wait": 1})
+            assert response.status_code == 429 and response.json()["error"]["code"] == "TOO_MANY_POLLS"
+            primary.refresh_snapshot()
+            poller.join(5)
+            assert first["response"].status_code == 200 and first["response"].json()["data"]["deltas"]
+            assert not routes.replication_polls
+
+            # 获取器初始化失败时返回标准错误结构
+            get_market_fetcher = routes.get_market_fetcher
+
+            def failing_fetcher():
+                raise RuntimeError("初始化失败")
+
+            routes.get_market_fetcher = failing_fetcher
+            try:
+                response = client.get("/api/v1/replication/changes")
+            finally:
+                routes.get_market_fetcher = get_market_fetcher
+            assert response.status_code == 500 and response.get_json()["error"]["code"] == "REPLICATION_FAILED"
+        finally:
+            server.shutdown()
+            routes.market_fetcher = None
+            routes.snapshot_publisher = None
+            routes.alert_engine = None
+            routes.trade_ingester = None
+            routes.tiered_refresher = None
+            for key, value in saved.items():
+                app_config.set(key, value)
+
+    # 副本节点不拉取成交记录（成交数据不复制）
+    saved = {key: app_config.get(key) for key in ("replication_role", "replication_primary_url")}
+    app_config.set("replication_role", "replica")
+    app_config.set("replication_primary_url", "http://127.0.0.1:9/api/v1")
+    routes.market_fetcher = None
+    try:
+        assert routes.get_market_fetcher().replica and routes.trade_ingester is None
+        # 就绪探针报告快照同步器的状态，而不是创建一个不会启动的刷新器
+        response = create_app().test_client().get("/api/v1/ready")
+        details = response.get_json()["error"]["details"]
+        assert response.status_code == 503 and "refresher" not in details
+        assert details["replication"]["role"] == "replica" and "lag_seconds" in details["replication"]
+        assert routes.snapshot_refresher is None
+    finally:
+        routes.snapshot_replica.stop()
+        routes.market_fetcher = None
+        routes.snapshot_replica = None
+        routes.alert_engine = None
+        routes.tiered_refresher = None
+        for key, value in saved.items():
+            app_config.set(key, value)
+    print("✅ 副本按版本应用差异，落后过多时完整同步，读取时不访问上游，也不拉取成交记录")
+
+
+def test_history_backfill():
+    """测试历史价格回填：有限并发、分块写入、中断后从检查点继续且不重复请求"""
+    print("\n📋 测试: 历史价格回填")
+    import shutil
+    import tempfile
+    import threading
+    import numpy as np
+    from backfill import HistoryBackfill, HistoryStore, market_token_ids
+    from benchmarks.corpus import generate_markets
+    from benchmarks.stub_server import StubClobServer
+    from polymarket_markets import PolymarketMarketFetcher
+    from rate_limit import TokenBucket, UpstreamScheduler
+
+    output = tempfile.mkdtemp()
+    try:
+        with StubClobServer(generate_markets(40, seed=31)) as server:
+            fetcher = PolymarketMarketFetcher(
+                api_url=server.url, scheduler=UpstreamScheduler(TokenBucket(rate=1000, capacity=100))
+            )
+            token_ids = market_token_ids(fetcher.get_markets())
+            assert len(token_ids) == 80
+            end_ts = server.history_end
+            start_ts = end_ts - 6 * 3600
+
+            # 第一次运行完成约一半代币后中断
+            stop = threading.Event()
+            backfill = HistoryBackfill(fetcher, output, concurrency=4, fidelity=30, start_ts=start_ts,
+                                       end_ts=end_ts, flush_rows=100)
+            summary = backfill.run(token_ids, progress=lambda p: p.done >= 40 and stop.set(),
+                                   report_interval=0.01, stop_event=stop)
+            assert summary["interrupted"] and 40 <= summary["committed_tokens"] < 80
+            assert summary["committed_tokens"] == summary["completed_tokens"]
+            assert summary["eta_seconds"] is not None and summary["tokens_per_second"] > 0
+            first_run = summary["committed_tokens"]
+            assert server.request_counts["/prices-history"] == first_run
+
+            # 写到一半的分块（进程在写入时退出）在恢复时丢弃；粒度参数沿用首次运行
+            with open(f"{output}/part-99999.npz.tmp", "wb") as f:
+                f.write(b"partial")
+            resumed = HistoryBackfill(fetcher, output, concurrency=4, fidelity=5, flush_rows=100)
+            assert resumed.resumed and resumed.manifest["fidelity"] == 30
+            summary = resumed.run(token_ids)
+            assert not summary["interrupted"] and summary["skipped_tokens"] == first_run
+            assert summary["completed_tokens"] == 80 - first_run and summary["remaining_tokens"] == 0
+            assert server.request_counts["/prices-history"] == 80
+
+            # 每个代币每30分钟一个点，没有重复行
+            data = HistoryStore(output).read()
+            assert set(data["token_id"].tolist()) == set(token_ids)
+            assert len(data["t"]) == 80 * 12
+            pairs = np.unique(np.stack([np.unique(data["token_id"], return_inverse=True)[1], data["t"]]), axis=1)
+            assert pairs.shape[1] == len(data["t"])
+            direct = resumed.fetch_history(token_ids[0])
+            rows = data["token_id"] == token_ids[0]
+            assert data["t"][rows].tolist() == [point["t"] for point in direct]
+            assert data["p"][rows].tolist() == [point["p"] for point in direct]
+
+            assert HistoryBackfill(fetcher, output).run(token_ids)["completed_tokens"] == 0
+            assert server.request_counts["/prices-history"] == 81
+    finally:
+        shutil.rmtree(output, ignore_errors=True)
+    print("✅ 回填中断后只请求未完成的代币，分块数据完整无重复")
+
+
+def test_health_and_readiness():
+    """测试存活探针不创建获取器、就绪探针按快照状态返回、深度检查按间隔限频"""
+    print("\n📋 测试: 存活和就绪探针")
+    from benchmarks.corpus import generate_markets
+    from benchmarks.stub_server import StubClobServer
+    from config import config as app_config
+    import api.routes as routes
+    from app import create_app
+
+    keys = ("clob_api_url", "snapshot_refresh_interval", "trade_ingest_interval", "deep_check_interval")
+    saved = {key: app_config.get(key) for key in keys}
+    with StubClobServer(generate_markets(20, seed=41)) as upstream:
+        for key, value in zip(keys, (upstream.url, 0, 0, 60)):
+            app_config.set(key, value)
+        reset_api_services()
+        client = create_app().test_client()
+        try:
+            response = client.get("/api/v1/health")
+            assert response.status_code == 200 and response.get_json()["data"]["status"] == "alive"
+            assert routes.market_fetcher is None and not upstream.request_counts
+
+            response = client.get("/api/v1/ready")
+            assert response.status_code == 503 and response.get_json()["error"]["code"] == "NOT_READY"
+            assert not upstream.request_counts
+
+            routes.market_fetcher.refresh_snapshot()
+            response = client.get("/api/v1/ready")
+            assert response.status_code == 200 and response.get_json()["data"]["snapshot"]["markets"] == 20
+
+            # 深度检查在 deep_check_interval 内只请求一次上游
+            for _ in range(3):
+                response = client.get("/api/v1/ready?deep=true")
+                assert response.status_code == 200 and response.get_json()["data"]["clob_api_connected"]
+            assert upstream.request_counts["/"] == 1
+            app_config.set("deep_check_interval", 0)
+            client.get("/api/v1/ready?deep=true")
+            assert upstream.request_counts["/"] == 2
+        finally:
+            reset_api_services()
+            for key, value in saved.items():
+                app_config.set(key, value)
+    print("✅ /health 不访问获取器，/ready 在有快照前返回503，深度检查按间隔限频")
+
+
 def main():
     """主测试函数"""
     print(f"🚀 Polymarket Web应用 Phase 1测试")
@@ -0,0 +1,304 @@
+"""
+分层刷新调度
+按市场状态、到期时间、比赛开始时间和近期价格波动把市场分为 live/hot/warm/cold 四层，
+热层高频、冷层低频地单独刷新；比赛开始和到期时刻通过定时器堆精确触发一次刷新。
+完整市场列表仍由快照刷新器定期拉取，本调度器在两次完整刷新之间保持热门市场新鲜
+"""
+
+import heapq
+import logging
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import config
+from rate_limit import PRIORITY_BACKGROUND
+
+
+logger = logging.getLogger(__name__)
+
+
+TIERS = ("live", "hot", "warm", "cold")
+
+# 各层单独刷新的间隔（秒），0表示该层只随完整列表刷新
+DEFAULT_TIER_INTERVALS = {"live": 5, "hot": 15, "warm": 120, "cold": 0}
+
+
+def _parse_time(value) -> Optional[float]:
+    """ISO时间字符串转Unix时间戳"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def _first_price(market: Dict) -> Optional[float]:
+    tokens = market.get("tokens") or ()
+    if not tokens:
+        return None
+    try:
+        return float(tokens[0].get("price"))
+    except (TypeError, ValueError):
+        return None
+
+
+def assign_tier(market: Dict, now: float, volatility: float = 0.0, volatility_threshold: float = 0.02) -> str:
+    """
+    计算市场的刷新层级
+
+    - cold: 已结算或未激活
+    - live: 比赛已开始，或1小时内到期
+    - hot: 接受订单且24小时内到期或1小时内开赛
+    - warm: 其余活跃市场
+    近期波动超过阈值的市场提升一层（cold 除外）。
+    """
+    if market.get("closed") or not market.get("active"):
+        return "cold"
+
+    end_at = _parse_time(market.get("end_date_iso"))
+    start_at = _parse_time(market.get("game_start_time"))
+    if (start_at is not None and start_at <= now) or (end_at is not None and now <= end_at <= now + 3600):
+        tier = "live"
+    elif market.get("accepting_orders") and (
+            (end_at is not None and now <= end_at <= now + 86400)
+            or (start_at is not None and start_at <= now + 3600)):
+        tier = "hot"
+    else:
+        tier = "warm"
+
+    if volatility >= volatility_threshold and tier != "live":
+        tier = TIERS[TIERS.index(tier) - 1]
+    return tier
+
+
+class TieredRefresher:
+    """
+    分层刷新调度器
+
+    定时器堆中的条目为 (到期时间, 序号, condition_id, 原因)，原因为 "tier"（按层级间隔的常规刷新）、
+    "game_start" 或 "end_date"（状态转换时刻的一次性刷新）。市场重新分层后旧的常规条目失效，
+    出堆时按 _due 判断并跳过。刷新结果合并为新的快照版本，快照更新回调（告警、扫描）随之执行。
+    """
+
+    def __init__(self, fetcher, intervals: Dict[str, float] = None, batch_size: int = None,
+                 concurrency: int = None, volatility_threshold: float = None):
+        """
+        Args:
+            fetcher: PolymarketMarketFetcher实例
+            intervals: 各层刷新间隔（秒，0表示只随完整列表刷新）
+            batch_size: 每批最多刷新的市场数
+            concurrency: 同时进行的单市场请求数
+            volatility_threshold: 提升一层所需的价格波动（首个代币价格变化的指数移动平均）
+        """
+        self.fetcher = fetcher
+        self.intervals = dict(DEFAULT_TIER_INTERVALS)
+        self.intervals.update(config.get("tier_intervals") or {})
+        self.intervals.update(intervals or {})
+        self.batch_size = batch_size or config.get("tier_batch_size", 50)
+        self.concurrency = concurrency or config.get("tier_concurrency", 4)
+        self.volatility_threshold = (volatility_threshold if volatility_threshold is not None
+                                     else config.get("tier_volatility_threshold", 0.02))
+        self.refresh_count = 0
+        self.transition_refreshes = 0
+        self.failures = 0
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._tier: Dict[str, str] = {}
+        self._due: Dict[str, float] = {}
+        self._last_refreshed: Dict[str, float] = {}
+        self._volatility: Dict[str, float] = {}
+        self._last_price: Dict[str, float] = {}
+        self._snapshot_fetched_at = None
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动调度线程（重复调用无副作用）"""
+        with self._cond:
+            if self.running:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="tiered-refresher", daemon=True)
+            self._thread.start()
+            logger.info(f"分层刷新已启动，各层间隔: {self.intervals}")
+
+    def stop(self, timeout: float = None):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def on_snapshot(self, endpoint: str, snapshot):
+        """快照更新回调：完整列表刷新后重新分层（本调度器自己合并的快照保留原拉取时间，不会触发重建）"""
+        if endpoint == "markets" and snapshot.fetched_at != self._snapshot_fetched_at:
+            self.rebuild(snapshot)
+
+    def _observe(self, condition_id: str, market: Dict):
+        """更新价格波动的指数移动平均"""
+        price = _first_price(market)
+        if price is None:
+            return
+        previous = self._last_price.get(condition_id)
+        self._last_price[condition_id] = price
+        if previous is not None:
+            self._volatility[condition_id] = 0.7 * self._volatility.get(condition_id, 0.0) + 0.3 * abs(price - previous)
+
+    def _schedule(self, condition_id: str, market: Dict, last_refreshed: float, now: float) -> str:
+        """重新分层并压入下一次常规刷新（调用方持有锁）"""
+        tier = assign_tier(market, now, self._volatility.get(condition_id, 0.0), self.volatility_threshold)
+        self._tier[condition_id] = tier
+        self._last_refreshed[condition_id] = last_refreshed
+        interval = self.intervals.get(tier, 0)
+        if interval > 0:
+            due = max(last_refreshed + interval, now)
+            self._due[condition_id] = due
+            heapq.heappush(self._heap, (due, next(self._seq), condition_id, "tier"))
+        else:
+            self._due.pop(condition_id, None)
+        return tier
+
+    def rebuild(self, snapshot):
+        """按完整快照重新分层并重建定时器堆"""
+        now = time.time()
+        with self._cond:
+            self._snapshot_fetched_at = snapshot.fetched_at
+            self._heap = []
+            self._tier = {}
+            self._due = {}
+            seen = set()
+            for market in snapshot.markets:
+                condition_id = market.get("condition_id")
+                if not condition_id:
+                    continue
+                seen.add(condition_id)
+                self._observe(condition_id, market)
+                last = max(self._last_refreshed.get(condition_id, 0.0), snapshot.fetched_at)
+                self._schedule(condition_id, market, last, now)
+                if not market.get("closed"):
+                    for reason, field in (("game_start", "game_start_time"), ("end_date", "end_date_iso")):
+                        at = _parse_time(market.get(field))
+                        if at is not None and at > now:
+                            self._heap.append((at, next(self._seq), condition_id, reason))
+            heapq.heapify(self._heap)
+            for mapping in (self._last_refreshed, self._volatility, self._last_price):
+                for condition_id in [cid for cid in mapping if cid not in seen]:
+                    del mapping[condition_id]
+            self._cond.notify_all()
+
+    def _next_due(self) -> Dict[str, str]:
+        """等待并取出下一批到期的市场 {condition_id: 原因}"""
+        with self._cond:
+            while not self._stop_event.is_set():
+                now = time.time()
+                batch = {}
+                while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+                    due, _, condition_id, reason = heapq.heappop(self._heap)
+                    if reason == "tier" and self._due.get(condition_id) != due:
+                        continue
+                    if reason == "tier":
+                        del self._due[condition_id]
+                    if batch.get(condition_id) in (None, "tier"):
+                        batch[condition_id] = reason
+                if batch:
+                    return batch
+                self._cond.wait(self._heap[0][0] - now if self._heap else None)
+        return {}
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._next_due()
+            if batch:
+                self.refresh_markets(batch)
+
+    def _fetch_market(self, condition_id: str) -> Dict:
+        return self.fetcher._call_upstream("market", self.fetcher.client.get_market, condition_id,
+                                           priority=PRIORITY_BACKGROUND)
+
+    def refresh_markets(self, batch: Dict[str, str]) -> int:
+        """
+        单独刷新一批市场并合并到快照
+
+        Returns:
+            成功刷新的市场数
+        """
+        if not self.fetcher.client and not self.fetcher.initialize_client():
+            return 0
+
+        updates = {}
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batch)),
+                                thread_name_prefix="tier-refresh") as executor:
+            futures = {condition_id: executor.submit(self._fetch_market, condition_id) for condition_id in batch}
+            for condition_id, future in futures.items():
+                try:
+                    market = future.result()
+                except Exception as e:
+                    logger.warning(f"单独刷新市场失败 {condition_id}: {e}")
+                    continue
+                if isinstance(market, dict) and market.get("condition_id") == condition_id:
+                    updates[condition_id] = market
+
+        self.fetcher.replace_markets("markets", updates)
+
+        now = time.time()
+        with self._cond:
+            snapshot = self.fetcher.snapshots.get("markets")
+            for condition_id, reason in batch.items():
+                market = updates.get(condition_id)
+                if market is None:
+                    self.failures += 1
+                    # 失败的市场按原层级稍后重试，避免立即重新到期
+                    tier = self._tier.get(condition_id)
+                    interval = self.intervals.get(tier, 0) if tier else 0
+                    if interval > 0 and condition_id not in self._due:
+                        self._due[condition_id] = now + interval
+                        heapq.heappush(self._heap, (now + interval, next(self._seq), condition_id, "tier"))
+                    continue
+                self._observe(condition_id, market)
+                # 完整快照已在本批期间更新时，以完整快照为准
+                if snapshot is not None and snapshot.fetched_at != self._snapshot_fetched_at:
+                    continue
+                self._due.pop(condition_id, None)
+                self._schedule(condition_id, market, now, now)
+                self.refresh_count += 1
+                if reason != "tier":
+                    self.transition_refreshes += 1
+            self._cond.notify_all()
+        return len(updates)
+
+    def tier_stats(self, now: float = None) -> Dict[str, Dict]:
+        """各层的市场数和数据新鲜度（距离上次刷新的秒数）"""
+        now = now or time.time()
+        with self._cond:
+            staleness = {tier: [] for tier in TIERS}
+            for condition_id, tier in self._tier.items():
+                staleness[tier].append(now - self._last_refreshed.get(condition_id, now))
+        return {
+            tier: {
+                "markets": len(values),
+                "interval": self.intervals.get(tier, 0),
+                "max_staleness": round(max(values), 3) if values else None,
+                "mean_staleness": round(sum(values) / len(values), 3) if values else None
+            }
+            for tier, values in staleness.items()
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "running": self.running,
+            "scheduled": len(self._heap),
+            "refresh_count": self.refresh_count,
+            "transition_refreshes": self.transition_refreshes,
+            "failures": self.failures,
+            "tiers": self.tier_stats()
+        }
@@ -0,0 +1,364 @@
+"""
+成交记录与成交量
+市场列表不包含成交量和流动性；本模块增量拉取活跃市场的最近成交（按市场记录已处理的最后一笔成交，
+同一笔成交不会重复计入），在环形缓冲区中维护 1h/24h/7d 滚动成交额和成交笔数，
+并通过批量订单簿接口计算挂单流动性
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config import config
+from rate_limit import PRIORITY_BACKGROUND
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+# (名称, 窗口长度秒, 桶宽度秒)
+VOLUME_WINDOWS = (("1h", 3600, 60), ("24h", 86400, 900), ("7d", 604800, 3600))
+
+EMPTY_VOLUME_FIELDS = {
+    "volume": 0,
+    "liquidity": 0,
+    **{f"volume_{name}": 0 for name, _, _ in VOLUME_WINDOWS},
+    **{f"trades_{name}": 0 for name, _, _ in VOLUME_WINDOWS},
+}
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _trade_timestamp(value) -> Optional[float]:
+    """成交时间（秒级/毫秒级Unix时间戳或ISO字符串）"""
+    if value is None:
+        return None
+    try:
+        ts = float(value)
+        return ts / 1000 if ts > 1e12 else ts
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def _token_ids(market: Dict) -> List[str]:
+    """原始市场数据或提取后的市场信息中的代币ID"""
+    if market.get("token_ids") is not None:
+        return list(market["token_ids"])
+    return [token.get("token_id") for token in market.get("tokens") or () if token.get("token_id")]
+
+
+class RollingWindow:
+    """固定桶宽的环形缓冲区：每个桶记录所属时间段编号、成交额和笔数，过期的桶在复用时清零"""
+
+    def __init__(self, span: int, bucket: int):
+        self.bucket = bucket
+        self.size = span // bucket
+        self._epochs = [-1] * self.size
+        self._volume = [0.0] * self.size
+        self._count = [0] * self.size
+
+    def add(self, timestamp: float, volume: float):
+        epoch = int(timestamp // self.bucket)
+        i = epoch % self.size
+        if self._epochs[i] != epoch:
+            if self._epochs[i] > epoch:
+                # 比该槽位上已有的时间段更早，说明已超出窗口
+                return
+            self._epochs[i] = epoch
+            self._volume[i] = 0.0
+            self._count[i] = 0
+        self._volume[i] += volume
+        self._count[i] += 1
+
+    def totals(self, now: float) -> Tuple[float, int]:
+        """窗口内的 (成交额, 成交笔数)"""
+        current = int(now // self.bucket)
+        oldest = current - self.size
+        volume = 0.0
+        count = 0
+        for i, epoch in enumerate(self._epochs):
+            if oldest < epoch <= current:
+                volume += self._volume[i]
+                count += self._count[i]
+        return volume, count
+
+
+class MarketTape:
+    """单个市场的滚动窗口和增量游标"""
+
+    def __init__(self):
+        self.windows = {name: RollingWindow(span, bucket) for name, span, bucket in VOLUME_WINDOWS}
+        self.last_timestamp = None
+        # 与最后成交时间相同的成交ID（同一时间戳可能有多笔成交）
+        self.last_ids: Set[str] = set()
+
+    def record(self, trades: Iterable[Dict]) -> int:
+        """
+        计入尚未处理过的成交
+
+        Returns:
+            新计入的成交笔数
+        """
+        parsed = []
+        for trade in trades:
+            if trade.get("event_type", "trade") != "trade":
+                continue
+            timestamp = _trade_timestamp(trade.get("timestamp") or trade.get("match_time"))
+            if timestamp is None:
+                continue
+            trade_id = str(trade.get("id") or trade.get("transaction_hash") or
+                           f"{timestamp}:{trade.get('price')}:{trade.get('size')}")
+            parsed.append((timestamp, trade_id, _to_float(trade.get("price")) * _to_float(trade.get("size"))))
+
+        added = 0
+        for timestamp, trade_id, volume in sorted(parsed):
+            if self.last_timestamp is not None:
+                if timestamp < self.last_timestamp:
+                    continue
+                if timestamp == self.last_timestamp and trade_id in self.last_ids:
+                    continue
+            if timestamp != self.last_timestamp:
+                self.last_timestamp = timestamp
+                self.last_ids = set()
+            self.last_ids.add(trade_id)
+            for window in self.windows.values():
+                window.add(timestamp, volume)
+            added += 1
+        return added
+
+    def fields(self, now: float) -> Dict:
+        result = {}
+        for name, window in self.windows.items():
+            volume, count = window.totals(now)
+            result[f"volume_{name}"] = round(volume, 2)
+            result[f"trades_{name}"] = count
+        result["volume"] = result["volume_24h"]
+        return result
+
+
+class TradeTape:
+    """
+    成交记录汇总
+
+    ingest 按有限并发逐个市场拉取最近成交，并对这些市场的代币批量获取订单簿；
+    volume_fields 只读取内存，可以在提取市场信息时直接调用。
+    """
+
+    def __init__(self, fetcher, concurrency: int = None, book_batch_size: int = None):
+        """
+        Args:
+            fetcher: PolymarketMarketFetcher实例
+            concurrency: 同时拉取成交记录的市场数
+            book_batch_size: 每个批量订单簿请求的最大代币数
+        """
+        self.fetcher = fetcher
+        self.concurrency = concurrency or config.get("trade_concurrency", 4)
+        self.book_batch_size = book_batch_size or config.get("price_batch_size", 500)
+        self.markets: Dict[str, MarketTape] = {}
+        self.liquidity: Dict[str, float] = {}
+        self.ingested_trades = 0
+        self.last_ingest_at = None
+        self._lock = threading.Lock()
+
+    def _fetch_trades(self, condition_id: str, priority: int) -> List[Dict]:
+        client = self.fetcher.client
+        trades = self.fetcher._call_upstream("trades", client.get_market_trades_events, condition_id,
+                                             priority=priority)
+        if isinstance(trades, dict):
+            trades = trades.get("data") or []
+        return trades or []
+
+    def _fetch_liquidity(self, markets: List[Dict], priority: int) -> Dict[str, float]:
+        """
+        按代币批量获取订单簿，流动性为买卖双方挂单金额之和
+
+        二元市场两个代币的订单簿互为镜像（价格p的YES买单就是价格1-p的NO卖单），
+        每个市场只统计第一个代币的订单簿，否则同一笔挂单会被计入两次。
+        """
+        from py_clob_client.clob_types import BookParams
+
+        market_of = {}
+        for market in markets:
+            token_ids = _token_ids(market)
+            if token_ids:
+                market_of[token_ids[0]] = market.get("condition_id")
+        token_ids = list(market_of)
+        liquidity = {market.get("condition_id"): 0.0 for market in markets}
+        for start in range(0, len(token_ids), self.book_batch_size):
+            batch = [BookParams(token_id=token_id) for token_id in token_ids[start:start + self.book_batch_size]]
+            books = self.fetcher._call_upstream("books", self.fetcher.client.get_order_books, batch,
+                                                priority=priority) or []
+            for book in books:
+                condition_id = market_of.get(book.asset_id)
+                if condition_id is None:
+                    continue
+                liquidity[condition_id] += sum(
+                    _to_float(order.price) * _to_float(order.size) for order in (book.bids or []) + (book.asks or [])
+                )
+        return liquidity
+
+    def ingest(self, markets: List[Dict], priority: int = PRIORITY_BACKGROUND) -> int:
+        """
+        拉取一批市场的最近成交和订单簿（可以是原始市场数据或提取后的市场信息）
+
+        Returns:
+            新计入的成交笔数
+        """
+        markets = [market for market in markets if market.get("condition_id")]
+        if not markets:
+            return 0
+        if not self.fetcher.client and not self.fetcher.initialize_client():
+            return 0
+
+        added = 0
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(markets)),
+                                thread_name_prefix="trade-tape") as executor:
+            futures = {
+                market["condition_id"]: executor.submit(self._fetch_trades, market["condition_id"], priority)
+                for market in markets
+            }
+            for condition_id, future in futures.items():
+                try:
+                    trades = future.result()
+                except Exception as e:
+                    logger.warning(f"获取成交记录失败 {condition_id}: {e}")
+                    continue
+                with self._lock:
+                    tape = self.markets.get(condition_id)
+                    if tape is None:
+                        tape = self.markets[condition_id] = MarketTape()
+                    added += tape.record(trades)
+
+        try:
+            liquidity = self._fetch_liquidity(markets, priority)
+            with self._lock:
+                self.liquidity.update(liquidity)
+        except Exception as e:
+            logger.warning(f"批量获取订单簿失败，流动性保持上次结果: {e}")
+
+        self.ingested_trades += added
+        self.last_ingest_at = time.time()
+        metrics.TRADES_INGESTED.inc(amount=added)
+        return added
+
+    def volume_fields(self, condition_id: str, now: float = None) -> Dict:
+        """市场的成交量、成交笔数和流动性字段（没有数据时全部为0）"""
+        tape = self.markets.get(condition_id)
+        liquidity = self.liquidity.get(condition_id)
+        if tape is None and liquidity is None:
+            return dict(EMPTY_VOLUME_FIELDS)
+        fields = tape.fields(now or time.time()) if tape is not None else dict(EMPTY_VOLUME_FIELDS)
+        fields["liquidity"] = round(liquidity or 0.0, 2)
+        return fields
+
+    def apply(self, markets_info: Iterable[Dict]) -> List[Dict]:
+        """返回补充了成交量字段的新市场信息列表"""
+        now = time.time()
+        return [{**market, **self.volume_fields(market.get("condition_id"), now)} for market in markets_info]
+
+    def stats(self) -> Dict:
+        return {
+            "tracked_markets": len(self.markets),
+            "ingested_trades": self.ingested_trades,
+            "concurrency": self.concurrency,
+            "last_ingest_at": (
+                datetime.utcfromtimestamp(self.last_ingest_at).isoformat() if self.last_ingest_at else None
+            )
+        }
+
+
+class TradeIngester:
+    """
+    后台成交记录拉取
+
+    每个周期从当前快照中按轮转顺序选取最多 max_markets 个活跃市场拉取成交记录，
+    活跃市场很多时分多个周期轮完，单个周期的上游请求数保持有界。
+    """
+
+    def __init__(self, fetcher, interval: float = 60, max_markets: int = 200):
+        """
+        Args:
+            fetcher: PolymarketMarketFetcher实例（使用其 trade_tape 和当前快照）
+            interval: 拉取间隔（秒）
+            max_markets: 每个周期拉取的市场数上限
+        """
+        self.fetcher = fetcher
+        self.interval = interval
+        self.max_markets = max_markets
+        self.cycle_count = 0
+        self.last_error = None
+        self._offset = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动后台线程（重复调用无副作用）"""
+        with self._lock:
+            if self.running:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="trade-ingester", daemon=True)
+            self._thread.start()
+            logger.info(f"成交记录拉取已启动，间隔 {self.interval} 秒")
+
+    def stop(self, timeout: float = None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.ingest_once()
+            self._stop_event.wait(self.interval)
+
+    def next_batch(self) -> List[Dict]:
+        """从当前快照的活跃市场中轮转选取下一批"""
+        snapshot = self.fetcher.snapshot
+        if snapshot is None:
+            return []
+        active = [m for m in snapshot.markets if m.get("active") and not m.get("closed")]
+        if not active:
+            return []
+        start = self._offset % len(active)
+        batch = (active[start:] + active[:start])[:self.max_markets]
+        self._offset = start + len(batch)
+        return batch
+
+    def ingest_once(self) -> int:
+        try:
+            added = self.fetcher.trade_tape.ingest(self.next_batch())
+            self.cycle_count += 1
+            self.last_error = None
+            return added
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"成交记录拉取失败: {e}")
+            return 0
+
+    def stats(self) -> Dict:
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "max_markets": self.max_markets,
+            "cycle_count": self.cycle_count,
+            "last_error": self.last_error,
+            **self.fetcher.trade_tape.stats()
+        }
@@ -0,0 +1,202 @@
+"""
+CLI监控模式
+复用同一个市场获取器定期刷新，只重新提取数据发生变化的市场，
+使用 rich 实时表格原地重绘并高亮价格变动
+"""
+
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from polymarket_markets import market_status
+from snapshot import MarketSnapshot
+
+
+def _fingerprint(market: Dict) -> tuple:
+    """原始市场数据中会影响表格显示的字段（价格和状态）"""
+    tokens = market.get("tokens") or ()
+    return (
+        tuple((token.get("price"), token.get("winner")) for token in tokens),
+        market.get("active"),
+        market.get("closed"),
+        market.get("accepting_orders"),
+    )
+
+
+def _display_key(market_info: Dict) -> tuple:
+    """表格中显示的字段，用于判断行是否需要重绘"""
+    return (
+        market_info.get("current_price"), market_info.get("price_range"), market_info.get("category"),
+        market_info.get("active"), market_info.get("closed"), market_info.get("end_date_formatted")
+    )
+
+
+class MarketWatcher:
+    """
+    市场监控器
+
+    按 condition_id 缓存每个市场的提取结果和原始数据指纹，刷新时只重新提取指纹变化的市场，
+    并记录本轮刷新中价格发生变化的市场以便高亮显示。
+    """
+
+    def __init__(self, fetcher, limit: int = None, category: str = None, active_only: bool = False,
+                 snapshot_path: str = None, enricher=None):
+        """
+        Args:
+            fetcher: PolymarketMarketFetcher实例（在整个监控期间复用）
+            limit: 显示的市场数量（None表示全部）
+            category: 分类筛选
+            active_only: 只显示活跃市场
+            snapshot_path: 监控本地快照文件而不是访问上游（文件修改后才重新加载）
+            enricher: 为显示的市场补充实时价格的 PriceEnricher（None表示只用市场列表价格；监控本地快照时不使用）
+        """
+        self.fetcher = fetcher
+        self.limit = limit
+        self.category = category
+        self.active_only = active_only
+        self.snapshot_path = snapshot_path
+        self.enricher = enricher
+        self.order: List[str] = []
+        self.rows: Dict[str, Dict] = {}
+        self.display_rows: Dict[str, Dict] = {}
+        self.price_changes: Dict[str, float] = {}
+        self.refresh_count = 0
+        self.extracted_count = 0
+        self.last_updated = None
+        self.last_error = None
+        self._fingerprints: Dict[str, tuple] = {}
+        self._snapshot_mtime = None
+
+    def _load_markets(self) -> Optional[List[Dict]]:
+        """获取原始市场列表，本地快照未变化时返回None"""
+        if self.snapshot_path:
+            mtime = os.path.getmtime(self.snapshot_path)
+            if mtime == self._snapshot_mtime:
+                return None
+            self._snapshot_mtime = mtime
+            return MarketSnapshot.load(self.snapshot_path).markets
+        return self.fetcher.get_markets(self.limit, include_archived=not self.active_only)
+
+    def refresh(self) -> bool:
+        """
+        刷新一次
+
+        Returns:
+            表格内容是否发生变化
+        """
+        try:
+            markets = self._load_markets()
+        except Exception as e:
+            changed = self.last_error != str(e)
+            self.last_error = str(e)
+            return changed
+
+        self.refresh_count += 1
+        had_error = self.last_error is not None
+        self.last_error = None
+        if markets is None:
+            return had_error
+
+        order = []
+        seen = set()
+        for market in markets:
+            condition_id = market.get("condition_id")
+            seen.add(condition_id)
+            fingerprint = _fingerprint(market)
+            if self._fingerprints.get(condition_id) != fingerprint:
+                self.rows[condition_id] = self.fetcher.extract_market_info(market)
+                self.extracted_count += 1
+                self._fingerprints[condition_id] = fingerprint
+
+            market_info = self.rows[condition_id]
+            if self.active_only and not (market_info.get("active", False) and not market_info.get("closed", False)):
+                continue
+            if self.category and market_info.get("category", "").lower() != self.category.lower():
+                continue
+            order.append(condition_id)
+            if self.snapshot_path and self.limit and len(order) >= self.limit:
+                break
+
+        # 丢弃已不在上游列表中的市场缓存
+        for condition_id in [cid for cid in self.rows if cid not in seen]:
+            del self.rows[condition_id]
+            del self._fingerprints[condition_id]
+
+        display = [self.rows[condition_id] for condition_id in order]
+        if self.enricher is not None and display:
+            display = self.enricher.enrich(display)
+
+        price_changes = {}
+        rows_changed = False
+        for condition_id, market_info in zip(order, display):
+            previous = self.display_rows.get(condition_id)
+            if previous is None:
+                continue
+            if _display_key(market_info) != _display_key(previous):
+                rows_changed = True
+            if market_info["current_price"] != previous["current_price"]:
+                price_changes[condition_id] = market_info["current_price"] - previous["current_price"]
+
+        changed = had_error or rows_changed or order != self.order
+        self.order = order
+        self.display_rows = dict(zip(order, display))
+        self.price_changes = price_changes
+        if changed:
+            self.last_updated = datetime.now()
+        return changed
+
+    def render(self):
+        """生成 rich 表格（价格上涨绿色、下跌红色）"""
+        from rich.table import Table
+        from rich.text import Text
+
+        updated = self.last_updated.strftime("%Y-%m-%d %H:%M:%S") if self.last_updated else "-"
+        table = Table(
+            title=f"Polymarket 市场监控 (共 {len(self.order)} 个市场，更新时间: {updated})",
+            caption=(f"[red]刷新失败: {self.last_error}[/red]" if self.last_error
+                     else f"已刷新 {self.refresh_count} 次，本轮价格变动 {len(self.price_changes)} 个，Ctrl+C 退出"),
+            expand=False
+        )
+        for header in ("序号", "标题", "当前价格", "变动", "分类", "到期时间", "状态"):
+            table.add_column(header, no_wrap=True, overflow="ellipsis", max_width=60 if header == "标题" else None)
+
+        for i, condition_id in enumerate(self.order, 1):
+            market = self.display_rows[condition_id]
+            delta = self.price_changes.get(condition_id)
+            if delta is None:
+                change = Text("")
+                style = None
+            else:
+                style = "green" if delta > 0 else "red"
+                change = Text(f"{'▲' if delta > 0 else '▼'} {abs(delta):.4f}", style=style)
+            table.add_row(
+                str(i),
+                market["title"],
+                Text(f"${market['current_price']:.4f}", style=style or ""),
+                change,
+                market["category"],
+                market["end_date_formatted"],
+                market_status(market),
+                style="bold" if style else None
+            )
+        return table
+
+
+def run_watch(watcher: MarketWatcher, interval: float):
+    """
+    持续监控，直到 Ctrl+C
+
+    只有内容变化时才重绘，未变化的刷新不产生终端输出。
+    """
+    from rich.live import Live
+
+    watcher.refresh()
+    with Live(watcher.render(), auto_refresh=False) as live:
+        try:
+            while True:
+                time.sleep(interval)
+                if watcher.refresh():
+                    live.update(watcher.render(), refresh=True)
+        except KeyboardInterrupt:
+            pass
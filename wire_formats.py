@@ -0,0 +1,233 @@
+"""
+二进制响应格式
+机器客户端可以通过 Accept 头（或 format 查询参数）请求 MessagePack 或 Apache Arrow IPC 格式的市场列表。
+两种格式都按列组织：分类和状态直接取快照的字典编码列，其余字段逐列从原始市场数据中读取，
+不为每个市场生成提取后的字典；Arrow 的数值列由 NumPy 数组直接转换，pandas/pyarrow 客户端可零拷贝读取。
+msgpack 和 pyarrow 为可选依赖，未安装时对应格式不可用。
+"""
+
+import json
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from events import event_id_of
+from expiry import parse_timestamp
+from facets import STATUS_VALUES
+from interning import Dictionary
+
+
+# 格式名 -> MIME类型（JSON在前，Accept 为 */* 时优先JSON）
+MIMETYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+# 常见的别名MIME类型
+_MIMETYPE_ALIASES = {
+    "application/x-msgpack": "msgpack",
+    "application/vnd.msgpack": "msgpack",
+    "application/vnd.apache.arrow.file": "arrow",
+}
+
+# 格式依赖的可选模块
+_DEPENDENCIES = {"msgpack": "msgpack", "arrow": "pyarrow"}
+
+# 以Unix时间戳存储的时间列（Arrow中转换为UTC时间戳类型）
+TIME_COLUMNS = ("end_time", "game_start_time")
+
+
+def negotiate(accept, requested: str = None) -> str:
+    """
+    协商响应格式
+
+    Args:
+        accept: 请求的 Accept 头（werkzeug MIMEAccept）
+        requested: format 查询参数（优先于 Accept 头）
+
+    Returns:
+        "json"、"msgpack" 或 "arrow"
+
+    Raises:
+        ValueError: format 参数不是支持的格式
+    """
+    if requested:
+        requested = requested.lower()
+        if requested not in MIMETYPES:
+            raise ValueError(f"不支持的格式: {requested}（可选: {', '.join(MIMETYPES)}）")
+        return requested
+    candidates = list(MIMETYPES.values()) + list(_MIMETYPE_ALIASES)
+    best = accept.best_match(candidates, default=MIMETYPES["json"])
+    return _MIMETYPE_ALIASES.get(best) or next(name for name, mimetype in MIMETYPES.items() if mimetype == best)
+
+
+def missing_dependency(fmt: str) -> Optional[str]:
+    """格式依赖的模块未安装时返回模块名，否则返回None"""
+    module = _DEPENDENCIES.get(fmt)
+    if module is None:
+        return None
+    try:
+        __import__(module)
+    except ImportError:
+        return module
+    return None
+
+
+def _first_token_price(market: Dict) -> float:
+    tokens = market.get("tokens") or ()
+    if not tokens:
+        return 0.0
+    try:
+        return float(tokens[0].get("price") or 0)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def market_frame(fetcher, markets: List[Dict], rows: Iterable[int], extra: List[Dict] = (),
+                 quotes: Dict[str, Dict] = None) -> Dict:
+    """
+    按列组装一页市场
+
+    Args:
+        fetcher: 市场获取器（提供快照的字典编码列、到期日历和成交记录）
+        markets: 快照中的原始市场列表
+        rows: 当前页在 markets 中的下标
+        extra: 排在后面的其他原始市场（如从归档读取的已结算市场），分类和时间在此计算
+        quotes: 实时报价 {代币ID: 报价}，有报价的市场用中间价作为当前价格
+
+    Returns:
+        {列名: 列}，数值列为NumPy数组，文本列为字符串列表，
+        分类和状态为 (编码数组, 取值列表) 形式的字典编码列
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    columns = fetcher.market_columns(markets)
+    calendar = fetcher.expiry_calendar(markets)
+    page = [markets[i] for i in rows] + list(extra)
+
+    # 分类只保留当前页用到的取值，归档市场的分类追加编码
+    categories = Dictionary(columns.categories.values)
+    category_codes = np.concatenate([
+        columns.category_codes[rows],
+        np.fromiter((categories.encode(fetcher._extract_category(m)) for m in extra), dtype=np.int32, count=len(extra))
+    ])
+    used, category_codes = np.unique(category_codes, return_inverse=True)
+
+    # 状态编码与 STATUS_VALUES 一一对应，归档市场都已结算
+    status_codes = np.concatenate([columns.status_codes[rows], np.full(len(extra), 2, dtype=np.int8)])
+
+    def times_of(field: str, name: str) -> np.ndarray:
+        return np.concatenate([
+            calendar.times[name][rows],
+            np.fromiter((parse_timestamp(m.get(field)) for m in extra), dtype=float, count=len(extra))
+        ])
+
+    def flags(field: str) -> np.ndarray:
+        return np.fromiter((bool(m.get(field, False)) for m in page), dtype=bool, count=len(page))
+
+    def first_token(field: str) -> List[Optional[str]]:
+        return [(m.get("tokens") or [{}])[0].get(field) for m in page]
+
+    tape = fetcher.trade_tape
+    has_volume = bool(tape.markets or tape.liquidity)
+    volume_fields = [tape.volume_fields(m.get("condition_id")) if has_volume else None for m in page]
+
+    frame = {
+        "market_id": [m.get("question_id", m.get("condition_id")) for m in page],
+        "condition_id": [m.get("condition_id") for m in page],
+        "title": [m.get("question") or "未知标题" for m in page],
+        "category": (category_codes.astype(np.int32), [categories.values[code] for code in used]),
+        "status": (status_codes.astype(np.int32), list(STATUS_VALUES)),
+        "active": flags("active"),
+        "closed": flags("closed"),
+        "accepting_orders": flags("accepting_orders"),
+        "neg_risk": flags("neg_risk"),
+        "event_id": [event_id_of(m) for m in page],
+        "token_id": first_token("token_id"),
+        "outcome": first_token("outcome"),
+        "current_price": np.fromiter((_first_token_price(m) for m in page), dtype=float, count=len(page)),
+        "total_tokens": np.fromiter((len(m.get("tokens") or ()) for m in page), dtype=np.int32, count=len(page)),
+        "volume_24h": np.fromiter((f["volume_24h"] if f else 0 for f in volume_fields), dtype=float,
+                                  count=len(page)),
+        "liquidity": np.fromiter((f["liquidity"] if f else 0 for f in volume_fields), dtype=float,
+                                 count=len(page)),
+        "end_time": times_of("end_date_iso", "end"),
+        "game_start_time": times_of("game_start_time", "start"),
+    }
+
+    if quotes is not None:
+        page_quotes = [quotes.get(token_id) for token_id in frame["token_id"]]
+        live = np.fromiter((quote is not None for quote in page_quotes), dtype=bool, count=len(page))
+        frame["current_price"][live] = [quote["midpoint"] for quote in page_quotes if quote is not None]
+        frame["spread"] = np.array([quote["spread"] if quote and quote["spread"] is not None else np.nan
+                                    for quote in page_quotes], dtype=float)
+        frame["price_source"] = (live.astype(np.int32), ["listing", "live"])
+    return frame
+
+
+def frame_length(frame: Dict) -> int:
+    return len(frame["market_id"])
+
+
+def _plain_column(column):
+    """列转换为msgpack可直接序列化的值（NaN转为None）"""
+    if isinstance(column, tuple):
+        codes, values = column
+        return {"codes": codes.tolist(), "values": values}
+    if isinstance(column, np.ndarray):
+        if column.dtype.kind == "f":
+            return [None if value != value else value for value in column.tolist()]
+        return column.tolist()
+    return column
+
+
+def encode_msgpack(frame: Dict, envelope: Dict) -> bytes:
+    """
+    编码为 MessagePack：标准响应结构中 data.columns 为 {列名: 值列表}，
+    字典编码列为 {"codes": [...], "values": [...]}
+    """
+    import msgpack
+
+    payload = {**envelope, "data": {**envelope.get("data", {}),
+                                    "columns": {name: _plain_column(column) for name, column in frame.items()}}}
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def _arrow_column(name: str, column):
+    import pyarrow as pa
+
+    if isinstance(column, tuple):
+        codes, values = column
+        return pa.DictionaryArray.from_arrays(pa.array(codes, type=pa.int32()), pa.array(values, type=pa.string()))
+    if name in TIME_COLUMNS:
+        missing = np.isnan(column)
+        millis = np.where(missing, 0, column * 1000).astype(np.int64)
+        return pa.array(millis, type=pa.timestamp("ms", tz="UTC"), mask=missing)
+    if isinstance(column, np.ndarray):
+        return pa.array(column, from_pandas=True)
+    return pa.array(column, type=pa.string())
+
+
+def encode_arrow(frame: Dict, envelope: Dict) -> bytes:
+    """
+    编码为 Arrow IPC 流：一个记录批次，每列一个字段；
+    标准响应结构中除市场列表以外的部分以JSON存放在 schema 元数据的 "response" 键中
+    """
+    import pyarrow as pa
+
+    batch = pa.RecordBatch.from_arrays(
+        [_arrow_column(name, column) for name, column in frame.items()], names=list(frame)
+    )
+    schema = batch.schema.with_metadata({"response": json.dumps(envelope, ensure_ascii=False, default=str)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(batch.replace_schema_metadata(schema.metadata))
+    return sink.getvalue().to_pybytes()
+
+
+ENCODERS = {"msgpack": encode_msgpack, "arrow": encode_arrow}
+
+
+def encode(fmt: str, frame: Dict, envelope: Dict) -> bytes:
+    """按格式名编码一页市场"""
+    return ENCODERS[fmt](frame, envelope)